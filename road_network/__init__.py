@@ -1 +1,2 @@
-from .road_and_cars import BaseRoad, Line, LineWLight, Crossroad, Car, VoidGenerator
+from .road_and_cars import BaseRoad, Line, LineWLight, Crossroad, Car, VoidGenerator, Simulation, SignalPlan, \
+    LightScheduler
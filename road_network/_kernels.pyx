@@ -0,0 +1,138 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled car loops of Line, LineWLight and Crossroad, see road_network.kernels
+
+Every function moves the cars of one road in the given order exactly as the Python methods do,
+writing straight into the grids and the columns of CarStore. They return the changes of
+BaseRoad._n_cars and BaseRoad._changed (the bookkeeping of BaseRoad._put).
+"""
+
+cdef enum:
+    MAX_WAITING_TIME = 2  # road_and_cars.MAX_WAITING_TIME
+
+cdef long long DR[5]
+cdef long long DC[5]
+DR[:] = [0, -1, 0, 1, 0]
+DC[:] = [0, 0, -1, 0, 1]
+
+
+cdef inline int _is_empty(int[:, :] road, int[:, :] next_state, long long r, long long c) noexcept nogil:
+    """ BaseRoad.is_empty """
+    if 0 <= r < road.shape[0] and 0 <= c < road.shape[1]:
+        return road[r, c] == 0 and next_state[r, c] == 0
+    return -1
+
+
+cdef inline int _cross_is_empty(int[:, :] road, int[:, :] next_state, long long r, long long c) noexcept nogil:
+    """ Crossroad.is_empty """
+    cdef long long last_r = road.shape[0] - 1, last_c = road.shape[1] - 1
+    if r == 0 and (c == 0 or c == last_c):
+        return -1
+    elif c == 0 and (r == 0 or r == last_r):
+        return -1
+    elif c == last_c and r == last_r:
+        return -1
+    return _is_empty(road, next_state, r, c)
+
+
+cdef inline void _put(int[:, :] road, int[:, :] next_state, long long r, long long c, int state,
+                      long long *n_cars, long long *changed) noexcept nogil:
+    """ BaseRoad._put """
+    cdef int old = next_state[r, c], current = road[r, c]
+    n_cars[0] += (state != 0) - (old != 0)
+    changed[0] += (state != current) - (old != current)
+    next_state[r, c] = state
+
+
+cdef inline void _move(int[:, :] road, int[:, :] next_state, long long car, int free,
+                       long long[:, :] coords, signed char[:] speed_code, int[:] counter, long long[:] moves,
+                       long long *n_cars, long long *changed) noexcept nogil:
+    """ Car.move, free is is_empty of the target """
+    cdef long long r = coords[car, 0], c = coords[car, 1]
+    cdef long long tr = r + DR[speed_code[car]], tc = c + DC[speed_code[car]]
+    if free > 0:
+        _put(road, next_state, r, c, 0, n_cars, changed)
+        _put(road, next_state, tr, tc, <int>car, n_cars, changed)
+        coords[car, 0] = tr
+        coords[car, 1] = tc
+        counter[car] = 0
+        moves[car] += 1
+    else:
+        counter[car] += 1
+
+
+def move_line(int[:, :] road, int[:, :] next_state, long long[:] ids,
+              long long[:, :] coords, signed char[:] speed_code, int[:] counter, long long[:] moves,
+              long long stop=-1):
+    """
+    Line.move_cars, LineWLight.move_cars when stop is the column of a red light
+    :return: changes of the number of cars and of changed cells
+    """
+    cdef long long n_cars = 0, changed = 0, car, r, c, end = road.shape[1] - 1
+    cdef Py_ssize_t i
+    with nogil:
+        for i in range(ids.shape[0]):
+            car = ids[i]
+            if car == 0:
+                continue
+            r = coords[car, 0]
+            c = coords[car, 1]
+            if r == 0 and (c == end or c == stop):
+                continue
+            _move(road, next_state, car,
+                  _is_empty(road, next_state, r + DR[speed_code[car]], c + DC[speed_code[car]]),
+                  coords, speed_code, counter, moves, &n_cars, &changed)
+    return n_cars, changed
+
+
+def move_crossroad(int[:, :] road, int[:, :] next_state, long long[:] ids, long long[:] destinations,
+                   long long[:, :] coords, signed char[:] speed_code, int[:] counter, long long[:] moves,
+                   unsigned char[:] rotate, unsigned char[:, :] exit_table, signed char[:, :, :] turn_table,
+                   signed char[:, :] rotary_table, signed char[:, :, :] stuck_table, bint rotary, double[:] coins):
+    """
+    Crossroad.move_cars with the tables of Crossroad._build_turn_tables
+    :param destinations: next point on the route of every car (-1 if none)
+    :param rotary: the rotary rule 2 applies (rotary_2 and a 4x4 grid)
+    :param coins: next numbers of the "rotary" stream, at least one per car when rotary
+    :return: changes of the number of cars and of changed cells, number of coins used
+    """
+    cdef long long n_cars = 0, changed = 0, used = 0, car, r, c, sc, cell, dest, option
+    cdef long long cols = road.shape[1], n = turn_table.shape[2]
+    cdef Py_ssize_t i, k
+    with nogil:
+        for i in range(ids.shape[0]):
+            car = ids[i]
+            if car == 0:
+                continue
+            sc = speed_code[car]
+            if exit_table[coords[car, 0] * cols + coords[car, 1], sc]:
+                continue
+
+            r = coords[car, 0]
+            c = coords[car, 1]
+            _move(road, next_state, car, _cross_is_empty(road, next_state, r + DR[sc], c + DC[sc]),
+                  coords, speed_code, counter, moves, &n_cars, &changed)
+            r = coords[car, 0]
+            c = coords[car, 1]
+            if r == 0 or c == 0:
+                continue
+
+            cell = r * cols + c
+            if rotary:
+                used += 1
+                if coins[used - 1] < .5:
+                    speed_code[car] = rotary_table[cell, sc]
+
+            elif rotate[car] and counter[car] > MAX_WAITING_TIME:
+                for k in range(2):
+                    option = stuck_table[cell, sc, k]
+                    if option and _cross_is_empty(road, next_state, r + DR[option], c + DC[option]):
+                        speed_code[car] = option
+                        break
+                counter[car] = 0
+
+            else:
+                dest = destinations[i]
+                if 0 <= dest < n:
+                    speed_code[car] = turn_table[cell, sc, dest]
+    return n_cars, changed, used
@@ -0,0 +1,257 @@
+"""
+Benchmarks of the frame loop on every backend
+
+    python -m road_network.benchmark --label baseline
+    python -m road_network.benchmark --label mine --compare data/benchmarks/baseline.json
+    python -m road_network.benchmark city --backends compiled vectorized --densities 0.3 --frames 500
+
+Benchmarks are a single Line, CrossroadAndLines, CrossroadAndLines2x2 and CrossroadAndLines4x4 with open ends
+fed by a VoidGenerator, and the city of "Traffic flow modelling" (CrossroadAndLines4x4x4) started from
+initials/cars_init_<density>.json. Backends are "python" and "compiled" (see kernels) and "vectorized"
+(VectorizedEngine). Every point reports frames/s, car steps/s (cars on the roads summed over the frames per second)
+and the peak of memory traced by tracemalloc while the network is built and run (in one more run, its time is kept
+as traced_run_s). Points the vectorized backend can't run (VectorizedEngine.unsupported, e.g. the dense city
+states) are kept as records with the reason in "skipped".
+Results are saved as data/benchmarks/<label>.json after every point, --compare prints the ratios to an older file.
+"""
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Dict, List
+import numpy as np
+
+from . import kernels
+from .road_and_cars import Line, VoidGenerator, Simulation
+from .prebuild_set import CrossroadAndLines, CrossroadAndLines2x2, CrossroadAndLines4x4, CrossroadAndLines4x4x4
+from .initials import load_cars, generate_cars
+from .vectorized import VectorizedEngine
+
+RED = 20
+GREEN = 10
+LENGTH = 10
+P_NEW = .3  # chance of a new car on every open input of the small networks per frame
+
+BENCHMARKS = ["line", "crossroad", "2x2", "4x4", "city"]
+BACKENDS = ["python", "compiled", "vectorized"]
+DENSITIES = [0.1, 0.3, 0.6]
+
+
+def _open_ends(simulation: Simulation, p_new: float = P_NEW):
+    """
+    Connect lines without outputs to a new VoidGenerator and the void to lines without inputs
+    """
+    roads = [road for road in simulation.roads if isinstance(road, Line)]
+    void = VoidGenerator(p_new, name="Void", simulation=simulation)
+    n_sinks = 0
+    for road in roads:
+        if not road._outputs:
+            road.add_output(void, 0, n_sinks)
+            n_sinks += 1
+    for road in roads:
+        if not road._inputs:
+            void.add_output(road)
+
+
+def build(benchmark: str, simulation: Simulation):
+    """
+    Create the roads of a benchmark in the simulation
+    """
+    if benchmark == "line":
+        Line(100, name="Line", simulation=simulation)
+    elif benchmark == "crossroad":
+        CrossroadAndLines(LENGTH, RED, GREEN, simulation=simulation)
+    elif benchmark == "2x2":
+        CrossroadAndLines2x2(LENGTH, RED, GREEN, [5, 8, 9, 0], simulation=simulation)
+    elif benchmark == "4x4":
+        CrossroadAndLines4x4(LENGTH, RED, GREEN, simulation=simulation)
+    elif benchmark == "city":
+        CrossroadAndLines4x4x4(LENGTH, RED, GREEN, simulation=simulation)
+        return
+    else:
+        raise ValueError("Unknown benchmark {}".format(benchmark))
+    _open_ends(simulation)
+
+
+def _initial_state(density: float, initials: str) -> str:
+    fname = os.path.join(initials, "cars_init_{}.json".format(density))
+    return fname if os.path.exists(fname) else None
+
+
+def _run(benchmark: str, backend: str, density: float, frames: int, seed: int, initials: str) -> Dict[str, float]:
+    """
+    Build, fill and run one point
+    :return: seconds of the build and of the frames, cars on the roads summed over the frames;
+             the reason in "skipped" if the backend can't run the state
+    """
+    start = time.perf_counter()
+    with Simulation(seed) as simulation:
+        build(benchmark, simulation)
+        for road in simulation.roads:
+            road.set_history(0)
+        fname = _initial_state(density, initials) if benchmark == "city" else None
+        if fname is not None:
+            load_cars(fname, simulation=simulation)
+        else:
+            generate_cars(density, seed=seed, simulation=simulation)
+        engine = None
+        if backend == "vectorized":
+            reason = VectorizedEngine.unsupported(simulation=simulation)
+            if reason:
+                return dict(skipped=reason)
+            engine = VectorizedEngine(simulation=simulation)
+    built = time.perf_counter()
+
+    if engine is not None:
+        engine.run(frames)
+        stats = engine.get_total_stats()
+    else:
+        simulation.run(frames)
+        stats = simulation.get_stats()
+    stop = time.perf_counter()
+    return dict(build_s=built - start, run_s=stop - built, car_steps=float(stats[:, 1].sum()))
+
+
+def measure(benchmark: str, backend: str, density: float, frames: int = 200, repeat: int = 3, seed: int = 0,
+            initials: str = "initials", memory: bool = True) -> Dict:
+    """
+    Time one point, the best of `repeat` runs is kept
+    :return: record of the results file
+    """
+    record = dict(benchmark=benchmark, backend=backend, density=density, frames=frames, build_s=None, run_s=None,
+                  frames_per_s=None, car_steps_per_s=None, peak_mb=None, traced_run_s=None, skipped=None)
+    old_backend = kernels.BACKEND
+    kernels.set_backend(backend if backend in ("python", "compiled") else "auto")  # the engine has no kernels
+    try:
+        runs = [_run(benchmark, backend, density, frames, seed, initials) for _ in range(repeat)]
+        if "skipped" in runs[0]:
+            record.update(skipped=runs[0]["skipped"])
+            return record
+        if memory:
+            tracemalloc.start()
+            try:
+                traced = _run(benchmark, backend, density, frames, seed, initials)
+                record.update(peak_mb=tracemalloc.get_traced_memory()[1] / 2 ** 20, traced_run_s=traced["run_s"])
+            finally:
+                tracemalloc.stop()
+    finally:
+        kernels.set_backend(old_backend)
+
+    best = min(runs, key=lambda run: run["run_s"])
+    record.update(build_s=min(run["build_s"] for run in runs), run_s=best["run_s"],
+                  frames_per_s=frames / best["run_s"], car_steps_per_s=best["car_steps"] / best["run_s"])
+    return record
+
+
+def run_benchmarks(benchmarks: List[str] = None, backends: List[str] = None, densities: List[float] = None,
+                   frames: int = 200, repeat: int = 3, seed: int = 0, initials: str = "initials",
+                   memory: bool = True, verbose: bool = True, path: str = None, label: str = None) -> List[Dict]:
+    """
+    Measure every (benchmark, backend, density), "compiled" is skipped if the extension isn't built
+    :param path: results file written after every point (see save), so a failure keeps the points done
+    """
+    benchmarks = benchmarks if benchmarks is not None else BENCHMARKS
+    backends = backends if backends is not None else BACKENDS
+    densities = densities if densities is not None else DENSITIES
+    if "compiled" in backends and not _compiled_available():
+        print("compiled backend isn't built, skipped")
+        backends = [backend for backend in backends if backend != "compiled"]
+
+    records = []
+    for benchmark in benchmarks:
+        for backend in backends:
+            for density in densities:
+                record = measure(benchmark, backend, density, frames, repeat, seed, initials, memory)
+                records.append(record)
+                if path is not None:
+                    save(path, records, label)
+                if verbose:
+                    print(_format(record))
+    return records
+
+
+def _compiled_available() -> bool:
+    old_backend = kernels.BACKEND
+    kernels.set_backend("auto")
+    available = kernels.BACKEND == "compiled"
+    kernels.set_backend(old_backend)
+    return available
+
+
+def _format(record: Dict) -> str:
+    point = "{:10s}{:11s}{:6.2f} ".format(record["benchmark"], record["backend"], record["density"])
+    if record.get("skipped"):
+        return point + "skipped: " + record["skipped"]
+    peak = ""
+    if record.get("peak_mb") is not None:
+        peak = "{:8.1f} MB ({:.2f} s traced)".format(record["peak_mb"], record["traced_run_s"])
+    return point + "{:10.1f} frames/s {:12.0f} car steps/s{}".format(record["frames_per_s"],
+                                                                       record["car_steps_per_s"], peak)
+
+
+def _key(record: Dict):
+    return record["benchmark"], record["backend"], record["density"], record["frames"]
+
+
+def save(path: str, records: List[Dict], label: str):
+    results = dict(label=label, date=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(),
+                   numpy=np.__version__, machine=platform.machine(), processor=platform.processor(),
+                   records=records)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as fp:
+        json.dump(results, fp, indent=1)
+
+
+def compare(records: List[Dict], path: str, threshold: float = .1) -> int:
+    """
+    Print frames/s of the records relative to an older results file
+    :param threshold: slowdown to flag as a regression, .1 is 10%
+    :return: number of regressions
+    """
+    with open(path) as fp:
+        old = {_key(record): record for record in json.load(fp)["records"]}
+    n_regressions = 0
+    for record in records:
+        base = old.get(_key(record))
+        if base is None or record.get("skipped") or base.get("skipped"):
+            continue
+        ratio = record["frames_per_s"] / base["frames_per_s"]
+        slower = ratio < 1 - threshold
+        n_regressions += slower
+        print("{:10s}{:11s}{:6.2f} {:6.2f}x{}".format(record["benchmark"], record["backend"], record["density"],
+                                                      ratio, "  REGRESSION" if slower else ""))
+    return n_regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frames per second of the networks on every backend")
+    parser.add_argument("benchmarks", nargs="*", help="some of %s, all by default" % ", ".join(BENCHMARKS))
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every point, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--initials", default="initials", help="directory with cars_init_*.json for the city")
+    parser.add_argument("--no-memory", action="store_true", help="skip the run traced by tracemalloc")
+    parser.add_argument("--label", default=None, help="save results as data/benchmarks/<label>.json")
+    parser.add_argument("--compare", default=None, help="results file to compare with")
+    parser.add_argument("--threshold", type=float, default=.1, help="slowdown reported as a regression")
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks " + ", ".join(sorted(unknown)))
+
+    path = os.path.join("data", "benchmarks", args.label + ".json") if args.label is not None else None
+    records = run_benchmarks(args.benchmarks or BENCHMARKS, args.backends, args.densities, args.frames, args.repeat,
+                             args.seed, args.initials, not args.no_memory, path=path, label=args.label)
+    if path is not None:
+        print("saved", path)
+    if args.compare is not None:
+        return 1 if compare(records, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
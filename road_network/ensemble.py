@@ -0,0 +1,96 @@
+"""
+Independent replicas of one network simulated together
+
+    ensemble = Ensemble(city_topology(), 16, seed=0)
+    ensemble.load_cars("initials/cars_init_0.3.json")
+    ensemble.run(500)
+    mean, var = ensemble.mean_var()              # arrays (n_frames, 3) of density, speed, flow
+
+Replicas are copies of a topology built in one Simulation with names prefixed by "R<no.>/". Copies don't share
+any road, so one VectorizedEngine over all of them evaluates every replica exactly as it would alone, while
+the NumPy calls of a frame are made once for all replicas. Replicas differ by the random numbers they draw from
+the common RandomSource (and by their initial states if generated).
+"""
+from typing import List, Tuple
+import numpy as np
+
+from .road_and_cars import BaseRoad, Simulation
+from .initials import load_cars, generate_cars
+from .vectorized import VectorizedEngine
+from .topology import Topology
+from .steady import frame_values
+
+
+class Ensemble:
+    """
+    n_replicas copies of a network, replicas[r] are the roads of copy r in the order of the topology
+    """
+
+    def __init__(self, topology: Topology, n_replicas: int, seed: int = None):
+        if n_replicas < 1:
+            raise ValueError("n_replicas must be positive")
+        self.topology = topology
+        self.simulation = Simulation(seed)
+        self.replicas: List[List[BaseRoad]] = [topology.build(self.simulation, prefix="R%d/" % r)
+                                               for r in range(n_replicas)]
+        for road in self.simulation.roads:
+            road.set_history(0)
+        self.engine: VectorizedEngine = None
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def load_cars(self, fname: str, random_walk: bool = False, rotate_in_case: bool = False):
+        """
+        Put the same initial state on every replica, see initials.load_cars
+        """
+        for r in range(len(self)):
+            load_cars(fname, random_walk, rotate_in_case, simulation=self.simulation, prefix="R%d/" % r)
+
+    def generate_cars(self, density: float, random_walk: bool = False, rotate_in_case: bool = False,
+                      seed: int = None):
+        """
+        Put an own random initial state of the density on every replica, see initials.generate_cars
+        """
+        seeds = np.random.SeedSequence(seed).spawn(len(self))
+        for roads, replica_seed in zip(self.replicas, seeds):
+            generate_cars(density, random_walk, rotate_in_case, seed=replica_seed, simulation=self.simulation,
+                          roads=roads)
+
+    def run(self, epochs: int, vectorized: bool = True):
+        """
+        :param vectorized: use VectorizedEngine, the object model runs if it can't reproduce the state
+                           (see VectorizedEngine.unsupported)
+        """
+        if vectorized and self.engine is None and self.simulation.frame == 0 and \
+                not VectorizedEngine.unsupported(simulation=self.simulation):
+            self.engine = VectorizedEngine(simulation=self.simulation)
+
+        if self.engine is not None:
+            self.engine.run(epochs, self.simulation.frame)
+            self.simulation.frame += epochs
+        else:
+            self.simulation.run(epochs)
+
+    def get_stats(self) -> np.ndarray:
+        """
+        :return: array (n_frames, n_replicas, 3) with n_cells, n_cars, n_moved_cars summed over every replica
+        """
+        if self.engine is not None:
+            stats = self.engine.get_all_stats()
+        else:
+            stats = np.stack([road.get_stats() for road in self.simulation.roads], axis=1)
+        return stats.reshape((len(stats), len(self), -1, 3)).sum(axis=2)
+
+    def density_speed_flow(self) -> np.ndarray:
+        """
+        :return: array (n_frames, n_replicas, 3) with density, speed and flow of every replica
+        """
+        return frame_values(self.get_stats())
+
+    def mean_var(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: mean and variance over the replicas, arrays (n_frames, 3) of density, speed and flow
+        """
+        values = self.density_speed_flow()
+        return values.mean(axis=1), values.var(axis=1, ddof=1 if len(self) > 1 else 0)
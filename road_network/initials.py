@@ -0,0 +1,241 @@
+import json
+import struct
+from typing import List
+import numpy as np
+
+from .road_and_cars import Car, Simulation, VoidGenerator
+
+MAGIC = b"CAR1"
+CAR_RECORD = np.dtype([("road", "<u4"), ("cell", "<u4"), ("speed", "u1"), ("route", "<i4")])
+
+
+def load_cars(fname: str, random_walk: bool = False, rotate_in_case: bool = False, simulation: Simulation = None,
+              prefix: str = "", skip_missing: bool = False):
+    """
+    Put cars from initials/cars_init_*.json or a binary file (see convert_cars) on the roads
+
+    The JSON file maps road names to lists of [row, col, speed code].
+    :param fname: path to the file
+    :param random_walk: give every car a random route of 100 crossroads, routes stored in a binary file win
+    :param rotate_in_case: allow cars to turn when stuck in a crossroad
+    :param simulation: simulation with the roads, Simulation.current() by default
+    :param prefix: added to the road names of the file, see Topology.build
+    :param skip_missing: leave out cars of roads that aren't in the simulation instead of raising NameError
+    """
+    simulation = simulation if simulation is not None else Simulation.current()
+    with open(fname, "rb") as fp:
+        data = fp.read()
+
+    binary = data[:4] == MAGIC
+    if binary:
+        names, cars, bounds, points = _parse(data, fname)
+    else:
+        names, cars = _from_json(json.loads(data))
+        bounds, points = np.zeros(1, dtype="int64"), np.zeros(0, dtype="int8")
+    names = [prefix + name for name in names]
+
+    if skip_missing:
+        known = np.array([name in simulation.dict_road for name in names], dtype="bool")
+        cars = cars[known[cars["road"]]]
+        names = [name if k else None for name, k in zip(names, known)]
+
+    if binary:
+        widths = np.array([simulation.get_road(name)._road.shape[1] if name is not None else 1 for name in names],
+                          dtype="int64")
+        width = widths[cars["road"]]
+        rows, cols = cars["cell"] // width, cars["cell"] % width
+    else:
+        rows, cols = cars["row"], cars["col"]
+    _place(simulation, names, cars["road"], rows, cols, cars["speed"], random_walk, rotate_in_case,
+           cars["route"], bounds, points)
+
+
+def _place(simulation: Simulation, names: List[str], road: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+           speed: np.ndarray, random_walk: bool, rotate_in_case: bool, route: np.ndarray = None,
+           bounds: np.ndarray = None, points: np.ndarray = None):
+    """
+    Create cars and put them on the roads in one pass
+    :param names: road names, None for roads that are skipped (without cars)
+    :param road: no. of the road in names of every car
+    :param route: no. of the route of every car (-1 if none), routes are points[bounds[i]:bounds[i + 1]]
+    """
+    new_cars = Car.create_many(len(road), rotate_in_case, simulation)
+    store = simulation.store
+    ids = np.array([car.id for car in new_cars], dtype="int64")
+    store.coords[ids, 0] = rows
+    store.coords[ids, 1] = cols
+    store.speed_code[ids] = speed
+
+    order = np.argsort(road, kind="stable")
+    split = np.cumsum(np.bincount(road, minlength=len(names)))[:-1]
+    for name, group in zip(names, np.split(order, split)):
+        if name is not None:
+            simulation.get_road(name).add_car_at_position_w_speed([new_cars[i] for i in group])
+
+    if random_walk:
+        store.routes.set_many(ids, simulation.random.routes(len(ids)))
+    if route is None:
+        return
+    for i in np.nonzero(route >= 0)[0]:
+        store.routes.set(ids[i], points[bounds[route[i]]:bounds[route[i] + 1]])
+
+
+def random_cars(density: float, seed: int = None, simulation: Simulation = None, roads: List = None):
+    """
+    Cars in uniformly random cells of all roads, cell and speed codes are drawn from BaseRoad.valid_speeds
+
+    :param density: share of valid cells with a car, as n_cars / n_cells of the stats
+    :param seed: seed of the numbers, independent of the random numbers of the simulation
+    :param roads: where to put the cars, all roads of the simulation by default
+    :return: road names, records with road (no. in names), row, col and speed sorted by road and cell
+    """
+    if not 0 <= density <= 1:
+        raise ValueError("density must be in [0, 1]")
+    simulation = simulation if simulation is not None else Simulation.current()
+    names, road, cells, options = [], [], [], []
+    for r in (roads if roads is not None else simulation.roads):
+        valid = r.valid_speeds().reshape((-1, 2))
+        cell = np.nonzero(valid[:, 0] | valid[:, 1])[0]
+        if len(cell) == 0:
+            continue
+        road.append(np.full(len(cell), len(names)))
+        cells.append(cell)
+        options.append(-np.sort(-valid[cell], axis=1))  # codes first, zeros last
+        names.append((str(r), r._road.shape[1]))
+
+    records = np.zeros(0, dtype=[("road", "int64"), ("row", "int64"), ("col", "int64"), ("speed", "int8")])
+    if not names:
+        return [], records
+    road, cells, options = np.concatenate(road), np.concatenate(cells), np.concatenate(options)
+
+    rng = np.random.default_rng(seed)
+    chosen = np.sort(rng.choice(len(cells), int(round(density * len(cells))), replace=False))
+    n_options = np.count_nonzero(options[chosen], axis=1)
+    pick = (rng.random(len(chosen)) * n_options).astype("int64")
+
+    widths = np.array([width for _, width in names], dtype="int64")
+    records = np.zeros(len(chosen), dtype=records.dtype)
+    records["road"] = road[chosen]
+    records["row"] = cells[chosen] // widths[road[chosen]]
+    records["col"] = cells[chosen] % widths[road[chosen]]
+    records["speed"] = options[chosen, pick]
+    return [name for name, _ in names], records
+
+
+def generate_cars(density: float, random_walk: bool = False, rotate_in_case: bool = False, seed: int = None,
+                  simulation: Simulation = None, roads: List = None):
+    """
+    Put cars of random_cars on the roads, like load_cars does with a file
+    """
+    simulation = simulation if simulation is not None else Simulation.current()
+    names, cars = random_cars(density, seed, simulation, roads)
+    _place(simulation, names, cars["road"], cars["row"], cars["col"], cars["speed"], random_walk, rotate_in_case)
+
+
+def _from_json(cars: dict):
+    """
+    :return: road names, records with road, row, col, speed and route (-1) in the order of the file
+    """
+    names = list(cars)
+    records = np.zeros(sum(len(c) for c in cars.values()),
+                       dtype=[("road", "int64"), ("row", "int64"), ("col", "int64"), ("speed", "int8"),
+                              ("route", "int64")])
+    records["route"] = -1
+    records["road"] = np.repeat(np.arange(len(names)), [len(cars[name]) for name in names])
+    if len(records):
+        columns = np.array([char[:3] for name in names for char in cars[name]], dtype="int64")
+        records["row"], records["col"], records["speed"] = columns.T
+    return names, records
+
+
+def _parse(data: bytes, fname: str = ""):
+    """
+    :return: road names, car records, route bounds and route points of a binary file
+    """
+    n_roads, n_cars, n_routes, n_points = struct.unpack_from("<IIII", data, 4)
+    pos = 20
+    names = []
+    for _ in range(n_roads):
+        length, = struct.unpack_from("<H", data, pos)
+        names.append(data[pos + 2:pos + 2 + length].decode("utf-8"))
+        pos += 2 + length
+
+    cars = np.frombuffer(data, dtype=CAR_RECORD, count=n_cars, offset=pos)
+    pos += CAR_RECORD.itemsize * n_cars
+    bounds = np.frombuffer(data, dtype="<i8", count=n_routes + 1, offset=pos)
+    pos += 8 * (n_routes + 1)
+    points = np.frombuffer(data, dtype="int8", count=n_points, offset=pos)
+    if pos + n_points != len(data):
+        raise ValueError("{} is damaged".format(fname))
+    return names, cars, bounds, points
+
+
+def _write(fname: str, names: List[str], cars: np.ndarray, routes: List[np.ndarray]):
+    """
+    File layout (little-endian):
+        magic, uint32 numbers of roads, cars, routes and route points
+        every road:     uint16 length, name
+        every car:      uint32 road, uint32 flat cell in the road grid, uint8 speed code,
+                        int32 no. of the route (-1 if none)
+        routes:         int64 (n_routes + 1) bounds of every route in the points, int8 points
+    """
+    bounds = np.concatenate(([0], np.cumsum([len(route) for route in routes], dtype="int64"))).astype("<i8")
+    points = np.concatenate(routes).astype("int8") if routes else np.zeros(0, dtype="int8")
+    with open(fname, "wb") as fp:
+        fp.write(MAGIC + struct.pack("<IIII", len(names), len(cars), len(routes), len(points)))
+        for name in names:
+            encoded = name.encode("utf-8")
+            fp.write(struct.pack("<H", len(encoded)) + encoded)
+        fp.write(cars.astype(CAR_RECORD).tobytes())
+        fp.write(bounds.tobytes())
+        fp.write(points.tobytes())
+
+
+def convert_cars(src: str, dst: str, simulation: Simulation = None):
+    """
+    Convert initials/cars_init_*.json to the binary format loaded by load_cars
+
+    :param simulation: simulation with the roads of the file (for widths of their grids), Simulation.current() by default
+    """
+    simulation = simulation if simulation is not None else Simulation.current()
+    with open(src) as fp:
+        names, records = _from_json(json.load(fp))
+    widths = np.array([simulation.get_road(name)._road.shape[1] for name in names], dtype="int64")
+
+    cars = np.zeros(len(records), dtype=CAR_RECORD)
+    cars["road"] = records["road"]
+    cars["cell"] = records["row"] * widths[records["road"]] + records["col"]
+    cars["speed"] = records["speed"]
+    cars["route"] = -1
+    _write(dst, names, cars, [])
+
+
+def save_cars(dst: str, simulation: Simulation = None, routes: bool = True):
+    """
+    Write cars that are on the roads now in the format of convert_cars
+
+    :param routes: keep the rest of the route of every car
+    """
+    simulation = simulation if simulation is not None else Simulation.current()
+    store = simulation.store
+    names, records, kept = [], [], []
+    for road in simulation.roads:
+        if isinstance(road, VoidGenerator):
+            continue
+        cars = road.get_cars() + road._new_cars
+        if len(cars) == 0:
+            continue
+        ids = np.array([car.id for car in cars], dtype="int64")
+        part = np.zeros(len(ids), dtype=CAR_RECORD)
+        part["road"] = len(names)
+        part["cell"] = store.coords[ids, 0] * road._road.shape[1] + store.coords[ids, 1]
+        part["speed"] = store.speed_code[ids]
+        part["route"] = -1
+        if routes:
+            part["route"] = len(kept) + np.arange(len(ids))
+            kept.extend(store.routes.get(car_id)[store.routes.cursor[car_id]:] for car_id in ids)
+        names.append(str(road))
+        records.append(part)
+
+    cars = np.concatenate(records) if records else np.zeros(0, dtype=CAR_RECORD)
+    _write(dst, names, cars, kept)
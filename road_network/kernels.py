@@ -0,0 +1,41 @@
+"""
+Backends of the car loops of Line, LineWLight and Crossroad
+
+"compiled" is the extension road_network/_kernels.pyx, built by setup.py:
+    pip install .    or    python setup.py build_ext --inplace
+"python" is the pure-Python code of road_and_cars.py.
+
+The backend is chosen when the package is imported from the ROAD_NETWORK_BACKEND environment variable:
+"python" forces the pure-Python loops, "compiled" raises ImportError if the extension isn't built,
+anything else takes the extension when it's available. Both backends give the same results,
+tests/test_kernels.py checks them against a recorded run.
+"""
+import os
+
+compiled = None  # the extension module if it's used
+BACKEND = "python"
+
+
+def set_backend(name: str = "auto"):
+    """
+    Switch the backend of roads created before and after the call
+    :param name: "python", "compiled" or "auto"
+    """
+    global compiled, BACKEND
+    if name not in ("python", "compiled", "auto"):
+        raise ValueError("Unknown backend {}".format(name))
+
+    compiled, BACKEND = None, "python"
+    if name == "python":
+        return
+    try:
+        from . import _kernels
+    except ImportError:
+        if name == "compiled":
+            raise
+        return
+    compiled, BACKEND = _kernels, "compiled"
+
+
+set_backend(os.environ.get("ROAD_NETWORK_BACKEND", "auto"))
+
@@ -1,23 +1,113 @@
 import numpy as np
-from typing import Tuple
-
-from .road_and_cars import BaseRoad, LineWLight, Line, Crossroad, Car
-
-
-class CrossroadAndLines:
-
-    def __init__(self, length, red, green, offset: int = 0, rotary_2: bool = False, name="Crossroad and lines"):
-        lineW0 = LineWLight(length, length - 2, red, green, offset, name=name + "/LineWLight0")
-        lineW1 = LineWLight(length, length - 2, red, green, offset, name=name + "/LineWLight1")
-        lineW2 = LineWLight(length, length - 2, red, green, offset+(red+green)//2, name=name + "/LineWLight2")
-        lineW3 = LineWLight(length, length - 2, red, green, offset+(red+green)//2, name=name + "/LineWLight3")
-
-        line0 = Line(length, name=name + "/Line0")
-        line1 = Line(length, name=name + "/Line1")
-        line2 = Line(length, name=name + "/Line2")
-        line3 = Line(length, name=name + "/Line3")
-
-        self.crossroad = Crossroad(1, 1, 1, 1, rotary_2 = rotary_2, name=name + "/Crossroad")
+from typing import List, Tuple
+
+from .road_and_cars import BaseRoad, LineWLight, Line, Crossroad, Car, History, VoidGenerator, Simulation, RoadGroup
+
+
+class Canvas:
+    """
+    Fixed map from cells of roads to pixels of a composite picture
+
+    The picture is taken from a flat source: 0 for the padding, then the cells of every road in order,
+    a LineWLight is followed by its light (light + 2 as in LineWLight.render). The map is built once
+    by composing pictures of cell numbers instead of cells, so a frame costs one copy of the roads and
+    one fancy indexing, and only when it's asked for.
+    """
+
+    def __init__(self, parts: List, compose):
+        """
+
+        :param parts: roads and composites in the order compose takes their pictures
+        :param compose: function making the composite picture out of the pictures of parts
+        """
+        self.roads: List[BaseRoad] = []
+        pictures = []
+        size = 1
+        for part in parts:
+            if isinstance(part, BaseRoad):
+                picture, n = self._numbers(part)
+                self.roads.append(part)
+            else:
+                picture, n = part.canvas.index, part.canvas.size - 1
+                self.roads.extend(part.canvas.roads)
+            pictures.append(np.where(picture > 0, picture + size - 1, 0))
+            size += n
+
+        self.size = size
+        self.index = np.asarray(compose(pictures)).astype("int64")
+        self._source = np.zeros(size, dtype="int32")
+
+        self._cells = []  # (start, stop, road) of every road in the source
+        self._lights = []  # position of light of every LineWLight in the source
+        self._light_roads = []
+        pos = 1
+        for road in self.roads:
+            self._cells.append((pos, pos + road._road.size, road))
+            pos += road._road.size
+            if isinstance(road, LineWLight):
+                self._lights.append(pos)
+                self._light_roads.append(road)
+                pos += 1
+
+    @staticmethod
+    def _numbers(road: BaseRoad) -> Tuple[np.ndarray, int]:
+        """
+        :return: picture of the road with numbers of its values in the source (from 1), number of values
+        """
+        n = road._road.size
+        numbers = np.arange(1, n + 1).reshape(road._road.shape)
+        if not isinstance(road, LineWLight):
+            return numbers, n
+
+        light = np.zeros_like(numbers)
+        light[0, road.light_position[-1]] = n + 1
+        return np.vstack((numbers, light)), n + 1
+
+    def snapshot(self) -> np.ndarray:
+        """
+        :return: flat source of the current state, the buffer is reused by the next call
+        """
+        source = self._source
+        for start, stop, road in self._cells:
+            source[start:stop] = road._road.ravel()
+        source[self._lights] = [road.light + 2 for road in self._light_roads]
+        return source
+
+    def render(self, source: np.ndarray = None) -> np.ndarray:
+        """
+        :param source: a saved snapshot, the current state by default
+        """
+        if source is None:
+            source = self.snapshot()
+        return source[self.index]
+
+
+def compose_2x2(pictures):
+    """
+    Four pictures in a square: 0 1 on top, 2 3 at the bottom
+    """
+    top = np.concatenate((pictures[0], pictures[1]), axis=1)
+    bottom = np.concatenate((pictures[2], pictures[3]), axis=1)
+    return np.vstack((top, bottom))
+
+
+class CrossroadAndLines(RoadGroup):
+
+    def __init__(self, length, red, green, offset: int = 0, rotary_2: bool = False, name="Crossroad and lines",
+                 simulation: Simulation = None):
+        lineW0 = LineWLight(length, length - 2, red, green, offset, name=name + "/LineWLight0", simulation=simulation)
+        lineW1 = LineWLight(length, length - 2, red, green, offset, name=name + "/LineWLight1", simulation=simulation)
+        lineW2 = LineWLight(length, length - 2, red, green, offset+(red+green)//2, name=name + "/LineWLight2",
+                            simulation=simulation)
+        lineW3 = LineWLight(length, length - 2, red, green, offset+(red+green)//2, name=name + "/LineWLight3",
+                            simulation=simulation)
+
+        line0 = Line(length, name=name + "/Line0", simulation=simulation)
+        line1 = Line(length, name=name + "/Line1", simulation=simulation)
+        line2 = Line(length, name=name + "/Line2", simulation=simulation)
+        line3 = Line(length, name=name + "/Line3", simulation=simulation)
+
+        self.crossroad = Crossroad(1, 1, 1, 1, rotary_2 = rotary_2, name=name + "/Crossroad", simulation=simulation)
 
         #     void = VoidGenerator(.8)
 
@@ -33,16 +123,39 @@ class CrossroadAndLines:
 
         self.input_roads = [lineW0, lineW1, lineW2, lineW3]
         self.output_roads = [line0, line1, line2, line3]
+        self.roads = self.output_roads + self.input_roads + [self.crossroad]
 
-        self._history = []
+        self._history = History()  # snapshots of Canvas
+        self._canvas: Canvas = None
         self.shuffle = True
 
     def add_car(self, car: Car, direction: int = 0):
         return self.input_roads[direction].add_car(car)
 
-    def render(self, moment: int = -1):
-        renders = list(map(lambda r: r.render(), self.input_roads + self.output_roads + [self.crossroad]))
+    def set_history(self, size: int = None, step: int = 1):
+        """
+        Change what is kept in history of the composite and all its roads, see History
+        """
+        self._history = History(size, step)
+        for road in self.input_roads + self.output_roads + [self.crossroad]:
+            road.set_history(size, step)
 
+    @property
+    def canvas(self) -> Canvas:
+        if self._canvas is None:
+            self._canvas = Canvas(self.input_roads + self.output_roads + [self.crossroad], self._compose)
+        return self._canvas
+
+    def render(self, moment: int = -1):
+        """
+        :param moment: frame from history, the current state by default
+        """
+        if moment < 0:
+            return self.canvas.render()
+        return self.canvas.render(self._history[moment])
+
+    @staticmethod
+    def _compose(renders):
         top = np.concatenate((np.zeros((renders[2].shape[1], renders[1].shape[1]), dtype="int32"),
                               np.flip(np.transpose(renders[2]), axis=1),
                               np.flip(np.transpose(renders[7]), axis=0),
@@ -64,36 +177,32 @@ class CrossroadAndLines:
 
         return np.vstack((top, center, bottom))
 
-    def move_cars(self, frame=0):
-        for road in self.output_roads + self.input_roads + [self.crossroad]:
-            road.move_cars(frame)
-
-    def step(self, frame=0):
-        for road in self.output_roads + self.input_roads + [self.crossroad]:
-            road.step(frame)
-
     def process_outputs(self, frame=0):
-        for road in self.output_roads + self.input_roads:
-            road.process_output(frame)
+        super(CrossroadAndLines, self).process_outputs(frame)
+        self._history.record(self._snapshot)
 
-        self.crossroad.process_outputs()
-        self._history.append(self.render())
+    def _snapshot(self):
+        return self.canvas.snapshot().copy()
 
     def get_stats(self):
-        stats = np.zeros((len(self._history), 4))
-        for road in self.input_roads + self.output_roads:
-            stats += np.array(road.get_stats())
-
-        return stats
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over the lines
+        """
+        return np.sum([road.get_stats() for road in self.input_roads + self.output_roads], axis=0)
 
 
 class CrossroadAndLines2x2: #(BaseRoad):
 
-    def __init__(self, length, red, green, offsets=[0, 0, 0, 0], rotary_2: bool = False, name = "CrandLines2x2"):
-        self.crossroad1 = CrossroadAndLines(length, red, green, offsets[0], rotary_2 = rotary_2, name=name + "/Cross0")
-        self.crossroad2 = CrossroadAndLines(length, red, green, offsets[1], rotary_2 = rotary_2, name=name + "/Cross1")
-        self.crossroad3 = CrossroadAndLines(length, red, green, offsets[2], rotary_2 = rotary_2, name=name + "/Cross2")
-        self.crossroad4 = CrossroadAndLines(length, red, green, offsets[3], rotary_2 = rotary_2, name=name + "/Cross3")
+    def __init__(self, length, red, green, offsets=[0, 0, 0, 0], rotary_2: bool = False, name = "CrandLines2x2",
+                 simulation: Simulation = None):
+        self.crossroad1 = CrossroadAndLines(length, red, green, offsets[0], rotary_2 = rotary_2, name=name + "/Cross0",
+                                            simulation=simulation)
+        self.crossroad2 = CrossroadAndLines(length, red, green, offsets[1], rotary_2 = rotary_2, name=name + "/Cross1",
+                                            simulation=simulation)
+        self.crossroad3 = CrossroadAndLines(length, red, green, offsets[2], rotary_2 = rotary_2, name=name + "/Cross2",
+                                            simulation=simulation)
+        self.crossroad4 = CrossroadAndLines(length, red, green, offsets[3], rotary_2 = rotary_2, name=name + "/Cross3",
+                                            simulation=simulation)
 
         self.crossroad1.output_roads[1].add_output(self.crossroad2.input_roads[1], 0, 0)
         self.crossroad1.output_roads[2].add_output(self.crossroad3.input_roads[2], 0, 0)
@@ -109,22 +218,34 @@ class CrossroadAndLines2x2: #(BaseRoad):
 
         self.crossroads = [self.crossroad1, self.crossroad2, self.crossroad3, self.crossroad4]
 
-        self._history = []
+        self._history = History()  # snapshots of Canvas
+        self._canvas: Canvas = None
         self.shuffle = True
 
 #     def add_car(self, car: Car, direction: int = 0):
 #         return self.input_roads[direction].add_car(car)
 
-    def render(self, moment: int = -1):
-        cr1 = self.crossroad1.render(moment)
-        cr2 = self.crossroad2.render(moment)
-        cr3 = self.crossroad3.render(moment)
-        cr4 = self.crossroad4.render(moment)
+    def set_history(self, size: int = None, step: int = 1):
+        """
+        Change what is kept in history of the composite and everything inside, see History
+        """
+        self._history = History(size, step)
+        for road in self.crossroads:
+            road.set_history(size, step)
 
-        top = np.concatenate((cr1, cr2), axis=1)
-        bottom = np.concatenate((cr3, cr4), axis=1)
+    @property
+    def canvas(self) -> Canvas:
+        if self._canvas is None:
+            self._canvas = Canvas(self.crossroads, compose_2x2)
+        return self._canvas
 
-        return np.vstack((top, bottom))
+    def render(self, moment: int = -1):
+        """
+        :param moment: frame from history, the current state by default
+        """
+        if moment < 0:
+            return self.canvas.render()
+        return self.canvas.render(self._history[moment])
 
     def move_cars(self, frame=0):
         for road in self.crossroads:
@@ -138,24 +259,30 @@ class CrossroadAndLines2x2: #(BaseRoad):
         for road in self.crossroads:
             road.process_outputs(frame)
 
-        self._history.append(self.render())
+        self._history.record(self._snapshot)
 
-    def get_stats(self):
-        stats = np.zeros((len(self._history), 4))
-        for road in self.crossroads:
-            stats += np.array(road.get_stats())
+    def _snapshot(self):
+        return self.canvas.snapshot().copy()
 
-        return stats
+    def get_stats(self):
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over the blocks
+        """
+        return np.sum([road.get_stats() for road in self.crossroads], axis=0)
 
 
 class CrossroadAndLines4x4:  # (BaseRoad):
 
     def __init__(self, length, red, green, offsets=[[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]],
-                 rotary_2: bool = False, name="CrandLines2x2"):
-        self.cross1 = CrossroadAndLines2x2(length, red, green, offsets[0], rotary_2=rotary_2, name=name + "/Cross0")
-        self.cross2 = CrossroadAndLines2x2(length, red, green, offsets[1], rotary_2=rotary_2, name=name + "/Cross1")
-        self.cross3 = CrossroadAndLines2x2(length, red, green, offsets[2], rotary_2=rotary_2, name=name + "/Cross2")
-        self.cross4 = CrossroadAndLines2x2(length, red, green, offsets[3], rotary_2=rotary_2, name=name + "/Cross3")
+                 rotary_2: bool = False, name="CrandLines2x2", simulation: Simulation = None):
+        self.cross1 = CrossroadAndLines2x2(length, red, green, offsets[0], rotary_2=rotary_2, name=name + "/Cross0",
+                                           simulation=simulation)
+        self.cross2 = CrossroadAndLines2x2(length, red, green, offsets[1], rotary_2=rotary_2, name=name + "/Cross1",
+                                           simulation=simulation)
+        self.cross3 = CrossroadAndLines2x2(length, red, green, offsets[2], rotary_2=rotary_2, name=name + "/Cross2",
+                                           simulation=simulation)
+        self.cross4 = CrossroadAndLines2x2(length, red, green, offsets[3], rotary_2=rotary_2, name=name + "/Cross3",
+                                           simulation=simulation)
 
         self.cross1.crossroad2.output_roads[1].add_output(self.cross2.crossroad1.input_roads[1], 0, 0)
         self.cross1.crossroad3.output_roads[2].add_output(self.cross3.crossroad1.input_roads[2], 0, 0)
@@ -187,22 +314,34 @@ class CrossroadAndLines4x4:  # (BaseRoad):
 
         self.crossroads = [self.cross1, self.cross2, self.cross3, self.cross4]
 
-        self._history = []
+        self._history = History()  # snapshots of Canvas
+        self._canvas: Canvas = None
         self.shuffle = True
 
     #     def add_car(self, car: Car, direction: int = 0):
     #         return self.input_roads[direction].add_car(car)
 
-    def render(self, moment: int = -1):
-        cr1 = self.cross1.render(moment)
-        cr2 = self.cross2.render(moment)
-        cr3 = self.cross3.render(moment)
-        cr4 = self.cross4.render(moment)
+    def set_history(self, size: int = None, step: int = 1):
+        """
+        Change what is kept in history of the composite and everything inside, see History
+        """
+        self._history = History(size, step)
+        for road in self.crossroads:
+            road.set_history(size, step)
 
-        top = np.concatenate((cr1, cr2), axis=1)
-        bottom = np.concatenate((cr3, cr4), axis=1)
+    @property
+    def canvas(self) -> Canvas:
+        if self._canvas is None:
+            self._canvas = Canvas(self.crossroads, compose_2x2)
+        return self._canvas
 
-        return np.vstack((top, bottom))
+    def render(self, moment: int = -1):
+        """
+        :param moment: frame from history, the current state by default
+        """
+        if moment < 0:
+            return self.canvas.render()
+        return self.canvas.render(self._history[moment])
 
     def move_cars(self, frame=0):
         for road in self.crossroads:
@@ -216,11 +355,268 @@ class CrossroadAndLines4x4:  # (BaseRoad):
         for road in self.crossroads:
             road.process_outputs(frame)
 
-        self._history.append(self.render())
+        self._history.record(self._snapshot)
+
+    def _snapshot(self):
+        return self.canvas.snapshot().copy()
 
     def get_stats(self):
-        stats = np.zeros((len(self._history), 4))
-        for road in self.crossroads:
-            stats += np.array(road.get_stats())
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over the blocks
+        """
+        return np.sum([road.get_stats() for road in self.crossroads], axis=0)
+
+
+# Line -> LineWLight links between the blocks of CrossroadAndLines4x4x4
+CITY_LINKS = (
+    ("BC0/Cross0/Cross0/Line3", "BC2/Cross2/Cross2/LineWLight3"),
+    ("BC0/Cross0/Cross1/Line3", "BC2/Cross2/Cross3/LineWLight3"),
+    ("BC0/Cross1/Cross0/Line3", "BC2/Cross3/Cross2/LineWLight3"),
+    ("BC0/Cross1/Cross1/Line3", "BC2/Cross3/Cross3/LineWLight3"),
+    ("BC0/Cross0/Cross0/Line0", "BC1/Cross1/Cross1/LineWLight0"),
+    ("BC0/Cross0/Cross2/Line0", "BC1/Cross1/Cross3/LineWLight0"),
+    ("BC0/Cross2/Cross0/Line0", "BC1/Cross3/Cross1/LineWLight0"),
+    ("BC0/Cross2/Cross2/Line0", "BC1/Cross3/Cross3/LineWLight0"),
+    ("BC0/Cross1/Cross1/Line1", "BC1/Cross0/Cross0/LineWLight1"),
+    ("BC0/Cross1/Cross3/Line1", "BC1/Cross0/Cross2/LineWLight1"),
+    ("BC0/Cross3/Cross1/Line1", "BC1/Cross2/Cross0/LineWLight1"),
+    ("BC0/Cross3/Cross3/Line1", "BC1/Cross2/Cross2/LineWLight1"),
+    ("BC0/Cross2/Cross2/Line2", "BC2/Cross0/Cross0/LineWLight2"),
+    ("BC0/Cross2/Cross3/Line2", "BC2/Cross0/Cross1/LineWLight2"),
+    ("BC0/Cross3/Cross2/Line2", "BC2/Cross1/Cross0/LineWLight2"),
+    ("BC0/Cross3/Cross3/Line2", "BC2/Cross1/Cross1/LineWLight2"),
+    ("BC1/Cross0/Cross0/Line3", "BC3/Cross2/Cross2/LineWLight3"),
+    ("BC1/Cross0/Cross1/Line3", "BC3/Cross2/Cross3/LineWLight3"),
+    ("BC1/Cross1/Cross0/Line3", "BC3/Cross3/Cross2/LineWLight3"),
+    ("BC1/Cross1/Cross1/Line3", "BC3/Cross3/Cross3/LineWLight3"),
+    ("BC1/Cross1/Cross1/Line1", "BC0/Cross0/Cross0/LineWLight1"),
+    ("BC1/Cross1/Cross3/Line1", "BC0/Cross0/Cross2/LineWLight1"),
+    ("BC1/Cross3/Cross1/Line1", "BC0/Cross2/Cross0/LineWLight1"),
+    ("BC1/Cross3/Cross3/Line1", "BC0/Cross2/Cross2/LineWLight1"),
+    ("BC1/Cross0/Cross0/Line0", "BC0/Cross1/Cross1/LineWLight0"),
+    ("BC1/Cross0/Cross2/Line0", "BC0/Cross1/Cross3/LineWLight0"),
+    ("BC1/Cross2/Cross0/Line0", "BC0/Cross3/Cross1/LineWLight0"),
+    ("BC1/Cross2/Cross2/Line0", "BC0/Cross3/Cross3/LineWLight0"),
+    ("BC1/Cross2/Cross2/Line2", "BC3/Cross0/Cross0/LineWLight2"),
+    ("BC1/Cross2/Cross3/Line2", "BC3/Cross0/Cross1/LineWLight2"),
+    ("BC1/Cross3/Cross2/Line2", "BC3/Cross1/Cross0/LineWLight2"),
+    ("BC1/Cross3/Cross3/Line2", "BC3/Cross1/Cross1/LineWLight2"),
+    ("BC2/Cross0/Cross0/Line0", "BC3/Cross1/Cross1/LineWLight0"),
+    ("BC2/Cross0/Cross2/Line0", "BC3/Cross1/Cross3/LineWLight0"),
+    ("BC2/Cross2/Cross0/Line0", "BC3/Cross3/Cross1/LineWLight0"),
+    ("BC2/Cross2/Cross2/Line0", "BC3/Cross3/Cross3/LineWLight0"),
+    ("BC2/Cross2/Cross2/Line2", "BC0/Cross0/Cross0/LineWLight2"),
+    ("BC2/Cross2/Cross3/Line2", "BC0/Cross0/Cross1/LineWLight2"),
+    ("BC2/Cross3/Cross2/Line2", "BC0/Cross1/Cross0/LineWLight2"),
+    ("BC2/Cross3/Cross3/Line2", "BC0/Cross1/Cross1/LineWLight2"),
+    ("BC2/Cross0/Cross0/Line3", "BC0/Cross2/Cross2/LineWLight3"),
+    ("BC2/Cross0/Cross1/Line3", "BC0/Cross2/Cross3/LineWLight3"),
+    ("BC2/Cross1/Cross0/Line3", "BC0/Cross3/Cross2/LineWLight3"),
+    ("BC2/Cross1/Cross1/Line3", "BC0/Cross3/Cross3/LineWLight3"),
+    ("BC2/Cross1/Cross1/Line1", "BC3/Cross0/Cross0/LineWLight1"),
+    ("BC2/Cross1/Cross3/Line1", "BC3/Cross0/Cross2/LineWLight1"),
+    ("BC2/Cross3/Cross1/Line1", "BC3/Cross2/Cross0/LineWLight1"),
+    ("BC2/Cross3/Cross3/Line1", "BC3/Cross2/Cross2/LineWLight1"),
+    ("BC3/Cross1/Cross1/Line1", "BC2/Cross0/Cross0/LineWLight1"),
+    ("BC3/Cross1/Cross3/Line1", "BC2/Cross0/Cross2/LineWLight1"),
+    ("BC3/Cross3/Cross1/Line1", "BC2/Cross2/Cross0/LineWLight1"),
+    ("BC3/Cross3/Cross3/Line1", "BC2/Cross2/Cross2/LineWLight1"),
+    ("BC3/Cross2/Cross2/Line2", "BC1/Cross0/Cross0/LineWLight2"),
+    ("BC3/Cross2/Cross3/Line2", "BC1/Cross0/Cross1/LineWLight2"),
+    ("BC3/Cross3/Cross2/Line2", "BC1/Cross1/Cross0/LineWLight2"),
+    ("BC3/Cross3/Cross3/Line2", "BC1/Cross1/Cross1/LineWLight2"),
+    ("BC3/Cross0/Cross0/Line3", "BC1/Cross2/Cross2/LineWLight3"),
+    ("BC3/Cross0/Cross1/Line3", "BC1/Cross2/Cross3/LineWLight3"),
+    ("BC3/Cross1/Cross0/Line3", "BC1/Cross3/Cross2/LineWLight3"),
+    ("BC3/Cross1/Cross1/Line3", "BC1/Cross3/Cross3/LineWLight3"),
+    ("BC3/Cross0/Cross0/Line0", "BC2/Cross1/Cross1/LineWLight0"),
+    ("BC3/Cross0/Cross2/Line0", "BC2/Cross1/Cross3/LineWLight0"),
+    ("BC3/Cross2/Cross0/Line0", "BC2/Cross3/Cross1/LineWLight0"),
+    ("BC3/Cross2/Cross2/Line0", "BC2/Cross3/Cross3/LineWLight0"),
+)
+
+
+class CrossroadAndLines4x4x4(RoadGroup):
+    """
+    Four CrossroadAndLines4x4 blocks (BC0..BC3) wrapped into a torus, the map of "Traffic flow modelling"
+
+    Roads are named as in initials/*.json. Frames are evaluated over the roads in the order of creation,
+    the same way as Simulation.run does.
+    """
+
+    def __init__(self, length, red, green, rotary_2: bool = False, name: str = None, simulation: Simulation = None):
+        prefix = name + "/" if name is not None else ""
+        self.simulation = simulation if simulation is not None else Simulation.current()
+        first = len(self.simulation.roads)
+        self.blocks = [CrossroadAndLines4x4(length, red, green, rotary_2=rotary_2, name=prefix + "BC%d" % i,
+                                            simulation=self.simulation)
+                       for i in range(4)]
+        self.void = VoidGenerator(name=prefix + "Void", simulation=self.simulation)
+        self.roads = self.simulation.roads[first:]
+
+        for road1, road2 in CITY_LINKS:
+            self.simulation.connect_roads_str(prefix + road1, prefix + road2)
+
+        self._history = History()  # snapshots of Canvas
+        self._canvas: Canvas = None
+
+    def set_history(self, size: int = None, step: int = 1):
+        """
+        Change what is kept in history of the map and everything inside, see History
+        """
+        self._history = History(size, step)
+        for block in self.blocks:
+            block.set_history(size, step)
+
+    @property
+    def canvas(self) -> Canvas:
+        if self._canvas is None:
+            self._canvas = Canvas(self.blocks, compose_2x2)
+        return self._canvas
 
-        return stats
+    def render(self, moment: int = -1):
+        """
+        :param moment: frame from history, the current state by default
+        """
+        if moment < 0:
+            return self.canvas.render()
+        return self.canvas.render(self._history[moment])
+
+    def process_outputs(self, frame=0):
+        super(CrossroadAndLines4x4x4, self).process_outputs(frame)
+        self._history.record(self._snapshot)
+
+    def _snapshot(self):
+        return self.canvas.snapshot().copy()
+
+    def get_stats(self):
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over all roads
+        """
+        return np.sum([road.get_stats() for road in self.roads], axis=0)
+
+
+class GridCity(RoadGroup):
+    """
+    n_rows x n_cols intersections like CrossroadAndLines connected into a grid
+
+    Intersection (i, j) is a Crossroad with an incoming LineWLight and an outgoing Line for every direction
+    of the crossroad (lanes going west, east, south, north). Row i + 1 is to the south, column j + 1 to the east:
+    lane k going east leaves (i, j) and enters (i, j + 1) as its lane k going east, and so on. Lanes without
+    a counterpart are wrapped around the grid (torus) or go to / come from one boundary VoidGenerator.
+    Roads are connected directly, so building time and memory grow linearly with the number of intersections;
+    use set_history(0) for big cities.
+
+    Roads are named <name>/Cross<i>_<j>/LineWLight<d>, .../Line<d> and .../Crossroad, d is the direction
+    of the crossroad; the boundary generator is <name>/Void.
+    """
+
+    def __init__(self, n_rows: int, n_cols: int, length: int, red: int, green: int, offsets=0, lanes=(1, 1, 1, 1),
+                 torus: bool = False, p_new: float = 0, random_walk: bool = False, rotate_in_case: bool = False,
+                 rotary_2: bool = False, name: str = "Grid", simulation: Simulation = None):
+        """
+
+        :param offsets: time offset of the lights, one for all intersections or an array (n_rows, n_cols);
+            south and north lanes are shifted by half of the cycle as in CrossroadAndLines
+        :param lanes: numbers of west, east, south and north lanes, the same for all intersections
+            or an array (n_rows, n_cols, 4)
+        :param torus: wrap the grid around instead of the boundary VoidGenerator, every lane must then have
+            a counterpart: the numbers of lanes of a side are the same along its row (west, east) or column
+            (south, north)
+        :param p_new: probability of a new car on every boundary lane per frame, 0 - the boundary only takes cars
+        :param random_walk: cars of the boundary get random routes
+        :param rotate_in_case: cars of the boundary may turn when stuck in a crossroad
+        """
+        self.simulation = simulation if simulation is not None else Simulation.current()
+        self.shape = (n_rows, n_cols)
+        self.lanes = np.broadcast_to(np.asarray(lanes, dtype="int64"), self.shape + (4,))
+        offsets = np.broadcast_to(np.asarray(offsets, dtype="int64"), self.shape)
+        if torus:
+            for side, axis in enumerate((1, 1, 0, 0)):
+                if (self.lanes[..., side] != np.roll(self.lanes[..., side], 1, axis=axis)).any():
+                    raise ValueError("Facing sides of neighbouring intersections must have the same numbers "
+                                     "of lanes on a torus")
+        first = len(self.simulation.roads)
+
+        self.crossroads: List[List[Crossroad]] = [[None] * n_cols for _ in range(n_rows)]
+        self.input_roads: List[List[List[LineWLight]]] = [[None] * n_cols for _ in range(n_rows)]
+        self.output_roads: List[List[List[Line]]] = [[None] * n_cols for _ in range(n_rows)]
+        for i in range(n_rows):
+            for j in range(n_cols):
+                self._intersection(i, j, length, red, green, int(offsets[i, j]), rotary_2, name)
+
+        self.void = None
+        if not torus:
+            self.void = VoidGenerator(p_new, random_walk, rotate_in_case=rotate_in_case, name=name + "/Void",
+                                      simulation=self.simulation)
+        self._connect(torus)
+        self.roads = self.simulation.roads[first:]
+
+    def _intersection(self, i: int, j: int, length: int, red: int, green: int, offset: int, rotary_2: bool,
+                      name: str):
+        prefix = "%s/Cross%d_%d/" % (name, i, j)
+        n_left, n_right, n_bottom, n_top = (int(n) for n in self.lanes[i, j])
+        n = n_left + n_right + n_bottom + n_top
+        inputs = [LineWLight(length, length - 2, red, green,
+                             offset + ((red + green) // 2 if d >= n_left + n_right else 0),
+                             name=prefix + "LineWLight%d" % d, simulation=self.simulation) for d in range(n)]
+        outputs = [Line(length, name=prefix + "Line%d" % d, simulation=self.simulation) for d in range(n)]
+        crossroad = Crossroad(n_left, n_right, n_bottom, n_top, rotary_2=rotary_2, name=prefix + "Crossroad",
+                              simulation=self.simulation)
+        for d in range(n):
+            inputs[d].add_output(crossroad, 0, d)
+            crossroad.add_output(outputs[d], d)
+
+        self.crossroads[i][j] = crossroad
+        self.input_roads[i][j] = inputs
+        self.output_roads[i][j] = outputs
+
+    def _directions(self, i: int, j: int, side: int) -> range:
+        """
+        :param side: 0 - west, 1 - east, 2 - south, 3 - north
+        :return: directions of the crossroad of (i, j) going to the side
+        """
+        start = int(self.lanes[i, j, :side].sum())
+        return range(start, start + int(self.lanes[i, j, side]))
+
+    def _connect(self, torus: bool):
+        n_rows, n_cols = self.shape
+        steps = ((0, -1), (0, 1), (1, 0), (-1, 0))
+        fed = set()
+        for i in range(n_rows):
+            for j in range(n_cols):
+                for side, (di, dj) in enumerate(steps):
+                    ni, nj = i + di, j + dj
+                    if torus:
+                        ni, nj = ni % n_rows, nj % n_cols
+                    inside = 0 <= ni < n_rows and 0 <= nj < n_cols
+                    targets = self._directions(ni, nj, side) if inside else range(0)
+                    for k, d in enumerate(self._directions(i, j, side)):
+                        line = self.output_roads[i][j][d]
+                        if k < len(targets):
+                            entrance = self.input_roads[ni][nj][targets[k]]
+                            line.add_output(entrance, 0, 0)
+                            fed.add(id(entrance))
+                        elif self.void is not None:
+                            line.add_output(self.void, 0, len(self.void._inputs))
+
+        if self.void is None:
+            return
+        for i in range(n_rows):
+            for j in range(n_cols):
+                for entrance in self.input_roads[i][j]:
+                    if id(entrance) not in fed:
+                        self.void.add_output(entrance, 0, 0)
+
+    def set_history(self, size: int = None, step: int = 1):
+        """
+        Change what is kept in history of all roads, see History
+        """
+        for road in self.roads:
+            road.set_history(size, step)
+
+    def get_stats(self):
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over all roads
+        """
+        return np.sum([road.get_stats() for road in self.roads], axis=0)
@@ -0,0 +1,158 @@
+"""
+Opt-in timing of the frame loop of a Simulation
+
+    with FrameProfiler(simulation) as profiler:
+        simulation.run(200)
+    print(profiler.summary())
+    profiler.to_csv("frames.csv")
+    profiler.to_chrome_trace("frames.json")      # chrome://tracing or ui.perfetto.dev
+
+While attached, the loops of Simulation.step_frame go over the roads of every phase through FrameProfiler.calls,
+which puts a clock around the call of every road. Without a profiler a phase only checks Simulation.profiler.
+"""
+import csv
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import numpy as np
+
+from .road_and_cars import Simulation, VoidGenerator
+
+PHASES = ["signals", "skip_frame", "move_cars", "step", "process_outputs"]
+ALL = "all"  # road type of the rows with the totals of a phase
+
+ROW = np.dtype([("frame", "int64"), ("phase", "U16"), ("road_type", "U16"), ("calls", "int64"),
+                ("seconds", "float64"), ("transfers", "int64"), ("blocked", "int64"), ("allocated", "int64")])
+
+
+class FrameProfiler:
+    """
+    Table with a row per frame, phase and road type (and one with road_type ALL per phase):
+        calls       roads evaluated in the phase (the LightScheduler in signals)
+        seconds     wall time of the calls, of the whole phase in ALL rows
+        transfers   cars received from other roads (process_outputs), by the type of the receiving road
+        blocked     cars refused by the next road (process_outputs), by the type of the road they didn't leave
+        allocated   change of the number of memory blocks of the interpreter (sys.getallocatedblocks)
+    """
+
+    def __init__(self, simulation: Simulation = None):
+        """
+        :param simulation: simulation to instrument, Simulation.current() by default
+        """
+        self.simulation = simulation if simulation is not None else Simulation.current()
+        self._rows: List[Tuple] = []
+        self._spans: List[Tuple[int, str, float, float]] = []  # frame, phase, start, duration
+        self._t0 = time.perf_counter()
+        self._arrived: Dict[int, int] = {}  # id of a void -> cars it had received
+
+    def attach(self):
+        self._arrived = {id(road): len(road.path_length) for road in self.simulation.roads
+                         if isinstance(road, VoidGenerator)}
+        self.simulation.profiler = self
+        return self
+
+    def detach(self):
+        if self.simulation.profiler is self:
+            self.simulation.profiler = None
+
+    def __enter__(self):
+        return self.attach()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.detach()
+
+    def clear(self):
+        self._rows, self._spans = [], []
+
+    def calls(self, simulation: Simulation, phase: str, roads):
+        """
+        Roads of a phase as the frame loop of the simulation goes over them (see Simulation._timed),
+        the time from yielding a road until the loop asks for the next one is the call of that road
+        """
+        frame = simulation.frame
+        start, blocks = time.perf_counter(), sys.getallocatedblocks()
+        types = defaultdict(lambda: [0, 0., 0, 0, 0])
+        for road in roads:
+            # process_outputs visits every road and leaves idle ones alone
+            outputs = phase == "process_outputs"
+            counted = not outputs or not road.is_idle()
+            refused = road._refused if outputs else 0
+            t, b = time.perf_counter(), sys.getallocatedblocks()
+            yield road
+            if not counted:
+                continue
+            totals = types[type(road).__name__]
+            totals[0] += 1
+            totals[1] += time.perf_counter() - t
+            totals[4] += sys.getallocatedblocks() - b
+            if outputs:
+                totals[3] += road._refused - refused
+
+        if phase == "process_outputs":
+            for road in simulation.roads:
+                types[type(road).__name__][2] += self._received(road)
+        self._phase(frame, phase, start, blocks, types)
+
+    def _received(self, road) -> int:
+        if isinstance(road, VoidGenerator):
+            n, self._arrived[id(road)] = len(road.path_length) - self._arrived.get(id(road), 0), len(road.path_length)
+            return n
+        return len(road._new_cars)
+
+    def _phase(self, frame: int, phase: str, start: float, blocks: int, types: Dict[str, list]):
+        duration = time.perf_counter() - start
+        allocated = sys.getallocatedblocks() - blocks
+        totals = np.sum([row for row in types.values()], axis=0) if types else np.zeros(5)
+        self._rows.append((frame, phase, ALL, int(totals[0]), duration, int(totals[2]), int(totals[3]), allocated))
+        self._rows.extend((frame, phase, name, *row) for name, row in types.items())
+        self._spans.append((frame, phase, start - self._t0, duration))
+
+    def table(self) -> np.ndarray:
+        """
+        :return: rows as a structured array with the fields of ROW
+        """
+        return np.array(self._rows, dtype=ROW)
+
+    def summary(self) -> np.ndarray:
+        """
+        :return: sums over the frames, a row per phase and road type sorted by seconds, frame is the no. of frames
+        """
+        totals = defaultdict(lambda: np.zeros(5))
+        for row in self._rows:
+            totals[row[1], row[2]] += row[3:]
+        n_frames = len(set(span[0] for span in self._spans))
+        rows = [(n_frames, phase, name, *values) for (phase, name), values in totals.items()]
+        return np.sort(np.array(rows, dtype=ROW), order="seconds")[::-1]
+
+    def to_csv(self, path: str):
+        with open(path, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(ROW.names)
+            writer.writerows(self._rows)
+
+    def to_chrome_trace(self, path: str):
+        """
+        Trace Event Format: a slice per frame and phase with the road types in args, counters of
+        transfers and blocked cars per frame
+        """
+        types = defaultdict(dict)
+        counters = defaultdict(lambda: [0, 0])
+        for frame, phase, name, calls, seconds, transfers, blocked, allocated in self._rows:
+            if name != ALL:
+                types[frame, phase][name] = dict(calls=int(calls), ms=seconds * 1e3)
+            else:
+                counters[frame][0] += transfers
+                counters[frame][1] += blocked
+
+        events = []
+        for frame, phase, start, duration in self._spans:
+            events.append(dict(name=phase, cat="frame", ph="X", pid=0, tid=0, ts=start * 1e6, dur=duration * 1e6,
+                               args=dict(frame=frame, **types[frame, phase])))
+            if phase == PHASES[-1]:
+                transfers, blocked = counters[frame]
+                events.append(dict(name="cars", ph="C", pid=0, ts=(start + duration) * 1e6,
+                                   args=dict(transfers=int(transfers), blocked=int(blocked))))
+        with open(path, "w") as fp:
+            json.dump(dict(traceEvents=events, displayTimeUnit="ms"), fp)
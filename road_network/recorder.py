@@ -0,0 +1,234 @@
+import struct
+from typing import List, Union
+import numpy as np
+
+from .road_and_cars import BaseRoad, LineWLight, VoidGenerator, Simulation
+from .vectorized import VectorizedEngine
+
+MAGIC = b"TRJ1"
+KEY, DELTA = 0, 1
+
+
+class TrajectoryRecorder:
+    """
+    Streams a simulation to a binary file as per-frame deltas
+
+    File layout (little-endian):
+        header      magic, number of roads, then for every road: rows, cols, light column (-1 if none), name
+        frame       uint8 kind, then
+                        key frame:    int32 occupancy of all cells, int8 state of all lights
+                        delta frame:  uint32 n_moves, uint32 n_lights,
+                                      int32 (n_moves, 4) with car id, road, old cell, new cell (-1 if none),
+                                      int32 (n_lights, 2) with light no., new state
+    Cells are flat indexes inside a road grid. VoidGenerators are not recorded.
+
+    Moment m of the file is what road.render(m) gives. A recorder set as Simulation.recorder is called
+    by the frame loop (Simulation.step_frame, run):
+        simulation.recorder = TrajectoryRecorder("run.trj", simulation.roads)
+        simulation.run(500)
+        simulation.recorder.close()
+        simulation.recorder = None
+    A loop of its own, e.g. with a VectorizedEngine, calls record() after move_cars and before step.
+    """
+
+    def __init__(self, path: str, source: Union[List[BaseRoad], VectorizedEngine] = None, keyframe_every: int = 0):
+        """
+
+        :param path: output file
+        :param source: roads (all roads of Simulation.current() by default) or a VectorizedEngine built on them
+        :param keyframe_every: write a full frame every n frames (0 - only the first one), speeds up seeking
+        """
+        self._engine = source if isinstance(source, VectorizedEngine) else None
+        roads = self._engine.roads if self._engine is not None else source
+        roads = list(roads) if roads is not None else list(Simulation.current().roads)
+        self.roads = [road for road in roads if not isinstance(road, VoidGenerator)]
+        self.lights = [road for road in self.roads if isinstance(road, LineWLight)]
+        self.keyframe_every = keyframe_every
+
+        sizes = np.array([road._road.size for road in self.roads], dtype="int64")
+        self._stop = np.cumsum(sizes)
+        self._start = self._stop - sizes
+        self._cell_road = np.repeat(np.arange(len(self.roads), dtype="int32"), sizes)
+        self._previous: np.ndarray = None
+        self._previous_lights: np.ndarray = None
+        self.n_frames = 0
+
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(self.roads)))
+        for road in self.roads:
+            name = str(road).encode("utf-8")
+            light = int(road.light_position[-1]) if isinstance(road, LineWLight) else -1
+            self._file.write(struct.pack("<IIiH", road._road.shape[0], road._road.shape[1], light, len(name)) + name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _state(self):
+        if self._engine is not None:
+            return self._engine._road.copy(), self._engine.lights.astype("int8")
+        if len(self.roads) == 0:
+            return np.zeros(0, dtype="int32"), np.zeros(0, dtype="int8")
+        occupancy = np.concatenate([road._road.ravel() for road in self.roads]).astype("int32")
+        return occupancy, np.array([road.light for road in self.lights], dtype="int8")
+
+    def record(self):
+        occupancy, lights = self._state()
+        if self._previous is None or (self.keyframe_every and self.n_frames % self.keyframe_every == 0):
+            self._file.write(struct.pack("<B", KEY))
+            self._file.write(occupancy.tobytes())
+            self._file.write(lights.tobytes())
+        else:
+            moves = self._moves(self._previous, occupancy)
+            changed = np.nonzero(lights != self._previous_lights)[0]
+            switches = np.stack((changed, lights[changed]), axis=1).astype("<i4")
+            self._file.write(struct.pack("<BII", DELTA, len(moves), len(switches)))
+            self._file.write(moves.tobytes())
+            self._file.write(switches.tobytes())
+
+        self._previous, self._previous_lights = occupancy, lights
+        self.n_frames += 1
+
+    def _moves(self, previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+        """
+        :return: int32 (n, 4) car id, road, old cell, new cell
+        """
+        changed = np.nonzero(previous != current)[0]
+        left = changed[previous[changed] != 0]
+        came = changed[current[changed] != 0]
+
+        n_roads = len(self.roads)
+        left_key = previous[left].astype("int64") * n_roads + self._cell_road[left]
+        came_key = current[came].astype("int64") * n_roads + self._cell_road[came]
+        _, i_left, i_came = np.intersect1d(left_key, came_key, return_indices=True)
+        only_left = np.setdiff1d(np.arange(len(left)), i_left)
+        only_came = np.setdiff1d(np.arange(len(came)), i_came)
+
+        old = np.concatenate((left[i_left], left[only_left], np.full(len(only_came), -1)))
+        new = np.concatenate((came[i_came], np.full(len(only_left), -1), came[only_came]))
+        cells = np.where(old >= 0, old, new)
+        moves = np.empty((len(cells), 4), dtype="<i4")
+        moves[:, 0] = np.where(old >= 0, previous[np.maximum(old, 0)], current[np.maximum(new, 0)])
+        moves[:, 1] = self._cell_road[cells]
+        moves[:, 2] = np.where(old >= 0, old - self._start[moves[:, 1]], -1)
+        moves[:, 3] = np.where(new >= 0, new - self._start[moves[:, 1]], -1)
+        return moves
+
+
+class TrajectoryReader:
+    """
+    Replays a file written by TrajectoryRecorder
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fp:
+            data = fp.read()
+        if data[:4] != MAGIC:
+            raise ValueError("{} is not a trajectory file".format(path))
+
+        n_roads, = struct.unpack_from("<I", data, 4)
+        pos = 8
+        self.names: List[str] = []
+        self.shapes = []
+        self.light_columns = []
+        for _ in range(n_roads):
+            rows, cols, light, length = struct.unpack_from("<IIiH", data, pos)
+            pos += 14
+            self.names.append(data[pos:pos + length].decode("utf-8"))
+            pos += length
+            self.shapes.append((rows, cols))
+            self.light_columns.append(light)
+
+        self._index = {name: i for i, name in enumerate(self.names)}
+        sizes = np.array([rows * cols for rows, cols in self.shapes], dtype="int64")
+        self._stop = np.cumsum(sizes)
+        self._start = self._stop - sizes
+        self._lights = [i for i, light in enumerate(self.light_columns) if light >= 0]
+        self._light_of = {road: k for k, road in enumerate(self._lights)}
+
+        self._data = data
+        self._frames = []  # (kind, offset) of every moment
+        n_cells, n_lights = int(sizes.sum()), len(self._lights)
+        while pos < len(data):
+            kind, = struct.unpack_from("<B", data, pos)
+            self._frames.append((kind, pos + 1))
+            if kind == KEY:
+                pos += 1 + 4 * n_cells + n_lights
+            else:
+                n_moves, n_switches = struct.unpack_from("<II", data, pos + 1)
+                pos += 9 + 16 * n_moves + 8 * n_switches
+
+        self._cursor = -1
+        self._occupancy = np.zeros(n_cells, dtype="int32")
+        self._light_state = np.zeros(n_lights, dtype="int8")
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _apply(self, moment: int):
+        kind, pos = self._frames[moment]
+        if kind == KEY:
+            n_cells = len(self._occupancy)
+            self._occupancy = np.frombuffer(self._data, dtype="<i4", count=n_cells, offset=pos).astype("int32")
+            self._light_state = np.frombuffer(self._data, dtype="int8", count=len(self._light_state),
+                                              offset=pos + 4 * n_cells).copy()
+            return
+
+        n_moves, n_switches = struct.unpack_from("<II", self._data, pos)
+        moves = np.frombuffer(self._data, dtype="<i4", count=4 * n_moves, offset=pos + 8).reshape((-1, 4))
+        switches = np.frombuffer(self._data, dtype="<i4", count=2 * n_switches,
+                                 offset=pos + 8 + 16 * n_moves).reshape((-1, 2))
+        start = self._start[moves[:, 1]]
+        old = moves[:, 2] >= 0
+        new = moves[:, 3] >= 0
+        self._occupancy[start[old] + moves[old, 2]] = 0
+        self._occupancy[start[new] + moves[new, 3]] = moves[new, 0]
+        self._light_state[switches[:, 0]] = switches[:, 1]
+
+    def seek(self, moment: int):
+        """
+        Restore state of the given moment
+        """
+        if moment < 0:
+            moment += len(self._frames)
+        if not 0 <= moment < len(self._frames):
+            raise IndexError("No such a moment")
+
+        if moment < self._cursor or self._cursor < 0:
+            self._cursor = max(i for i in range(moment + 1) if self._frames[i][0] == KEY) - 1
+        else:
+            keys = [i for i in range(self._cursor + 1, moment + 1) if self._frames[i][0] == KEY]
+            if keys:
+                self._cursor = keys[-1] - 1
+
+        while self._cursor < moment:
+            self._cursor += 1
+            self._apply(self._cursor)
+
+    def render(self, road: Union[str, int], moment: int = -1) -> np.ndarray:
+        """
+        Same picture as road.render(moment) gave during the recording
+        :param road: name or number of a road
+        """
+        i = self._index[road] if isinstance(road, str) else road
+        self.seek(moment)
+        grid = self._occupancy[self._start[i]:self._stop[i]].reshape(self.shapes[i]).copy()
+        if self.light_columns[i] < 0:
+            return grid
+
+        render = np.vstack((grid, np.zeros_like(grid)))
+        render[1, self.light_columns[i]] = self._light_state[self._light_of[i]] + 2
+        return render
+
+    def frames(self):
+        """
+        Iterate over flat occupancy of all recorded roads, moment by moment
+        """
+        for moment in range(len(self._frames)):
+            self.seek(moment)
+            yield self._occupancy.copy()
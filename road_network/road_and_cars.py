@@ -1,17 +1,536 @@
+import bisect
+import heapq
+import itertools
+import threading
 from typing import List, Tuple
 import numpy as np
 
+from . import kernels
+
 MAX_WAITING_TIME = 2
 speeds = [np.array([0, 0]), np.array([-1, 0]), np.array([0, -1]), np.array([1, 0]), np.array([0, 1])]
 
+# (row, col, speed code) -> new speed code for the rotary rule of a 4x4 crossroad
+ROTARY_TURNS = {(1, 1, 2): 3, (1, 1, 3): 2,
+                (1, 2, 2): 1, (1, 2, 1): 2,
+                (2, 1, 3): 4, (2, 1, 4): 3,
+                (2, 2, 1): 4, (2, 2, 4): 1}
+
+
+class RoutePool:
+    """
+    Routes of all cars in one shared int8 array
+
+    Route of car i is data[offset[i]:offset[i] + length[i]], cursor[i] is the number of passed points.
+    A new route of a car reuses the place of the old one when it fits, so respawned cars don't grow the pool.
+    """
+    columns = ("offset", "length", "room", "cursor")
+
+    def __init__(self, capacity: int = 1024):
+        self.data = np.zeros(capacity, dtype="int8")
+        self.size = 0
+        self.offset = np.zeros(capacity, dtype="int64")
+        self.length = np.zeros(capacity, dtype="int64")
+        self.room = np.zeros(capacity, dtype="int64")  # place taken in data
+        self.cursor = np.zeros(capacity, dtype="int64")
+
+    def __len__(self):
+        return len(self.offset)
+
+    def reserve(self, car_id: int):
+        """
+        Make sure that there is a row for car_id
+        """
+        if car_id < len(self):
+            return
+        grow = max(len(self), car_id + 1 - len(self))
+        for name in self.columns:
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate((column, np.zeros(grow, dtype=column.dtype))))
+
+    def _allocate(self, n: int) -> int:
+        """
+        :return: offset of n free points at the end of data
+        """
+        if self.size + n > len(self.data):
+            grow = max(len(self.data), self.size + n - len(self.data))
+            self.data = np.concatenate((self.data, np.zeros(grow, dtype="int8")))
+        offset = self.size
+        self.size += n
+        return offset
+
+    def set(self, car_id: int, route):
+        """
+        Give a car a new route and put it at the beginning
+        """
+        route = np.asarray(route, dtype="int8")
+        self.reserve(car_id)
+        n = len(route)
+        if n > self.room[car_id]:
+            self.offset[car_id] = self._allocate(n)
+            self.room[car_id] = n
+        start = self.offset[car_id]
+        self.data[start:start + n] = route
+        self.length[car_id] = n
+        self.cursor[car_id] = 0
+
+    def set_many(self, car_ids: np.ndarray, routes: np.ndarray):
+        """
+        Routes of equal length for many cars at once
+        :param routes: array (len(car_ids), length)
+        """
+        car_ids = np.asarray(car_ids, dtype="int64")
+        if len(car_ids) == 0:
+            return
+        self.reserve(int(car_ids.max()))
+        n, length = routes.shape
+        start = self._allocate(n * length)
+        self.data[start:start + n * length] = routes.ravel()
+        self.offset[car_ids] = start + np.arange(n) * length
+        self.length[car_ids] = length
+        self.room[car_ids] = length
+        self.cursor[car_ids] = 0
+
+    def get(self, car_id: int) -> np.ndarray:
+        start = self.offset[car_id]
+        return self.data[start:start + self.length[car_id]]
+
+    def peek(self, car_id: int) -> int:
+        """
+        :return: next point on the route, -1 at the end
+        """
+        cursor = self.cursor[car_id]
+        if cursor < self.length[car_id]:
+            return int(self.data[self.offset[car_id] + cursor])
+        return -1
+
+    def advance(self, car_id: int) -> int:
+        """
+        Pass the next point
+        :return: the point, -1 at the end
+        """
+        point = self.peek(car_id)
+        if point >= 0:
+            self.cursor[car_id] += 1
+        return point
+
+    def rollback(self, car_id: int):
+        """
+        Undo an advance that passed a point (not one that returned -1)
+        """
+        if self.cursor[car_id] > 0:
+            self.cursor[car_id] -= 1
+
+    def peek_many(self, car_ids: np.ndarray) -> np.ndarray:
+        cursor = self.cursor[car_ids]
+        has_point = cursor < self.length[car_ids]
+        points = np.full(len(car_ids), -1, dtype="int64")
+        points[has_point] = self.data[self.offset[car_ids][has_point] + cursor[has_point]]
+        return points
+
+    def advance_many(self, car_ids: np.ndarray):
+        """
+        advance for every car (ids must be unique)
+        """
+        car_ids = car_ids[self.cursor[car_ids] < self.length[car_ids]]
+        self.cursor[car_ids] += 1
+
+    def copy(self) -> "RoutePool":
+        pool = RoutePool(0)
+        pool.data = self.data.copy()
+        pool.size = self.size
+        for name in self.columns:
+            setattr(pool, name, getattr(self, name).copy())
+        return pool
+
+
+class CarStore:
+    """
+    Columnar storage of cars, row i keeps the state of the car with id i
+    """
+    columns = ("coords", "speed_code", "counter", "moves", "destination", "rotate")
+
+    def __init__(self, capacity: int = 1024):
+        self.coords = np.zeros((capacity, 2), dtype="int64")
+        self.speed_code = np.zeros(capacity, dtype="int8")
+        self.counter = np.zeros(capacity, dtype="int32")
+        self.moves = np.zeros(capacity, dtype="int64")
+        self.destination = np.full(capacity, -1, dtype="int64")
+        self.rotate = np.zeros(capacity, dtype="bool")
+        self.routes = RoutePool(capacity)
+
+    def __len__(self):
+        return len(self.speed_code)
+
+    def reserve(self, car_id: int):
+        """
+        Make sure that there is a row for car_id
+        """
+        if car_id < len(self):
+            return
+        grow = max(len(self), car_id + 1 - len(self))
+        for name in self.columns:
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate((column, np.zeros((grow,) + column.shape[1:], dtype=column.dtype))))
+        self.routes.reserve(car_id)
+
+    def add(self, car_id: int, route, destination: int, rotate: bool):
+        """
+        (Re)initialize row of a car
+        """
+        self.reserve(car_id)
+        self.coords[car_id] = 0
+        self.speed_code[car_id] = 0
+        self.counter[car_id] = 0
+        self.moves[car_id] = 0
+        self.destination[car_id] = destination
+        self.rotate[car_id] = rotate
+        self.routes.set(car_id, route)
+
+    def add_many(self, car_ids: np.ndarray, rotate: bool):
+        """
+        add for many cars without routes and destinations
+        """
+        car_ids = np.asarray(car_ids, dtype="int64")
+        if len(car_ids) == 0:
+            return
+        self.reserve(int(car_ids.max()))
+        self.coords[car_ids] = 0
+        self.speed_code[car_ids] = 0
+        self.counter[car_ids] = 0
+        self.moves[car_ids] = 0
+        self.destination[car_ids] = -1
+        self.rotate[car_ids] = rotate
+        self.routes.set_many(car_ids, np.zeros((len(car_ids), 0), dtype="int8"))
+
+
+class History:
+    """
+    Past frames of a road or a composite
+
+    Policies:
+        size=None        every kept frame is stored (default)
+        size=0           nothing is stored
+        size=N           last N kept frames in a preallocated ring buffer
+        step=k           only every k-th frame is kept
+    Moments are numbers of frames since the start, so a moment that was not kept raises IndexError.
+    """
+
+    def __init__(self, size: int = None, step: int = 1):
+        if size is not None and size < 0:
+            raise ValueError("size must be non-negative")
+        if step < 1:
+            raise ValueError("step must be positive")
+        self.size = size
+        self.step = step
+        self.n_frames = 0
+        self._frames: List[np.ndarray] = []
+        self._buffer: np.ndarray = None
+        self._n_kept = 0
+
+    def __len__(self):
+        return self.n_frames
+
+    def record(self, make_frame):
+        """
+        Register a new frame
+        :param make_frame: function returning the frame, called only if the frame is kept
+        """
+        moment = self.n_frames
+        self.n_frames += 1
+        if self.size == 0 or moment % self.step:
+            return
+
+        frame = make_frame()
+        if self.size is None:
+            self._frames.append(frame)
+            return
+
+        if self._buffer is None:
+            self._buffer = np.zeros((self.size,) + frame.shape, dtype=frame.dtype)
+        self._buffer[self._n_kept % self.size] = frame
+        self._n_kept += 1
+
+    def _first_kept(self):
+        if self.size is None:
+            return 0
+        return max(0, self._n_kept - self.size)
+
+    def __getitem__(self, moment: int) -> np.ndarray:
+        if moment < 0:
+            moment += self.n_frames
+        if not 0 <= moment < self.n_frames or moment % self.step or self.size == 0:
+            raise IndexError("No such a moment")
+
+        index = moment // self.step
+        if index < self._first_kept():
+            raise IndexError("No such a moment")
+        if self.size is None:
+            return self._frames[index]
+        return self._buffer[index % self.size]
+
+    def frames(self) -> List[np.ndarray]:
+        """
+        :return: kept frames from the oldest to the newest
+        """
+        if self.size is None:
+            return self._frames
+        return [self._buffer[i % self.size].copy() for i in range(self._first_kept(), self._n_kept)]
+
+    def tail(self, depth: int) -> List[np.ndarray]:
+        return self.frames()[-depth:]
+
+
+class RandomSource:
+    """
+    Seedable random numbers of a simulation, pre-drawn in blocks
+
+    Every purpose (spawning cars, routes, rotary rule, shuffles) has its own numpy Generator spawned
+    from one SeedSequence, so e.g. routes don't depend on how many shuffles happened before.
+    Uniforms are drawn `block` at a time and handed out from the buffer; the block size doesn't change
+    the numbers, only how often numpy is called.
+    """
+    streams = ("spawn", "route", "rotary", "shuffle")
+
+    def __init__(self, seed: int = None, block: int = 4096):
+        self.seed = seed
+        self.block = block
+        children = np.random.SeedSequence(seed).spawn(len(self.streams))
+        self._generators = {name: np.random.default_rng(child) for name, child in zip(self.streams, children)}
+        self._buffers = {name: np.zeros(0) for name in self.streams}
+        self._positions = {name: 0 for name in self.streams}
+
+    def peek(self, stream: str, n: int) -> np.ndarray:
+        """
+        :return: next n numbers in [0, 1) of the stream without taking them, see advance
+        """
+        buffer, pos = self._buffers[stream], self._positions[stream]
+        if pos + n > len(buffer):
+            buffer = np.concatenate((buffer[pos:], self._generators[stream].random(max(self.block, n))))
+            self._buffers[stream] = buffer
+            self._positions[stream] = pos = 0
+        return buffer[pos:pos + n]
+
+    def advance(self, stream: str, n: int):
+        """
+        Take n numbers of the stream
+        """
+        self._positions[stream] += n
+
+    def uniform(self, stream: str, n: int) -> np.ndarray:
+        """
+        :return: next n numbers in [0, 1) of the stream
+        """
+        numbers = self.peek(stream, n)
+        self._positions[stream] += n
+        return numbers
+
+    def _next(self, stream: str) -> float:
+        buffer, pos = self._buffers[stream], self._positions[stream]
+        if pos == len(buffer):
+            return float(self.uniform(stream, 1)[0])
+        self._positions[stream] = pos + 1
+        return float(buffer[pos])
+
+    def spawn(self, p: float) -> bool:
+        """
+        :return: whether a VoidGenerator lets a car out, true with probability p
+        """
+        return self._next("spawn") < p
+
+    def coin(self) -> bool:
+        return self._next("rotary") < .5
+
+    def coins(self, n: int) -> np.ndarray:
+        """
+        :return: n coins of the rotary rule, same as n calls of coin()
+        """
+        return self.uniform("rotary", n) < .5
+
+    def routes(self, n: int, p_rot: List = (), length: int = 100) -> np.ndarray:
+        """
+        Random walks of n cars, the same numbers as n calls of route()
+        :param p_rot: probabilities of outputs (0..3) for the first len(p_rot) crossroads, the rest is uniform
+        :return: int8 array (n, length) with no. of an output on every crossroad
+        """
+        u = self.uniform("route", n * length).reshape((n, length))
+        routes = np.minimum(u * 4, 3).astype("int8")
+        for i, p in enumerate(p_rot[:length]):
+            routes[:, i] = np.minimum(np.searchsorted(np.cumsum(p), u[:, i], side="right"), 3)
+        return routes
+
+    def route(self, p_rot: List = (), length: int = 100) -> np.ndarray:
+        """
+        :return: route of one car, see routes
+        """
+        return self.routes(1, p_rot, length)[0]
+
+    def permutation(self, n: int) -> np.ndarray:
+        """
+        Order of n shuffled items, nothing is drawn for n < 2
+        """
+        if n < 2:
+            return np.arange(n)
+        return np.argsort(self.uniform("shuffle", n), kind="stable")
+
+
+class SignalPlan:
+    """
+    Cyclic plan of one traffic light: phases of given durations, red or green
+
+    Frame t shows the phase covering cycle position (t + offset) % cycle, so the light of
+    LineWLight(red_dur, green_dur, time_offset) is SignalPlan.fixed(red_dur, green_dur, time_offset).
+    Plans are immutable and may be shared.
+    """
+
+    def __init__(self, phases: List[Tuple[int, bool]], offset: int = 0):
+        """
+
+        :param phases: (duration in frames, red) of every phase in order
+        :param offset: shift of the plan in frames
+        """
+        self.durations = tuple(int(duration) for duration, _ in phases)
+        self.red = tuple(bool(red) for _, red in phases)
+        self.cycle = sum(self.durations)
+        if self.cycle <= 0 or min(self.durations) < 0:
+            raise ValueError("Phases must have non-negative durations and a positive cycle")
+        self.offset = int(offset) % self.cycle
+        self._ends = list(itertools.accumulate(self.durations))
+
+    @staticmethod
+    def fixed(red_dur: int, green_dur: int, offset: int = 0) -> "SignalPlan":
+        """
+        Red for red_dur frames then green for green_dur frames
+        """
+        return SignalPlan([(red_dur, True), (green_dur, False)], offset)
+
+    def shifted(self, offset: int) -> "SignalPlan":
+        """
+        :return: the same phases with another offset
+        """
+        return SignalPlan(list(zip(self.durations, self.red)), offset)
+
+    def green_start(self) -> int:
+        """
+        :return: cycle position where green follows red (0 if the light never switches)
+        """
+        phases = [(end - duration, red) for end, duration, red in zip(self._ends, self.durations, self.red)
+                  if duration > 0]
+        for k, (start, red) in enumerate(phases):
+            if not red and phases[k - 1][1]:
+                return start
+        return 0
+
+    def at(self, frame: int) -> Tuple[bool, int]:
+        """
+        :return: whether the light is red at the frame, first frame of the next phase
+        """
+        position = (frame + self.offset) % self.cycle
+        phase = bisect.bisect_right(self._ends, position)
+        return self.red[phase], frame + self._ends[phase] - position
+
+
+class LightScheduler:
+    """
+    Current state of all traffic lights of a simulation
+
+    A light changes only at the end of its phase: a heap keeps (frame of the next switch, light)
+    and advance(frame) handles just the due entries, the rest of the lights cost nothing.
+    States are in arrays, `red` is the mask of lights that are red at `frame`.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.plans: List[SignalPlan] = []
+        self.frame = 0
+        self._red = np.zeros(capacity, dtype="bool")
+        self._next_switch = np.zeros(capacity, dtype="int64")
+        self._heap: List[Tuple[int, int]] = []
+
+    def __len__(self):
+        return len(self.plans)
+
+    @property
+    def red(self) -> np.ndarray:
+        return self._red[:len(self.plans)]
+
+    @property
+    def next_switch(self) -> np.ndarray:
+        return self._next_switch[:len(self.plans)]
+
+    def is_red(self, light: int) -> bool:
+        return bool(self._red[light])
+
+    def add(self, plan: SignalPlan) -> int:
+        """
+        Register a light
+        :return: no. of the light
+        """
+        light = len(self.plans)
+        if light == len(self._red):
+            self._red = np.concatenate((self._red, np.zeros(light, dtype="bool")))
+            self._next_switch = np.concatenate((self._next_switch, np.zeros(light, dtype="int64")))
+        self.plans.append(plan)
+        self._schedule(light)
+        return light
+
+    def set_plan(self, light: int, plan: SignalPlan):
+        self.plans[light] = plan
+        self._schedule(light)
+
+    def _schedule(self, light: int):
+        red, self._next_switch[light] = self.plans[light].at(self.frame)
+        self._red[light] = red
+        heapq.heappush(self._heap, (int(self._next_switch[light]), light))
+
+    def advance(self, frame: int):
+        """
+        Bring all lights to the frame, going back in time recomputes every light
+        """
+        if frame < self.frame:
+            self.frame, self._heap = frame, []
+            for light in range(len(self.plans)):
+                self._schedule(light)
+            return
+
+        self.frame = frame
+        heap = self._heap
+        while heap and heap[0][0] <= frame:
+            switch, light = heapq.heappop(heap)
+            if switch == self._next_switch[light]:  # entries left by set_plan are skipped
+                self._schedule(light)
+
+    def green_wave(self, lights: List[int], travel_time: int, start: int = 0):
+        """
+        Shift plans of consecutive lights so that light k turns green at start + k * travel_time
+        (modulo its cycle), cars going at travel_time frames per link meet green lights
+        """
+        for k, light in enumerate(lights):
+            plan = self.plans[light]
+            self.set_plan(light, plan.shifted(plan.green_start() - start - k * travel_time))
+
 
 class CarManager:
     all_cars: List = [None]
+    store: CarStore = CarStore()
+
+    @staticmethod
+    def reset():
+        CarManager.all_cars = [None]
+        CarManager.store = CarStore()
 
 
 class RoadManager:
     roads: List = []
     dict_road: dict = {}
+    signals: LightScheduler = LightScheduler()
+    _signals_roads: List = roads  # the list of roads the lights of signals belong to
+
+    @staticmethod
+    def reset():
+        RoadManager.roads = []
+        RoadManager.dict_road = {}
+        RoadManager.signals = LightScheduler()
+        RoadManager._signals_roads = RoadManager.roads
 
     @staticmethod
     def add_road(road):
@@ -43,27 +562,280 @@ class RoadManager:
         road1.add_output(road2, road1_direction, road2_direction)
 
 
+class Simulation:
+    """
+    Roads, cars, traffic lights, random generator and frame counter of one network
+
+    Roads and cars are registered in the simulation given to them or in the current one:
+        with Simulation(seed=1) as sim:
+            city = CrossroadAndLines4x4x4(10, 20, 10)
+        sim.run(500)
+    Outside of `with` the default simulation is used, it keeps everything in RoadManager and CarManager.
+    """
+    _local = threading.local()
+
+    def __init__(self, seed: int = None):
+        self.roads: List = []
+        self.dict_road: dict = {}
+        self.all_cars: List = [None]
+        self.store = CarStore()
+        self.signals = LightScheduler()
+        self.random = RandomSource(seed)
+        self.frame = 0
+        self.frame_stats = (0, 0, 0)  # n_cells, n_cars, n_moved_cars of the network on the last frame
+        self.profiler = None  # profiler.FrameProfiler evaluating the frames
+        self.recorder = None  # recorder.TrajectoryRecorder writing the frames
+
+    def seed(self, seed: int = None):
+        """
+        Restart random numbers from the given seed
+        """
+        self.random = RandomSource(seed)
+
+    def __enter__(self):
+        if not hasattr(Simulation._local, "stack"):
+            Simulation._local.stack = []
+        Simulation._local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Simulation._local.stack.pop()
+
+    @staticmethod
+    def current() -> "Simulation":
+        """
+        :return: innermost simulation entered with `with` in this thread, the default one otherwise
+        """
+        stack = getattr(Simulation._local, "stack", None)
+        return stack[-1] if stack else default_simulation
+
+    def add_road(self, road):
+        if self.dict_road.get(str(road)) is not None:
+            raise NameError("Name {} is taken".format(str(road)))
+        self.dict_road[str(road)] = road
+        self.roads.append(road)
+
+    def get_road(self, name: str):
+        if self.dict_road.get(name) is None:
+            raise NameError("Road {} isn't exist".format(name))
+        return self.dict_road[name]
+
+    def connect_roads_str(self, name_road1: str, name_road2: str, road2_direction: int = 0, road1_direction: int = 0):
+        self.get_road(name_road1).add_output(self.get_road(name_road2), road1_direction, road2_direction)
+
+    def freeze(self):
+        """
+        :return: topology.Topology of the roads
+        """
+        from .topology import Topology
+        return Topology.freeze(simulation=self)
+
+    def add_car(self, car) -> int:
+        """
+        Register a car
+        :return: id of the car
+        """
+        self.all_cars.append(car)
+        return len(self.all_cars) - 1
+
+    def step_frame(self):
+        """
+        Evaluate one frame of all roads, idle roads (see BaseRoad.is_idle) only skip the frame
+        """
+        self.move_and_step()
+        self.process_outputs()
+        self.frame += 1
+
+    def move_and_step(self):
+        """
+        First part of a frame: lights, move_cars and step of every road, roads don't touch each other here
+        """
+        for signals in self._timed("signals", (self.signals,)):
+            signals.advance(self.frame)
+
+        idle, active = split_idle(self.roads)
+        n_cells = n_cars = moved = 0
+        for road in self._timed("skip_frame", idle):
+            road.skip_frame(self.frame)
+            n_cells += road._idle_stats()[0]
+
+        for road in self._timed("move_cars", active):
+            road.move_cars(self.frame)
+
+        if self.recorder is not None:
+            self.recorder.record()
+
+        for road in self._timed("step", active):
+            cells, cars, moved_cars = road.step(self.frame)
+            n_cells += cells
+            n_cars += cars
+            moved += moved_cars
+        self.frame_stats = (n_cells, n_cars, moved)
+
+    def process_outputs(self):
+        """
+        Second part of a frame: cars are handed over to the next roads in the order of the roads
+        """
+        hand_over(self._timed("process_outputs", self.roads))
+
+    def _timed(self, phase: str, roads):
+        """
+        :return: the roads, or a generator of the profiler measuring the loop body of every road
+        """
+        return roads if self.profiler is None else self.profiler.calls(self, phase, roads)
+
+    def run(self, epochs: int):
+        for _ in range(epochs):
+            self.step_frame()
+
+    def get_stats(self) -> np.ndarray:
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over all roads
+        """
+        if len(self.roads) == 0:
+            return np.zeros((0, 3))
+        return np.sum([road.get_stats() for road in self.roads], axis=0)
+
+
+class _DefaultSimulation(Simulation):
+    """
+    Simulation backed by the globals of RoadManager and CarManager, seed it with default_simulation.seed()
+    """
+
+    def __init__(self):
+        self.random = RandomSource()
+        self.frame = 0
+        self.frame_stats = (0, 0, 0)
+        self.profiler = None
+        self.recorder = None
+
+    @property
+    def roads(self):
+        return RoadManager.roads
+
+    @property
+    def dict_road(self):
+        return RoadManager.dict_road
+
+    @property
+    def all_cars(self):
+        return CarManager.all_cars
+
+    @property
+    def store(self):
+        return CarManager.store
+
+    @property
+    def signals(self):
+        if RoadManager._signals_roads is not RoadManager.roads:
+            # the map was dropped by replacing RoadManager.roads (delete_map of the notebook), so are its lights
+            RoadManager.signals = LightScheduler()
+            RoadManager._signals_roads = RoadManager.roads
+        return RoadManager.signals
+
+
+default_simulation = _DefaultSimulation()
+
+
 class Car:
-    route = []
-    coords = np.array([0, 0])
-    speed = speeds[0]
-    speed_code = 0
-    to_output = 0
+    """
+    View on one row of the car store of a simulation
+    """
+    __slots__ = ("id", "_store")
 
-    def __init__(self, route: List[int] = None, destination_id: int = -1, rotate_in_case: bool = False):
+    def __init__(self, route: List[int] = None, destination_id: int = -1, rotate_in_case: bool = False,
+                 simulation: Simulation = None):
         """
 
         :param route: list with no. of an output on every crossroad
+        :param simulation: where to register the car, Simulation.current() by default
         """
-        self._hist = []
-        self.counter = 0
-        self.moves = 0
-        self.id = len(CarManager.all_cars)
-        CarManager.all_cars.append(self)
+        simulation = simulation if simulation is not None else Simulation.current()
+        self.id = simulation.add_car(self)
+        self._store = simulation.store
+        self._store.add(self.id, route if route is not None else (), destination_id, rotate_in_case)
 
-        self.route = route if route is not None else []
-        self.destination = destination_id
-        self.rotate = rotate_in_case
+    @staticmethod
+    def create_many(n: int, rotate_in_case: bool = False, simulation: Simulation = None) -> List["Car"]:
+        """
+        n cars without routes, registered at once
+        :return: cars with consecutive ids
+        """
+        simulation = simulation if simulation is not None else Simulation.current()
+        first = len(simulation.all_cars)
+        cars = [Car.__new__(Car) for _ in range(n)]
+        for car_id, car in enumerate(cars, first):
+            car.id = car_id
+            car._store = simulation.store
+        simulation.all_cars.extend(cars)
+        simulation.store.add_many(np.arange(first, first + n), rotate_in_case)
+        return cars
+
+    @property
+    def coords(self) -> np.ndarray:
+        """
+        View on the coordinates, changes as the car moves
+        """
+        return self._store.coords[self.id]
+
+    @coords.setter
+    def coords(self, coords: np.ndarray):
+        self._store.coords[self.id] = coords
+
+    @property
+    def speed_code(self) -> int:
+        return int(self._store.speed_code[self.id])
+
+    @property
+    def speed(self) -> np.ndarray:
+        return speeds[self._store.speed_code[self.id]]
+
+    @property
+    def counter(self) -> int:
+        return int(self._store.counter[self.id])
+
+    @counter.setter
+    def counter(self, value: int):
+        self._store.counter[self.id] = value
+
+    @property
+    def moves(self) -> int:
+        return int(self._store.moves[self.id])
+
+    @moves.setter
+    def moves(self, value: int):
+        self._store.moves[self.id] = value
+
+    @property
+    def destination(self) -> int:
+        return int(self._store.destination[self.id])
+
+    @destination.setter
+    def destination(self, value: int):
+        self._store.destination[self.id] = value
+
+    @property
+    def rotate(self) -> bool:
+        return bool(self._store.rotate[self.id])
+
+    @rotate.setter
+    def rotate(self, value: bool):
+        self._store.rotate[self.id] = value
+
+    @property
+    def route(self) -> List[int]:
+        """
+        Whole route, points before route_cursor are already passed
+        """
+        return self._store.routes.get(self.id).tolist()
+
+    @route.setter
+    def route(self, route: List[int]):
+        self._store.routes.set(self.id, route)
+
+    @property
+    def route_cursor(self) -> int:
+        return int(self._store.routes.cursor[self.id])
 
     def position(self):
         """
@@ -72,7 +844,7 @@ class Car:
         return self.coords
 
     def set_position(self, coords: np.ndarray):
-        self.coords = coords
+        self._store.coords[self.id] = coords
 
     def set_speed(self, new_speed: int):
         """
@@ -82,55 +854,64 @@ class Car:
         if type(new_speed) != int:
             raise TypeError
 
-        self.speed_code = new_speed
-
-        self.speed = speeds[new_speed]
+        self._store.speed_code[self.id] = new_speed
 
     def get_next_destination(self):
-        if len(self.route) > 0:
-            return self.route[0]
-        else:
-            return -1
+        return self._store.routes.peek(self.id)
 
     def next_point_on_route(self):
-        if len(self.route) > 0:
-            return self.route.pop(0)
+        return self._store.routes.advance(self.id)
 
-        return -1
+    def step_back_on_route(self):
+        """
+        Undo next_point_on_route, only if it didn't return -1
+        """
+        self._store.routes.rollback(self.id)
 
     def move(self, road):
         """
         Move a car on a trafic greed if possible
         :param road: road class on which moving
         """
-        if road.is_empty(self.coords + self.speed) > 0:
-            road.set_state(self.coords, 0)
-            road.set_state(self.coords + self.speed, self.id)
-            self.coords += self.speed
-            self.counter = 0
-            self.moves += 1
+        store = self._store
+        coords = store.coords[self.id]
+        target = coords + speeds[store.speed_code[self.id]]
+        if road.is_empty(target) > 0:
+            road.set_state(coords, 0)
+            road.set_state(target, self.id)
+            coords[:] = target
+            store.counter[self.id] = 0
+            store.moves[self.id] += 1
         else:
-            self.counter += 1
-        # self._hist.append(self.speed_code)
+            store.counter[self.id] += 1
 
 
 class BaseRoad:
 
-    def __init__(self, grid_size, shuffle: bool = True, name=None):
+    def __init__(self, grid_size, shuffle: bool = True, name=None, simulation: Simulation = None):
         self._road = np.zeros(grid_size, dtype="int32")
         self._next_state = self._road.copy()
 
-        self._history: List[np.ndarray] = []
+        self._history = History()
         self._inputs: List = []
         self._outputs: List = []
-        self._cars: List[Car] = []
+        self._cars: List[Car] = []  # removed cars leave None until the next step
+        self._slots: dict = {}  # car id -> index in self._cars
+        self._ids: np.ndarray = None  # ids of self._cars (0 for removed), built on demand
+        self._holes = 0
         self._new_cars: List[Car] = []
         self.shuffle = shuffle
 
-        self._stats: List[Tuple] = []  # (speed, n_cells, n_cars, n_moved)
+        self._stats = np.zeros((16, 3))  # n_cells, n_cars, n_moved of every frame, first _n_stats rows are used
+        self._n_stats = 0
+        self._n_skipped = 0  # idle frames after the used rows, their stats aren't written yet
+        self._n_cars = 0  # cars on _next_state
+        self._changed = 0  # cells where _next_state differs from _road
+        self._refused = 0  # cars the next road didn't take in process_output, read by the profiler
 
         self._name = name if name is not None else "road"
-        RoadManager.add_road(self)
+        self.simulation = simulation if simulation is not None else Simulation.current()
+        self.simulation.add_road(self)
 
     def __str__(self):
         return self._name
@@ -153,10 +934,24 @@ class BaseRoad:
         self._outputs[direction] = (output_road, inp_road_direction)
 
     def _get_car(self, car_id: int) -> Car:
-        car = list(filter(lambda x: x.id == car_id, self._cars))
-        if len(car) == 0:
+        slot = self._slots.get(car_id)
+        if slot is None:
             return None
-        return car[0]
+        return self._cars[slot]
+
+    def _car_ids(self) -> np.ndarray:
+        """
+        :return: ids of cars in the order they are moved, 0 for removed ones
+        """
+        if self._ids is None:
+            self._ids = np.array([car.id if car is not None else 0 for car in self._cars], dtype="int64")
+        return self._ids
+
+    def get_cars(self) -> List[Car]:
+        """
+        :return: cars on the road in the order they are moved (without cars added on this frame)
+        """
+        return [car for car in self._cars if car is not None]
 
     def add_car(self, car: Car, direction: int = 0) -> int:
         """
@@ -172,22 +967,56 @@ class BaseRoad:
         return 1
 
     def add_car_at_position_w_speed(self, cars: List[Car]):
-        for car in cars:
-            self.set_state(car.position(), car.id)
-            self._cars.append(car)
+        """
+        Put cars on their coordinates at once, a later car takes the cell of an earlier one
+        """
+        if len(cars) == 0:
+            return
+        ids = np.array([car.id for car in cars], dtype="int64")
+        coords = cars[0]._store.coords[ids]
+        cells = coords[:, 0] * self._road.shape[1] + coords[:, 1]
+        _, last = np.unique(cells[::-1], return_index=True)
+        last = len(ids) - 1 - last
+        self._next_state[coords[last, 0], coords[last, 1]] = ids[last]
+        self._n_cars = int(np.count_nonzero(self._next_state))
+        self._changed = int(np.count_nonzero(self._next_state != self._road))
+
+        self._slots.update(zip(ids.tolist(), range(len(self._cars), len(self._cars) + len(cars))))
+        self._cars.extend(cars)
+        self._ids = None
 
     def _remove_car(self, car_id: int):
-        car = self._get_car(car_id)
-        ind = list(map(lambda x: x[1], filter(lambda x: x[0].id == car_id, zip(self._cars, range(len(self._cars))))))
-        if len(ind) == 0:
+        slot = self._slots.pop(car_id, None)
+        if slot is None:
             return 0
-        self._cars.pop(ind[0])
-        # return car[0]
-        # try:
-        #     self._cars.remove(car)
+        self._cars[slot] = None
+        if self._ids is not None:
+            self._ids[slot] = 0
+        self._holes += 1
         return 1
-        # except ValueError:
-        #     return 0
+
+    def _update_cars(self):
+        """
+        Drop removed cars, shuffle and take cars added on the last frame
+        """
+        if self._holes:
+            self._cars = [car for car in self._cars if car is not None]
+            self._holes = 0
+
+        if self.shuffle:
+            order = self.simulation.random.permutation(len(self._cars))
+            self._cars = [self._cars[i] for i in order]
+
+        self._cars.extend(self._new_cars)
+        self._new_cars = []
+        self._slots = {car.id: i for i, car in enumerate(self._cars)}
+        self._ids = None
+
+    def set_history(self, size: int = None, step: int = 1):
+        """
+        Change what is kept in history, see History
+        """
+        self._history = History(size, step)
 
     def process_output(self, direction: int = 0):
         pass
@@ -195,6 +1024,12 @@ class BaseRoad:
     def process_outputs(self):
         return self.process_output()
 
+    def valid_speeds(self) -> np.ndarray:
+        """
+        :return: int8 array (rows, cols, 2) with speed codes a car may have in every cell (0 - none)
+        """
+        return np.zeros(self._road.shape + (2,), dtype="int8")
+
     def render(self, moment: int = -1):
         if moment < 0:
             return self._road.copy()
@@ -207,7 +1042,7 @@ class BaseRoad:
         if depth == 0:
             return [self.render()]
 
-        return self._history[-depth:] + [self.render()]
+        return self._history.tail(depth) + [self.render()]
 
     def is_empty(self, coords: np.ndarray):
         if 0 <= coords[0] < self._road.shape[0] and 0 <= coords[1] < self._road.shape[1]:
@@ -223,7 +1058,68 @@ class BaseRoad:
     def set_state(self, coords: np.ndarray, state: int):
         if coords.shape != (2,):
             raise ValueError("coords should be an array with 2 coordinates")
-        self._next_state[coords[0], coords[1]] = state
+        self._put(coords[0], coords[1], state)
+
+    def _put(self, row: int, col: int, state: int):
+        """
+        Write a cell of the next state, keeps number of cars and changed cells up to date
+        """
+        old = int(self._next_state[row, col])
+        current = int(self._road[row, col])
+        self._n_cars += (state != 0) - (old != 0)
+        self._changed += (state != current) - (old != current)
+        self._next_state[row, col] = state
+
+    def _swap(self) -> int:
+        """
+        Make the next state current
+        :return: number of cells changed on this frame
+        """
+        self._road = self._next_state
+        self._next_state = self._road.copy()
+        changed, self._changed = self._changed, 0
+        return changed
+
+    def _reserve_stats(self, n: int):
+        if self._n_stats + n > len(self._stats):
+            grow = max(len(self._stats), self._n_stats + n - len(self._stats))
+            self._stats = np.concatenate((self._stats, np.zeros((grow, 3))))
+
+    def _append_stats(self, n_cells, n_cars, moved) -> Tuple:
+        self._write_skipped()
+        self._reserve_stats(1)
+        self._stats[self._n_stats] = n_cells, n_cars, moved
+        self._n_stats += 1
+        return n_cells, n_cars, moved
+
+    def _idle_stats(self) -> Tuple:
+        """
+        :return: n_cells, n_cars, n_moved_cars of a frame without cars
+        """
+        return self._road.size, 0, 0
+
+    def _write_skipped(self):
+        if self._n_skipped == 0:
+            return
+        self._reserve_stats(self._n_skipped)
+        self._stats[self._n_stats:self._n_stats + self._n_skipped] = self._idle_stats()
+        self._n_stats += self._n_skipped
+        self._n_skipped = 0
+
+    def is_idle(self) -> bool:
+        """
+        No cars on the road and none added: move_cars, step and process_outputs would only add empty stats.
+        A listed car missing from the grid (it shared a cell of the initial state) still moves onto it.
+        """
+        return self._n_cars == 0 and self._changed == 0 and not self._new_cars and \
+            all(car is None for car in self._cars)
+
+    def skip_frame(self, time_step=0):
+        """
+        Frame of an idle road instead of move_cars, step and process_outputs, gives the same history and stats
+        """
+        self._history.record(self.render)
+        self._n_skipped += 1
 
     def move_cars(self, frame=0):
         pass
@@ -233,27 +1129,69 @@ class BaseRoad:
         Complete evaluation and calculate speed
         :param time_step:
         :return:
-            tuple with speed, n_cells, n_cars, n_moved_cars
+            tuple with n_cells, n_cars, n_moved_cars
         """
-        if self.shuffle:
-            np.random.shuffle(self._cars)
+        self._update_cars()
 
-        self._history.append(self.render())
-        self._road = self._next_state
-        self._next_state = self._road.copy()
+        self._history.record(self.render)
+        changed = self._swap()
+        return self._append_stats(self._road.size, self._n_cars, changed // 2)
+
+    def get_stats(self) -> np.ndarray:
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars of every frame
+        """
+        self._write_skipped()
+        return self._stats[:self._n_stats]
+
+    def last_stats(self) -> Tuple:
+        """
+        :return: n_cells, n_cars, n_moved_cars of the last frame
+        """
+        if self._n_skipped:
+            return self._idle_stats()
+        return tuple(self._stats[self._n_stats - 1]) if self._n_stats else (0, 0, 0)
+
+
+def split_idle(roads) -> Tuple[List[BaseRoad], List[BaseRoad]]:
+    """
+    :return: idle roads (see BaseRoad.is_idle), which only skip the frame, and the others in their order
+    """
+    idle, active = [], []
+    for road in roads:
+        (idle if road.is_idle() else active).append(road)
+    return idle, active
 
-        self._cars.extend(self._new_cars)
-        self._new_cars = []
 
-        n_cars = np.sum(self._road != 0)
-        moved = ((self._history[-1] - self.render()) != 0).sum() // 2
-        # n_cars = np.max(n_cars, moved)
-        self._stats.append((self._road.shape[0]*self._road.shape[1], n_cars, moved))
-        # print(2, type(self))
-        return self._stats[-1]
+def hand_over(roads):
+    """
+    process_outputs of the roads that aren't idle, checked one by one as a road may get a car from an earlier one
+    """
+    for road in roads:
+        if not road.is_idle():
+            road.process_outputs()
 
-    def get_stats(self):
-        return self._stats
+
+class RoadGroup:
+    """
+    move_cars, step and process_outputs of a block of roads (see prebuild_set) over its `roads`
+    as Simulation.step_frame goes over them, idle roads only skip the frame
+    """
+    roads: List[BaseRoad]
+
+    def move_cars(self, frame=0):
+        for road in split_idle(self.roads)[1]:
+            road.move_cars(frame)
+
+    def step(self, frame=0):
+        idle, active = split_idle(self.roads)
+        for road in idle:
+            road.skip_frame(frame)
+        for road in active:
+            road.step(frame)
+
+    def process_outputs(self, frame=0):
+        hand_over(self.roads)
 
 
 class VoidGenerator(BaseRoad):
@@ -264,7 +1202,8 @@ class VoidGenerator(BaseRoad):
                  first_n: int = 0,
                  rotate_in_case: bool = False, **kwargs):
 
-        super(VoidGenerator, self).__init__((1, 1), name=kwargs.get("name", "void"))
+        super(VoidGenerator, self).__init__((1, 1), name=kwargs.get("name", "void"),
+                                            simulation=kwargs.get("simulation"))
         self.p_new = p_new
         self.random_walk = random_walk
         self.p_rot = p_rot if p_rot is not None else [.25, .25, .25, .25]
@@ -287,24 +1226,22 @@ class VoidGenerator(BaseRoad):
 
     def process_output(self, direction: int = 0):
 
-        if np.random.choice((0, 1), p=(1-self.p_new, self.p_new)) == 0:
+        if not self.simulation.random.spawn(self.p_new):
             return 1
 
         if len(self._cars) == 0:
-            self._cars.append(Car(rotate_in_case=self.rotate))
+            self._cars.append(Car(rotate_in_case=self.rotate, simulation=self.simulation))
 
         car = self._cars.pop()
         if self.random_walk:
-            car.route = []
-            for p in self.p_rot:
-                car.route.extend(np.random.choice((0, 1, 2, 3), 1, p=p).tolist())
-            car.route.extend(np.random.choice((0, 1, 2, 3), 100-len(self.p_rot)).tolist())
+            car.route = self.simulation.random.route(self.p_rot)
 
         if self._outputs[direction][0].add_car(car, self._outputs[0][1]):
             # car.moves += 1
             return 1
 
         self._cars.append(car)
+        self._refused += 1
         return 0
 
     def process_outputs(self):
@@ -315,15 +1252,17 @@ class VoidGenerator(BaseRoad):
                 continue
             self.process_output(i)
 
+    def is_idle(self) -> bool:
+        return False
+
     def step(self, time_step=0):
-        self._stats.append((0, 0, 0))
-        return 0, 0, 0
+        return self._append_stats(0, 0, 0)
 
 
 class Line(BaseRoad):
     
     def __init__(self, length, **kwargs):
-        super(Line, self).__init__((1, length), name=kwargs.get("name", "Line"))
+        super(Line, self).__init__((1, length), name=kwargs.get("name", "Line"), simulation=kwargs.get("simulation"))
         self.length = length
         self.beginning = np.array((0, 0))
         self.end = np.array((0, length-1))
@@ -341,12 +1280,17 @@ class Line(BaseRoad):
         if self._get_state(self.beginning) != 0:
             return 0
 
-        self._next_state[0, 0] = car.id
+        self._put(0, 0, car.id)
         car.set_position(self.beginning.copy())
         car.set_speed(4)
         car.moves += 1
         return super(Line, self).add_car(car, direction)
 
+    def valid_speeds(self) -> np.ndarray:
+        valid = super(Line, self).valid_speeds()
+        valid[0, :, 0] = 4
+        return valid
+
     def render(self):
         return self._road
 
@@ -374,6 +1318,7 @@ class Line(BaseRoad):
             return 1
 
         # car.route.insert(0, this)
+        self._refused += 1
         return 0
     
     def move_cars(self, time_step=0):
@@ -381,10 +1326,20 @@ class Line(BaseRoad):
         :param time_step:
         :return:
         """
+        if kernels.compiled is not None:
+            return self._move_compiled()
+
         for car in self._cars:
-            if (car.position() == self.end).all():
+            if car is None or (car.position() == self.end).all():
                 continue
             car.move(self)
+
+    def _move_compiled(self, stop: int = -1):
+        store = self.simulation.store
+        n_cars, changed = kernels.compiled.move_line(self._road, self._next_state, self._car_ids(), store.coords,
+                                                     store.speed_code, store.counter, store.moves, stop)
+        self._n_cars += n_cars
+        self._changed += changed
             
         # super(Line, self).step(time_step)
 
@@ -398,13 +1353,37 @@ class LineWLight(Line):
                  green_dur: int,
                  time_offset: int=0,
                  **kwargs):
-        super(LineWLight, self).__init__(length, name=kwargs.get("name", "LineWLights"));
+        """
+
+        :param plan: SignalPlan of the light instead of the fixed red_dur/green_dur one
+        """
+        super(LineWLight, self).__init__(length, name=kwargs.get("name", "LineWLights"),
+                                         simulation=kwargs.get("simulation"))
         self.light_position = np.array((0, light_position))
         self.red_dur = red_dur
         self.green_dur = green_dur
         self.time_offset = time_offset
         # self.direction = direction
-        self.light = int(time_offset%(red_dur+green_dur) < red_dur)
+        plan = kwargs.get("plan") or SignalPlan.fixed(red_dur, green_dur, time_offset)
+        self.signal = self.simulation.signals.add(plan)
+        self.light = int(plan.at(0)[0])
+
+    def _update_light(self, time_step):
+        signals = self.simulation.signals
+        signals.advance(time_step)
+        self.light = int(signals.is_red(self.signal))
+
+    def skip_frame(self, time_step=0):
+        self._update_light(time_step)
+        super(LineWLight, self).skip_frame(time_step)
+
+    @property
+    def plan(self) -> SignalPlan:
+        return self.simulation.signals.plans[self.signal]
+
+    @plan.setter
+    def plan(self, plan: SignalPlan):
+        self.simulation.signals.set_plan(self.signal, plan)
 
     def render(self):
         render = super(LineWLight, self).render()
@@ -417,9 +1396,12 @@ class LineWLight(Line):
         :param time_step:
         :return:
         """
-        self.light = int((time_step + self.time_offset) % (self.red_dur + self.green_dur) < self.red_dur)
+        self._update_light(time_step)
+        if kernels.compiled is not None:
+            return self._move_compiled(self.light_position[-1] if self.light else -1)
+
         for car in self._cars:
-            if (car.position() == self.end).all():
+            if car is None or (car.position() == self.end).all():
                 continue
 
             if (car.position() == self.light_position).all() and self.light:
@@ -433,31 +1415,22 @@ class LineWLight(Line):
         Complete evaluation and calculate speed
         :param time_step:
         :return:
-            tuple with speed, n_cells, n_cars, n_moved_cars
+            tuple with n_cells, n_cars, n_moved_cars
         """
-        if self.shuffle:
-            np.random.shuffle(self._cars)
+        self._update_cars()
 
-        self._history.append(self.render())
-        self._road = self._next_state
-        self._next_state = self._road.copy()
-
-        self._cars.extend(self._new_cars)
-        self._new_cars = []
-
-        n_cars = np.sum(self._road != 0)
-        moved = ((self._history[-1][0] - self.render()[0]) != 0).sum()/2
-        # n_cars = np.max(n_cars, moved)
+        self._history.record(self.render)
+        changed = self._swap()
         # speed = moved/n_cars if n_cars > 0 else 0
-        self._stats.append((self._road.shape[0]*self._road.shape[1], n_cars, moved))
-        # print(2, type(self))
-        return self._stats[-1]
+        return self._append_stats(self._road.size, self._n_cars, changed / 2)
 
 
 class Crossroad(BaseRoad):
-    
+    _tables: dict = {}  # geometry -> turn tables, shared by crossroads of the same shape
+
     def __init__(self, n_left, n_right, n_bottom, n_top, rotary_2: bool = False, **kwargs):
-        super(Crossroad, self).__init__((2+n_left+n_right, 2+n_top+n_bottom), name=kwargs.get("name", "crossroad"))
+        super(Crossroad, self).__init__((2+n_left+n_right, 2+n_top+n_bottom), name=kwargs.get("name", "crossroad"),
+                                        simulation=kwargs.get("simulation"))
         self.n_left = n_left
         self.n_right = n_right
         self.n_bottom = n_bottom
@@ -467,6 +1440,62 @@ class Crossroad(BaseRoad):
         self._outputs = [None] * n
         self._inputs = [None] * n
         self.rotary_rule_2 = rotary_2
+        self._rotary = rotary_2 and self._road.shape == (4, 4)
+        key = (n_left, n_right, n_bottom, n_top, self._rotary)
+        if key not in Crossroad._tables:
+            self._build_turn_tables()
+            Crossroad._tables[key] = self.exit_table, self.turn_table, self.rotary_table, self.stuck_table
+        self.exit_table, self.turn_table, self.rotary_table, self.stuck_table = Crossroad._tables[key]
+
+    def _build_turn_tables(self):
+        """
+        Lookup tables of move_cars, indexed by flat cell and speed code:
+            exit_table      the car waits for process_output
+            turn_table      new speed code for every destination (0..n-1) on the route
+            rotary_table    new speed code if the coin of the rotary rule 2 says so
+            stuck_table     two speed codes to try (0 - none) when a car with rotate_in_case waits too long
+        """
+        rows, cols = self._road.shape
+        vertical = self.n_bottom + self.n_top
+        horizontal = self.n_left + self.n_right
+        n = vertical + horizontal
+        codes = np.arange(len(speeds), dtype="int8")
+
+        self.exit_table = np.zeros((rows * cols, len(speeds)), dtype="bool")
+        self.turn_table = np.repeat(np.tile(codes, (rows * cols, 1))[:, :, None], n, axis=2)
+        self.rotary_table = np.tile(codes, (rows * cols, 1))
+        self.stuck_table = np.zeros((rows * cols, len(speeds), 2), dtype="int8")
+        for r in range(rows):
+            for c in range(cols):
+                cell = r * cols + c
+                self.exit_table[cell] = (False, r == 0, c == 0, r == vertical + 1, c == horizontal + 1)
+                for code in range(len(speeds)):
+                    if self._rotary:
+                        self.rotary_table[cell, code] = ROTARY_TURNS.get((r, c, code), code)
+                    if code % 2 == 0:
+                        self.stuck_table[cell, code] = (3 if c < self.n_bottom + 1 else 0,
+                                                        1 if self.n_bottom < c else 0)
+                    else:
+                        self.stuck_table[cell, code] = (2 if r < self.n_left + 1 else 0,
+                                                        4 if self.n_left < r else 0)
+
+                for dest in range(n):
+                    if horizontal <= dest and c == 1 + dest - horizontal:
+                        self.turn_table[cell, [2, 4], dest] = 3 if dest < vertical + self.n_bottom else 1
+                    if r == 1 + dest and c == r:
+                        self.turn_table[cell, [1, 3], dest] = 2 if dest < self.n_left else 4
+
+    def valid_speeds(self) -> np.ndarray:
+        """
+        Lanes as add_car enters them: rows 1..n_left go left, then n_right rows go right,
+        columns 1..n_bottom go down, then n_top columns go up; the corners are never used
+        """
+        valid = super(Crossroad, self).valid_speeds()
+        valid[1:1 + self.n_left, :, 0] = 2
+        valid[1 + self.n_left:1 + self.n_left + self.n_right, :, 0] = 4
+        valid[:, 1:1 + self.n_bottom, 1] = 3
+        valid[:, 1 + self.n_bottom:1 + self.n_bottom + self.n_top, 1] = 1
+        return valid
 
     def add_car(self, car: Car, direction: int = 0) -> int:
         """
@@ -548,13 +1577,15 @@ class Crossroad(BaseRoad):
             self.set_state(coords, 0)
             return 0
 
-        this = car.next_point_on_route()
+        passed = car.next_point_on_route()
         if self._outputs[direction][0].add_car(car, self._outputs[0][1]):
             self.set_state(coords, 0)
             self._remove_car(car_id)
             return 1
 
-        car.route.insert(0, this)
+        if passed >= 0:
+            car.step_back_on_route()
+        self._refused += 1
         return 0
 
     def process_outputs(self):
@@ -569,91 +1600,62 @@ class Crossroad(BaseRoad):
         :param time_step:
         :return:
         """
-        vertical = self.n_bottom + self.n_top
-        horizontal = self.n_left + self.n_right
+        if kernels.compiled is not None:
+            return self._move_compiled()
 
+        cols = self._road.shape[1]
+        n = self.turn_table.shape[2]
+        random = self.simulation.random
         for car in self._cars:
-            hor_speed = car.speed_code == 2 or car.speed_code == 4
-            vert_speed = car.speed_code == 1 or car.speed_code == 3
-            coords = car.position()
-
-            if car.speed_code == 2 and coords[1] == 0:
-                continue
-            elif car.speed_code == 4 and coords[1] == horizontal+1:
-                continue
-            elif car.speed_code == 1 and coords[0] == 0:
+            if car is None:
                 continue
-            elif car.speed_code == 3 and coords[0] == vertical+1:
+            coords = car.position()
+            code = car.speed_code
+            if self.exit_table[coords[0] * cols + coords[1], code]:
                 continue
 
             car.move(self)
-
-            next_dest = car.get_next_destination()
-
-            if coords[0] == 0 or car.coords[1] == 0 or coords[0] == self._road.shape[0] or coords[1] == self._road.shape[1]:
+            if coords[0] == 0 or coords[1] == 0:
                 continue
 
-            elif self.rotary_rule_2 and self._road.shape == (4, 4):
-                # print(car.id)
-                if np.random.choice((0, 1)):
-                    # print(car.id)
-                    if (car.position() == np.array([1, 1])).all():
-                        if car.speed_code == 2:
-                            car.set_speed(3)
-                        elif car.speed_code == 3:
-                            car.set_speed(2)
-                    elif (car.position() == np.array([1, 2])).all():
-                        if car.speed_code == 2:
-                            car.set_speed(1)
-                        elif car.speed_code == 1:
-                            car.set_speed(2)
-                    elif (car.position() == np.array([2, 1])).all():
-                        if car.speed_code == 3:
-                            car.set_speed(4)
-                        elif car.speed_code == 4:
-                            car.set_speed(3)
-                    elif (car.position() == np.array([2, 2])).all():
-                        if car.speed_code == 1:
-                            car.set_speed(4)
-                        elif car.speed_code == 4:
-                            car.set_speed(1)
+            cell = coords[0] * cols + coords[1]
+            if self._rotary:
+                if random.coin():
+                    car.set_speed(int(self.rotary_table[cell, code]))
 
             elif car.rotate and car.counter > MAX_WAITING_TIME:
-                if car.speed_code%2 == 0:
-                    if coords[1] < self.n_bottom + 1 and self.is_empty(coords + speeds[3]):
-                        car.set_speed(3)
-                    elif self.n_bottom < coords[1] and self.is_empty(coords + speeds[1]):
-                        car.set_speed(1)
-                elif (car.speed_code+1)%2 == 0:
-                    if coords[0] < self.n_left + 1 and self.is_empty(coords + speeds[2]):
-                        car.set_speed(2)
-                    elif self.n_left < coords[0] and self.is_empty(coords + speeds[4]):
-                        car.set_speed(4)
+                for option in self.stuck_table[cell, code]:
+                    if option and self.is_empty(coords + speeds[option]):
+                        car.set_speed(int(option))
+                        break
                 car.counter = 0
 
-            elif hor_speed and horizontal <= next_dest < vertical + horizontal: # horizontal cars
-                # print("1")
-                if (coords == np.array((coords[0], 1+next_dest - horizontal))).all():
-                    if next_dest < vertical + self.n_bottom:  # to bottom
-                        car.set_speed(3)
-                        # print("3")
-                    else:                           # to top
-                        car.set_speed(1)
-
-            elif vert_speed and 0 <= next_dest < vertical + horizontal:
-                # print("2")
-                if (coords == np.array((1 + next_dest, coords[0]))).all():
-                    if next_dest < self.n_left:
-                        car.set_speed(2)
-                    else:
-                        car.set_speed(4)
+            else:
+                dest = car.get_next_destination()
+                if 0 <= dest < n:
+                    car.set_speed(int(self.turn_table[cell, code, dest]))
+
+    def _move_compiled(self):
+        store = self.simulation.store
+        ids = self._car_ids()
+        destinations = store.routes.peek_many(ids)
+        random = self.simulation.random
+        coins = random.peek("rotary", len(ids)) if self._rotary else np.zeros(0)
+        n_cars, changed, used = kernels.compiled.move_crossroad(
+            self._road, self._next_state, ids, destinations, store.coords, store.speed_code, store.counter,
+            store.moves, store.rotate.view("uint8"), self.exit_table.view("uint8"), self.turn_table,
+            self.rotary_table, self.stuck_table, self._rotary, coins)
+        random.advance("rotary", used)
+        self._n_cars += n_cars
+        self._changed += changed
+
+    def _idle_stats(self) -> Tuple:
+        return self._road.size - 4, 0, 0
 
     def step(self, time_step=0):
-        super(Crossroad, self).step(time_step)
-        v1, v2, v3 = self._stats[-1]
-        v1 -= 4
-        self._stats[-1] = (v1, v2, v3)
-        return self._stats[-1]
+        n_cells, n_cars, moved = super(Crossroad, self).step(time_step)
+        self._stats[self._n_stats - 1, 0] -= 4
+        return n_cells - 4, n_cars, moved
 
     @property
     def border(self):
@@ -0,0 +1,273 @@
+"""
+A network split into regions, every region simulated in its own process
+
+    topology = sim.freeze()                                  # e.g. of a GridCity
+    sharded = ShardedSimulation(topology, grid_regions(topology, 10, 10), seed=0)
+    stats = sharded.run(500, "cars.bin")                     # array (n_frames, 3) as Simulation.get_stats
+
+Regions may only be linked by a Line or LineWLight handing cars to a line of another region (the Line -> LineWLight
+links between CrossroadAndLines blocks) and by links between lines and a VoidGenerator of another region (the
+boundary of an open GridCity). During move_cars and step roads don't touch each other, and the hand-off to a line
+only needs its first cell, which nothing else writes during process_outputs; a void takes every car. So a frame
+of a worker is
+    move_and_step, publish whether the first cell of every boundary line is free, barrier,
+    process_outputs (a car leaving through a boundary link is written to its slot), barrier,
+    put the cars of the slots on the boundary lines and voids
+and every car moves as it would in one process. Slots and flags live in shared memory, one slot per link
+as a link passes at most one car per frame. Every region has its own random numbers, runs are as random as
+one process but not the same numbers; an initial state of a density is placed once for the whole network.
+
+A car handed to a void of another region is counted in its path_length on the same frame, but it joins the cars
+the void sends out again only after the void's process_outputs of that frame. In one process a void later in
+the order of the roads (as the boundary void of GridCity) may send such a car out on the same frame, sharded it
+goes out a frame later at the earliest. This only matters for voids with p_new > 0, which draw their own random
+numbers anyway.
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import traceback
+from typing import Dict, List, Tuple, Union
+import numpy as np
+
+from .road_and_cars import Car, Simulation, VoidGenerator
+from .initials import load_cars, generate_cars, save_cars
+from .topology import Topology, VOID, LINE, LIGHT
+
+ROUTE_CAPACITY = 128  # longest rest of a route a car can take over a boundary
+CAR_FIELDS = 5  # counter, moves, destination, rotate, route length
+
+
+def regions_by_prefix(topology: Topology, depth: int = 1) -> np.ndarray:
+    """
+    Region of every road by the first `depth` parts of its name, e.g. BC0..BC3 of CrossroadAndLines4x4x4
+    with depth 1, its CrossroadAndLines2x2 blocks with depth 2. Roads with shorter names go to region 0.
+    :return: no. of the region of every road
+    """
+    labels = ["/".join(name.split("/")[:depth]) if name.count("/") >= depth else None for name in topology.names]
+    ordered = sorted(set(label for label in labels if label is not None))
+    index = {label: k for k, label in enumerate(ordered)}
+    return np.array([index.get(label, 0) for label in labels], dtype="int64")
+
+
+def grid_regions(topology: Topology, tile_rows: int, tile_cols: int) -> np.ndarray:
+    """
+    Regions of a GridCity as tiles of tile_rows x tile_cols intersections, roads outside the intersections
+    (the boundary VoidGenerator) go to region 0
+    :return: no. of the region of every road
+    """
+    tiles = []
+    for name in topology.names:
+        match = re.search(r"/Cross(\d+)_(\d+)(/|$)", name)
+        tiles.append((int(match.group(1)) // tile_rows, int(match.group(2)) // tile_cols) if match else None)
+    ordered = sorted(set(tile for tile in tiles if tile is not None))
+    index = {tile: k for k, tile in enumerate(ordered)}
+    return np.array([index.get(tile, 0) for tile in tiles], dtype="int64")
+
+
+class _Exchange:
+    """
+    Shared flags and slots of the boundary links
+    """
+
+    def __init__(self, n_links: int, route_capacity: int, context):
+        self.route_capacity = route_capacity
+        self.free = context.RawArray("b", max(n_links, 1))
+        self.sent = context.RawArray("b", max(n_links, 1))
+        self.cars = context.RawArray("q", max(n_links, 1) * CAR_FIELDS)
+        self.routes = context.RawArray("b", max(n_links, 1) * route_capacity)
+
+    def views(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        cars = np.frombuffer(self.cars, dtype="int64").reshape((-1, CAR_FIELDS))
+        routes = np.frombuffer(self.routes, dtype="int8").reshape((-1, self.route_capacity))
+        return np.frombuffer(self.free, dtype="int8"), np.frombuffer(self.sent, dtype="int8"), cars, routes
+
+
+class _Outlet:
+    """
+    Stands for a road of another region as the output of a boundary road, takes a car if the road is free
+    """
+
+    def __init__(self, link: int, views, pool: List[Car]):
+        self.link = link
+        self.free, self.sent, self.cars, self.routes = views
+        self.pool = pool
+
+    def add_car(self, car: Car, direction: int = 0) -> int:
+        if not self.free[self.link]:
+            return 0
+        store = car._store
+        rest = store.routes.get(car.id)[store.routes.cursor[car.id]:]
+        if len(rest) > self.routes.shape[1]:
+            raise ValueError("Route of car {} is longer than route_capacity".format(car.id))
+        self.cars[self.link] = (store.counter[car.id], store.moves[car.id], store.destination[car.id],
+                                store.rotate[car.id], len(rest))
+        self.routes[self.link, :len(rest)] = rest
+        self.sent[self.link] = 1
+        self.free[self.link] = 0
+        self.pool.append(car)  # the line drops it, the id serves a car coming in
+        return 1
+
+
+def _receive(simulation: Simulation, link: int, road, direction: int, views, pool: List[Car]):
+    """
+    Put the car of the slot of a link on its road, after process_outputs of the frame (see the module on voids)
+    """
+    free, sent, cars, routes = views
+    counter, moves, destination, rotate, length = cars[link].tolist()
+    car = pool.pop() if pool else Car(simulation=simulation)
+    store = simulation.store
+    store.counter[car.id] = counter
+    store.moves[car.id] = moves
+    store.destination[car.id] = destination
+    store.rotate[car.id] = rotate
+    store.routes.set(car.id, routes[link, :length])
+    if not road.add_car(car, direction):
+        raise RuntimeError("Boundary line {} is taken".format(road))
+    sent[link] = 0
+
+
+def _shard(topology: Topology, ids: List[int], outgoing: List[Tuple[int, int, int, int]],
+           incoming: List[Tuple[int, int, int]], seed, cars: Union[str, None], random_walk: bool,
+           rotate_in_case: bool, epochs: int, exchange: _Exchange, barrier, results, region: int):
+    """
+    Worker of one region
+    :param outgoing: (link, source road, its output, input direction of the target) of the boundary links
+                     leaving the region
+    :param incoming: (link, target road, input direction) of the boundary links entering it
+    :param cars: file of initials.load_cars, empty roads if None
+    """
+    try:
+        simulation = Simulation(seed)
+        roads = dict(zip(ids, topology.build(simulation, ids=ids)))
+        for road in roads.values():
+            road.set_history(0)
+        if cars is not None:
+            load_cars(cars, random_walk, rotate_in_case, simulation=simulation, skip_missing=True)
+
+        views = exchange.views()
+        free = views[0]
+        pool: List[Car] = []
+        for link, source, output, direction in outgoing:
+            roads[source]._outputs[output] = (_Outlet(link, views, pool), direction)
+        entrances = [(link, roads[target], direction) for link, target, direction in incoming]
+
+        stats = np.zeros((epochs, 3))
+        for frame in range(epochs):
+            simulation.move_and_step()
+            for link, road, _ in entrances:
+                free[link] = isinstance(road, VoidGenerator) or road._next_state[0, 0] == 0
+            barrier.wait()
+            simulation.process_outputs()
+            barrier.wait()
+            for link, road, direction in entrances:
+                if views[1][link]:
+                    _receive(simulation, link, road, direction, views, pool)
+            stats[frame] = simulation.frame_stats
+            simulation.frame += 1
+        results.put((region, stats, None))
+    except BaseException:
+        barrier.abort()
+        results.put((region, None, traceback.format_exc()))
+
+
+class ShardedSimulation:
+    """
+    Regions of a topology simulated in parallel processes, see the module
+    """
+
+    def __init__(self, topology: Topology, regions: np.ndarray, seed: int = None,
+                 route_capacity: int = ROUTE_CAPACITY):
+        """
+        :param regions: no. of the region of every road, e.g. from regions_by_prefix or grid_regions
+        :param seed: seed of the random numbers, every region gets its own stream, and of initial states of a density
+        """
+        self.topology = topology
+        self.regions = np.asarray(regions, dtype="int64")
+        if len(self.regions) != len(topology):
+            raise ValueError("regions should have a region for every road")
+        self.n_regions = int(self.regions.max()) + 1 if len(self.regions) else 0
+        self.seed = seed
+        self.seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(self.n_regions)]
+        self.route_capacity = route_capacity
+        self.links = self._boundary_links()
+        self.region_stats: np.ndarray = None
+
+    def _boundary_links(self) -> List[Tuple[int, int, int, int]]:
+        """
+        :return: (source, its output, target, input direction) of every link between regions
+        """
+        topology, links = self.topology, []
+        lines = (LINE, LIGHT)
+        for road in range(len(topology)):
+            for output in range(topology.n_outputs(road)):
+                target, entrance = topology.output(road, output)
+                if target < 0 or self.regions[target] == self.regions[road]:
+                    continue
+                source_kind, target_kind = topology.kind[road], topology.kind[target]
+                if not (source_kind in lines and output == 0 and target_kind in lines + (VOID,) or
+                        source_kind == VOID and target_kind in lines):
+                    raise ValueError("Link {} -> {} between regions isn't a hand-off between lines or voids"
+                                     .format(topology.names[road], topology.names[target]))
+                if target_kind in lines and topology.params[target]["length"] < 2:
+                    raise ValueError("Line {} between regions is too short".format(topology.names[target]))
+                links.append((road, output, target, entrance))
+        return links
+
+    def run(self, epochs: int, cars: Union[str, float] = None, random_walk: bool = False,
+            rotate_in_case: bool = False) -> np.ndarray:
+        """
+        Start a worker per region from the initial state and run the frames
+        :param cars: file of initials.load_cars or density of initials.generate_cars, empty roads if None;
+                     a density state is the one of a single Simulation(seed) with generate_cars(seed=seed)
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over the network
+        """
+        if cars is None or isinstance(cars, str):
+            return self._run(epochs, cars, random_walk, rotate_in_case)
+
+        # one state for the whole network, the workers load their roads of it with the routes
+        with Simulation(self.seed) as simulation:
+            self.topology.build(simulation)
+            generate_cars(cars, random_walk, rotate_in_case, seed=self.seed, simulation=simulation)
+        fd, fname = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        try:
+            save_cars(fname, simulation)
+            return self._run(epochs, fname, False, rotate_in_case)
+        finally:
+            os.remove(fname)
+
+    def _run(self, epochs: int, cars: Union[str, None], random_walk: bool, rotate_in_case: bool) -> np.ndarray:
+        context = multiprocessing.get_context()
+        exchange = _Exchange(len(self.links), self.route_capacity, context)
+        barrier = context.Barrier(self.n_regions)
+        results = context.Queue()
+
+        workers = []
+        for region in range(self.n_regions):
+            ids = np.nonzero(self.regions == region)[0].tolist()
+            outgoing = [(k, source, output, entrance) for k, (source, output, _, entrance) in enumerate(self.links)
+                        if self.regions[source] == region]
+            incoming = [(k, target, entrance) for k, (_, _, target, entrance) in enumerate(self.links)
+                        if self.regions[target] == region]
+            worker = context.Process(target=_shard, args=(self.topology, ids, outgoing, incoming, self.seeds[region],
+                                                          cars, random_walk, rotate_in_case, epochs, exchange,
+                                                          barrier, results, region), daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        stats: Dict[int, np.ndarray] = {}
+        errors = []
+        for _ in workers:
+            region, region_stats, error = results.get()
+            stats[region] = region_stats
+            if error is not None:
+                errors.append("region {}: {}".format(region, error))
+        for worker in workers:
+            worker.join()
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+        self.region_stats = np.stack([stats[region] for region in range(self.n_regions)], axis=1)
+        return self.region_stats.sum(axis=1)
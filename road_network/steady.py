@@ -0,0 +1,103 @@
+"""
+Detection of the steady state of a run from its aggregated stats
+
+    monitor = SteadyState()
+    while not monitor.update(simulation.get_stats()) and simulation.frame < 5000:
+        simulation.run(monitor.check_every)
+    mean, half_width = monitor.mean, monitor.half_width     # density, speed, flow after the warm-up
+
+The warm-up is cut by MSER-5 (the truncation that minimizes the marginal standard error of batch means of 5
+frames). The run is stationary when the cut is in the first half of the frames and the confidence intervals of
+speed and flow, from batch means of the rest, are narrow enough.
+"""
+import numpy as np
+
+BATCH = 5  # frames in a batch of MSER-5
+
+
+def frame_values(stats: np.ndarray) -> np.ndarray:
+    """
+    Density, speed (0 without cars) and flow, the formulas of sweep.density_speed_flow and Ensemble
+    :param stats: array (..., 3) with n_cells, n_cars, n_moved_cars, e.g. (n_frames, 3) summed over the network
+    :return: array (..., 3) with density, speed and flow of every row
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        density = stats[..., 1] / stats[..., 0]
+        speed = stats[..., 2] / stats[..., 1]
+    speed[np.isnan(speed)] = 0
+    return np.stack((density, speed, speed * density), axis=-1)
+
+
+def mser(values: np.ndarray, batch: int = BATCH) -> int:
+    """
+    MSER truncation of a series
+    :return: number of frames to drop from the start, a multiple of batch
+    """
+    n = len(values) // batch
+    if n < 2:
+        return 0
+    means = values[:n * batch].reshape((n, batch)).mean(axis=1)
+    # for every cut d: sum of squares of means[d:] around their mean / (n - d)^2
+    tail = means[::-1]
+    count = np.arange(1, n + 1)
+    total = np.cumsum(tail)
+    squares = np.cumsum(tail ** 2)
+    errors = (squares - total ** 2 / count) / count ** 2
+    errors = errors[::-1][:n - 1]  # at least two batches are left
+    return int(np.argmin(errors)) * batch
+
+
+class SteadyState:
+    """
+    Online test of stationarity, update() is called with all stats of the run every check_every frames
+    """
+
+    def __init__(self, min_frames: int = 50, check_every: int = 25, n_batches: int = 20, rel_precision: float = .02,
+                 abs_precision: float = 1e-3, z: float = 1.96):
+        """
+        :param min_frames: frames to run before the first test
+        :param check_every: frames between tests (for the caller)
+        :param n_batches: batches of the frames after the warm-up for the confidence intervals
+        :param rel_precision: half width of the intervals of speed and flow relative to their means
+        :param abs_precision: half width that is always enough (for speed and flow near 0)
+        :param z: quantile of the normal distribution for the intervals, 1.96 gives 95%
+        """
+        self.min_frames = min_frames
+        self.check_every = check_every
+        self.n_batches = n_batches
+        self.rel_precision = rel_precision
+        self.abs_precision = abs_precision
+        self.z = z
+
+        self.n_frames = 0
+        self.warmup = 0
+        self.mean = np.zeros(3)
+        self.half_width = np.full(3, np.inf)
+        self.converged = False
+
+    def update(self, stats: np.ndarray) -> bool:
+        """
+        :param stats: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over the network, all frames
+        :return: True if the run is stationary and the intervals are narrow enough
+        """
+        values = frame_values(np.asarray(stats, dtype="float64"))
+        self.n_frames = len(values)
+        self.converged = False
+        if self.n_frames < max(self.min_frames, 2 * self.n_batches):
+            return False
+
+        # the slowest of speed and flow to settle decides
+        self.warmup = max(mser(values[:, 1]), mser(values[:, 2]))
+        kept = values[self.warmup:]
+        size = len(kept) // self.n_batches
+        if size == 0:
+            return False
+
+        kept = kept[len(kept) - size * self.n_batches:]
+        means = kept.reshape((self.n_batches, size, 3)).mean(axis=1)
+        self.mean = kept.mean(axis=0)
+        self.half_width = self.z * means.std(axis=0, ddof=1) / np.sqrt(self.n_batches)
+
+        precise = self.half_width[1:] <= self.rel_precision * np.abs(self.mean[1:]) + self.abs_precision
+        self.converged = bool(self.warmup <= self.n_frames // 2 and precise.all())
+        return self.converged
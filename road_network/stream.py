@@ -0,0 +1,158 @@
+"""
+Network statistics frame by frame, reduced while the simulation runs
+
+    mean, speeds = RunningMean(skip=50), Histogram("speed", np.linspace(0, 1, 21))
+    blocks = RegionBreakdown({"BC%d" % i: [r for r in sim.roads if str(r).startswith("BC%d/" % i)] for i in range(4)})
+    reduce(sim, 500, mean, speeds, blocks)
+    mean.mean["flow"], speeds.counts, blocks.mean()["BC0"]
+
+    for record in frames(engine, 500):          # or a Simulation
+        ...                                      # record.frame, record.density, ...
+
+Records are computed from Simulation.frame_stats or the stats returned by VectorizedEngine.step_frame,
+nothing is stacked over the roads or the frames.
+"""
+from typing import Dict, Iterator, List, NamedTuple, Union
+import numpy as np
+
+from .road_and_cars import BaseRoad, Simulation
+from .vectorized import VectorizedEngine
+
+FIELDS = ("n_cells", "n_cars", "n_moved_cars", "density", "speed", "flow")
+
+
+class FrameStats(NamedTuple):
+    frame: int
+    n_cells: float
+    n_cars: float
+    n_moved_cars: float
+    density: float
+    speed: float
+    flow: float
+
+
+def frame_stats(frame: int, n_cells: float, n_cars: float, n_moved_cars: float) -> FrameStats:
+    """
+    Record with density, speed and flow as in sweep.density_speed_flow (speed 0 without cars)
+    """
+    density = n_cars / n_cells if n_cells else 0.
+    speed = n_moved_cars / n_cars if n_cars else 0.
+    return FrameStats(frame, n_cells, n_cars, n_moved_cars, density, speed, speed * density)
+
+
+def frames(source: Union[Simulation, VectorizedEngine], epochs: int, first_frame: int = None) -> Iterator[FrameStats]:
+    """
+    Run the frames one by one and yield the stats of the network after each of them
+    :param source: simulation (its frame loop) or engine to run
+    :param first_frame: frame of the engine to start from, 0 by default (a simulation counts frames itself)
+    """
+    if isinstance(source, VectorizedEngine):
+        frame = first_frame if first_frame is not None else 0
+        for frame in range(frame, frame + epochs):
+            n_cells, n_cars, moved = source.step_frame(frame).sum(axis=0)
+            yield frame_stats(frame, n_cells, n_cars, moved)
+        return
+
+    for _ in range(epochs):
+        frame = source.frame
+        source.step_frame()
+        yield frame_stats(frame, *source.frame_stats)
+
+
+def reduce(source: Union[Simulation, VectorizedEngine], epochs: int, *reducers, first_frame: int = None) -> list:
+    """
+    Run the frames and feed every record to the reducers
+    :return: the reducers
+    """
+    for record in frames(source, epochs, first_frame):
+        for reducer in reducers:
+            reducer.update(record, source)
+    return list(reducers)
+
+
+class RunningMean:
+    """
+    Mean and variance of every field over the frames (Welford's algorithm)
+    """
+
+    def __init__(self, skip: int = 0):
+        """
+        :param skip: number of first frames left out (warm-up)
+        """
+        self.skip = skip
+        self.n = 0
+        self._seen = 0
+        self._mean = np.zeros(len(FIELDS))
+        self._m2 = np.zeros(len(FIELDS))
+
+    def update(self, record: FrameStats, source=None):
+        self._seen += 1
+        if self._seen <= self.skip:
+            return
+        values = np.array(record[1:], dtype="float64")
+        self.n += 1
+        delta = values - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (values - self._mean)
+
+    @property
+    def mean(self) -> Dict[str, float]:
+        return dict(zip(FIELDS, self._mean.tolist()))
+
+    @property
+    def var(self) -> Dict[str, float]:
+        var = self._m2 / (self.n - 1) if self.n > 1 else np.zeros(len(FIELDS))
+        return dict(zip(FIELDS, var.tolist()))
+
+
+class Histogram:
+    """
+    Counts of the values of one field per bin (values outside the bins go to the first or the last one)
+    """
+
+    def __init__(self, field: str, bins: np.ndarray):
+        if field not in FIELDS:
+            raise ValueError("Unknown field {}".format(field))
+        self.field = field
+        self.bins = np.asarray(bins, dtype="float64")
+        self.counts = np.zeros(len(self.bins) - 1, dtype="int64")
+
+    def update(self, record: FrameStats, source=None):
+        value = getattr(record, self.field)
+        k = int(np.searchsorted(self.bins, value, side="right")) - 1
+        self.counts[min(max(k, 0), len(self.counts) - 1)] += 1
+
+
+class RegionBreakdown:
+    """
+    Sums of n_cells, n_cars and n_moved_cars over the frames for groups of roads
+    """
+
+    def __init__(self, regions: Dict[str, List[BaseRoad]]):
+        self.regions = {name: list(roads) for name, roads in regions.items()}
+        self.totals = {name: np.zeros(3) for name in self.regions}
+        self.n = 0
+        self._rows: Dict[str, np.ndarray] = None  # rows of the roads in the stats of an engine
+
+    def update(self, record: FrameStats, source: Union[Simulation, VectorizedEngine]):
+        self.n += 1
+        if isinstance(source, VectorizedEngine):
+            if self._rows is None:
+                self._rows = {name: np.array([source._index[id(road)] for road in roads], dtype="int64")
+                              for name, roads in self.regions.items()}
+            stats = source.last_stats()
+            for name, rows in self._rows.items():
+                self.totals[name] += stats[rows].sum(axis=0)
+            return
+
+        for name, roads in self.regions.items():
+            totals = self.totals[name]
+            for road in roads:
+                totals += road.last_stats()
+
+    def mean(self) -> Dict[str, FrameStats]:
+        """
+        :return: region -> mean n_cells, n_cars, n_moved_cars per frame, density, speed and flow of the sums
+                 (frame is the number of frames)
+        """
+        return {name: frame_stats(self.n, *(totals / max(self.n, 1))) for name, totals in self.totals.items()}
@@ -0,0 +1,216 @@
+"""
+Density sweep over initial states
+
+    python -m road_network.sweep case1 case2 --epochs 500 --workers 8
+    python -m road_network.sweep case1 --densities 0.3 0.31 0.32
+    python -m road_network.sweep case1 --replicas 16
+    python -m road_network.sweep case1 --steady --epochs 5000
+
+Initial states are cars_init_*.json files or densities generated on the fly by initials.generate_cars.
+Every (case, initial state) pair is simulated in its own process with its own seed (as an ensemble.Ensemble
+of independent replicas with --replicas),
+results are saved as data/<case>_modeling.npy with rows (density, speed, flow).
+With --steady every run stops once steady.SteadyState finds it stationary (--epochs is the limit),
+the warm-up is left out of the means and data/<case>_steady.npy gets rows
+(half widths of the 95% intervals of density, speed and flow, warm-up, frames run); a run that doesn't settle
+within --epochs keeps the means over all frames and gets inf half widths.
+"""
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Union
+import numpy as np
+
+from .road_and_cars import Simulation
+from .prebuild_set import CrossroadAndLines4x4x4
+from .initials import load_cars, generate_cars
+from .vectorized import VectorizedEngine
+from .topology import Topology
+from .ensemble import Ensemble
+from .steady import SteadyState, frame_values
+
+CASES = {
+    "case1": dict(rotary_2=False, rotate_in_case=False, random_walk=False),
+    "case2": dict(rotary_2=False, rotate_in_case=False, random_walk=True),
+    "case3": dict(rotary_2=False, rotate_in_case=True, random_walk=True),
+    "case4": dict(rotary_2=True, rotate_in_case=False, random_walk=False),
+}
+
+RED = 20
+GREEN = 10
+EPOCHS = 500
+
+
+def initial_density(fname: str) -> float:
+    return float(re.search(r"cars_init_([0-9.]+)\.json$", fname).group(1).rstrip("."))
+
+
+def initial_files(directory: str = "initials") -> List[str]:
+    """
+    :return: initial states sorted by density, the full map (density 1) is skipped
+    """
+    files = glob.glob(os.path.join(directory, "cars_init_*.json"))
+    return sorted((f for f in files if initial_density(f) < 1), key=initial_density)
+
+
+def density_speed_flow(stats: np.ndarray) -> np.ndarray:
+    """
+    :param stats: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over the network
+    :return: mean density, speed and flow
+    """
+    return frame_values(stats).mean(axis=0)
+
+
+def city_topology(red: int = RED, green: int = GREEN, rotary_2: bool = False) -> Topology:
+    """
+    :return: frozen CrossroadAndLines4x4x4 map of the sweep
+    """
+    with Simulation() as simulation:
+        CrossroadAndLines4x4x4(10, red, green, rotary_2=rotary_2)
+    return simulation.freeze()
+
+
+def run_point(fname: Union[str, float], case: str, epochs: int = EPOCHS, red: int = RED, green: int = GREEN,
+              seed: int = 0, vectorized: bool = True, topology: Topology = None, replicas: int = 1,
+              steady: SteadyState = None) -> np.ndarray:
+    """
+    Simulate one initial state
+    :param fname: file with the initial state or density of a random one
+    :param epochs: frames to run, the limit with steady
+    :param topology: the map from city_topology(red, green, rotary_2 of the case), built here if not given
+    :param replicas: number of independent runs averaged together
+    :param steady: stop when the monitor finds the run stationary, see _run_frames
+    :return: mean density, speed and flow (with steady also see _run_frames)
+    """
+    config = CASES[case]
+    topology = topology if topology is not None else city_topology(red, green, config["rotary_2"])
+    if replicas > 1:
+        return _run_ensemble(fname, config, epochs, seed, vectorized, topology, replicas, steady)
+
+    simulation = Simulation(seed)
+    roads = topology.build(simulation)
+    for road in roads:
+        road.set_history(0)
+    if isinstance(fname, str):
+        load_cars(fname, config["random_walk"], config["rotate_in_case"], simulation=simulation)
+    else:
+        generate_cars(fname, config["random_walk"], config["rotate_in_case"], seed=seed, simulation=simulation)
+
+    # e.g. several cars on one cell, only the object model reproduces that
+    if vectorized and not VectorizedEngine.unsupported(roads, simulation):
+        engine = VectorizedEngine(roads, simulation=simulation)
+
+        def run(n):
+            engine.run(n, simulation.frame)
+            simulation.frame += n
+
+        return _run_frames(run, engine.get_total_stats, epochs, steady)
+    return _run_frames(simulation.run, simulation.get_stats, epochs, steady)
+
+
+def _run_ensemble(fname: Union[str, float], config: dict, epochs: int, seed: int, vectorized: bool,
+                  topology: Topology, replicas: int, steady: SteadyState = None) -> np.ndarray:
+    ensemble = Ensemble(topology, replicas, seed)
+    if isinstance(fname, str):
+        ensemble.load_cars(fname, config["random_walk"], config["rotate_in_case"])
+    else:
+        ensemble.generate_cars(fname, config["random_walk"], config["rotate_in_case"], seed=seed)
+    if steady is not None:
+        # one monitor on the stats summed over the replicas
+        return _run_frames(lambda n: ensemble.run(n, vectorized), lambda: ensemble.get_stats().sum(axis=1),
+                           epochs, steady)
+    ensemble.run(epochs, vectorized)
+    stats = ensemble.get_stats()
+    return np.mean([density_speed_flow(stats[:, r]) for r in range(replicas)], axis=0)
+
+
+def _run_frames(run, get_stats, epochs: int, steady: SteadyState = None) -> np.ndarray:
+    """
+    :param run: function running n more frames
+    :param get_stats: function giving array (n_frames, 3) of the stats summed over the network
+    :return: mean density, speed and flow over all frames; with steady the means after the warm-up,
+             half widths of their intervals, warm-up and frames run. If epochs weren't enough the means are
+             over all frames, with inf half widths and warm-up 0.
+    """
+    if steady is None:
+        run(epochs)
+        return density_speed_flow(get_stats())
+
+    frames = 0
+    while frames < epochs:
+        n = steady.check_every if frames >= steady.min_frames else steady.min_frames
+        n = min(n, epochs - frames)
+        run(n)
+        frames += n
+        if steady.update(get_stats()):
+            break
+    if not steady.converged:
+        return np.concatenate((density_speed_flow(get_stats()), np.full(3, np.inf), (0, frames)))
+    return np.concatenate((steady.mean, steady.half_width, (steady.warmup, frames)))
+
+
+def _run_task(task):
+    return run_point(*task)
+
+
+def sweep(cases: List[str], files: List[Union[str, float]] = None, epochs: int = EPOCHS, red: int = RED,
+          green: int = GREEN, seed: int = 0, workers: int = None, vectorized: bool = True,
+          replicas: int = 1, steady: SteadyState = None) -> Dict[str, np.ndarray]:
+    """
+    Run every case on every initial state in a process pool
+    :param files: initial states, see run_point; files of initials/ by default
+    :param replicas: independent runs averaged for every point
+    :param steady: monitor of every run (a copy per run), see run_point
+    :return: case -> array (n_files + 1, 3) of density, speed, flow; the last row is the jammed map (1, 0, 0).
+             With steady the rows also have the columns of _run_frames.
+    """
+    files = files if files is not None else initial_files()
+    tasks = [(fname, case) for case in cases for fname in files]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(tasks))]
+    topologies = {r2: city_topology(red, green, r2) for r2 in set(CASES[case]["rotary_2"] for case in cases)}
+    tasks = [(fname, case, epochs, red, green, s, vectorized, topologies[CASES[case]["rotary_2"]], replicas, steady)
+             for (fname, case), s in zip(tasks, seeds)]
+
+    with ProcessPoolExecutor(workers) as pool:
+        points = list(pool.map(_run_task, tasks))
+
+    results = {}
+    for k, case in enumerate(cases):
+        jammed = np.zeros(len(points[0]) if points else 3)
+        jammed[0] = 1
+        rows = points[k * len(files):(k + 1) * len(files)] + [jammed]
+        results[case] = np.array(rows)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Density-speed-flow sweep over initial states")
+    parser.add_argument("cases", nargs="*", default=sorted(CASES), choices=sorted(CASES))
+    parser.add_argument("--initials", default="initials", help="directory with cars_init_*.json")
+    parser.add_argument("--densities", type=float, nargs="+", help="random initial states instead of the files")
+    parser.add_argument("--data", default="data", help="where to save <case>_modeling.npy")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--red", type=int, default=RED)
+    parser.add_argument("--green", type=int, default=GREEN)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--objects", action="store_true", help="use the object model instead of VectorizedEngine")
+    parser.add_argument("--replicas", type=int, default=1, help="independent runs averaged for every point")
+    parser.add_argument("--steady", action="store_true", help="stop every run once it's stationary")
+    args = parser.parse_args(argv)
+
+    states = args.densities if args.densities else initial_files(args.initials)
+    results = sweep(args.cases, states, args.epochs, args.red, args.green,
+                    args.seed, args.workers, not args.objects, args.replicas,
+                    SteadyState() if args.steady else None)
+    for case, density_speed_flow_ in results.items():
+        np.save(os.path.join(args.data, "%s_modeling.npy" % case), density_speed_flow_[:, :3])
+        if args.steady:
+            np.save(os.path.join(args.data, "%s_steady.npy" % case), density_speed_flow_[:, 3:])
+        print(case, "saved")
+
+
+if __name__ == "__main__":
+    main()
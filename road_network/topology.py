@@ -0,0 +1,173 @@
+"""
+Frozen road network: integer road ids, CSR adjacency arrays and a name index
+
+    topology = Topology.freeze(simulation=sim)       # or sim.freeze()
+    topology.save("map.npz")
+    ...
+    with Simulation(seed) as other:
+        roads = Topology.load("map.npz").build()
+"""
+import json
+from typing import Dict, List, Tuple
+import numpy as np
+
+from .road_and_cars import BaseRoad, Line, LineWLight, Crossroad, VoidGenerator, Simulation, SignalPlan
+
+VOID, LINE, LIGHT, CROSS = 0, 1, 2, 3
+OUTSIDE = -2  # id of a connected road that isn't in the topology
+
+
+def road_kind(road: BaseRoad) -> int:
+    if isinstance(road, LineWLight):
+        return LIGHT
+    elif isinstance(road, Line):
+        return LINE
+    elif isinstance(road, Crossroad):
+        return CROSS
+    elif isinstance(road, VoidGenerator):
+        return VOID
+    raise TypeError("Unsupported road type {}".format(type(road).__name__))
+
+
+def _params(road: BaseRoad, kind: int) -> dict:
+    """
+    :return: arguments that build the same road, JSON-serializable
+    """
+    params = dict(name=str(road), shuffle=bool(road.shuffle))
+    if kind == VOID:
+        params.update(p_new=float(road.p_new), random_walk=bool(road.random_walk), rotate_in_case=bool(road.rotate),
+                      p_rot=[[float(p) for p in ps] for ps in road.p_rot])
+    elif kind in (LINE, LIGHT):
+        params.update(length=int(road.length))
+    if kind == LIGHT:
+        plan = road.plan
+        params.update(light_position=int(road.light_position[-1]), red_dur=int(road.red_dur),
+                      green_dur=int(road.green_dur), time_offset=int(road.time_offset),
+                      phases=[[d, r] for d, r in zip(plan.durations, plan.red)], plan_offset=plan.offset)
+    elif kind == CROSS:
+        params.update(n_left=int(road.n_left), n_right=int(road.n_right), n_bottom=int(road.n_bottom),
+                      n_top=int(road.n_top), rotary_2=bool(road.rotary_rule_2))
+    return params
+
+
+def _csr(rows: List[List[Tuple[int, int]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    ptr = np.zeros(len(rows) + 1, dtype="int64")
+    ptr[1:] = np.cumsum([len(row) for row in rows])
+    pairs = np.array([pair for row in rows for pair in row], dtype="int64").reshape((-1, 2))
+    return ptr, pairs[:, 0].copy(), pairs[:, 1].copy()
+
+
+class Topology:
+    """
+    Roads and connections of a network as plain arrays
+
+    Road i is the i-th road of the list it was frozen from, kind[i] is VOID, LINE, LIGHT or CROSS.
+    Output d of road i is out_road[out_ptr[i] + d] (-1 if not connected, OUTSIDE if the road isn't frozen),
+    entered through input out_input[out_ptr[i] + d] of that road. Inputs are stored the same way in
+    in_ptr, in_road and in_index (no. of the output of the source). Arrays and params are picklable,
+    so a topology can be sent to worker processes and rebuilt there with build().
+    """
+
+    def __init__(self, names: List[str], kind: np.ndarray, params: List[dict], out_ptr: np.ndarray,
+                 out_road: np.ndarray, out_input: np.ndarray, in_ptr: np.ndarray, in_road: np.ndarray,
+                 in_index: np.ndarray):
+        self.names = list(names)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self.kind = kind
+        self.params = params
+        self.out_ptr, self.out_road, self.out_input = out_ptr, out_road, out_input
+        self.in_ptr, self.in_road, self.in_index = in_ptr, in_road, in_index
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def freeze(roads: List[BaseRoad] = None, simulation: Simulation = None) -> "Topology":
+        """
+        :param roads: roads in the order of ids, all roads of the simulation by default
+        """
+        if roads is None:
+            simulation = simulation if simulation is not None else Simulation.current()
+            roads = simulation.roads
+        roads = list(roads)
+        ids = {id(road): i for i, road in enumerate(roads)}
+
+        def links(pairs):
+            return [(ids.get(id(pair[0]), OUTSIDE), pair[1]) if pair is not None else (-1, -1) for pair in pairs]
+
+        kind = np.array([road_kind(road) for road in roads], dtype="int8")
+        out_ptr, out_road, out_input = _csr([links(road._outputs) for road in roads])
+        in_ptr, in_road, in_index = _csr([links(road._inputs) for road in roads])
+        return Topology([str(road) for road in roads], kind, [_params(road, k) for road, k in zip(roads, kind)],
+                        out_ptr, out_road, out_input, in_ptr, in_road, in_index)
+
+    def road_id(self, name: str) -> int:
+        if name not in self.index:
+            raise NameError("Road {} isn't exist".format(name))
+        return self.index[name]
+
+    def n_outputs(self, road: int) -> int:
+        return int(self.out_ptr[road + 1] - self.out_ptr[road])
+
+    def output(self, road: int, direction: int) -> Tuple[int, int]:
+        """
+        :return: id of the road behind the output (see out_road) and its input direction, (-1, -1) if not connected
+        """
+        if not 0 <= direction < self.n_outputs(road):
+            return -1, -1
+        k = self.out_ptr[road] + direction
+        return int(self.out_road[k]), int(self.out_input[k])
+
+    def build(self, simulation: Simulation = None, prefix: str = "", ids: List[int] = None) -> List[BaseRoad]:
+        """
+        Create the roads and connect them like the frozen ones
+        :param simulation: where to register the roads, Simulation.current() by default
+        :param prefix: added to the names, to build several copies in one simulation
+        :param ids: build only these roads, links to the others are left unconnected
+        :return: roads in the order of ids
+        """
+        simulation = simulation if simulation is not None else Simulation.current()
+        ids = [int(i) for i in ids] if ids is not None else range(len(self))
+        roads = []
+        for i in ids:
+            kind, params = self.kind[i], self.params[i]
+            name = prefix + params["name"]
+            if kind == VOID:
+                p_rot = params["p_rot"] if params["p_rot"] else None
+                road = VoidGenerator(params["p_new"], params["random_walk"], p_rot, 0, params["rotate_in_case"],
+                                     name=name, simulation=simulation)
+            elif kind == LINE:
+                road = Line(params["length"], name=name, simulation=simulation)
+            elif kind == LIGHT:
+                plan = SignalPlan(params["phases"], params["plan_offset"])
+                road = LineWLight(params["length"], params["light_position"], params["red_dur"], params["green_dur"],
+                                  params["time_offset"], name=name, plan=plan, simulation=simulation)
+            else:
+                road = Crossroad(params["n_left"], params["n_right"], params["n_bottom"], params["n_top"],
+                                 params["rotary_2"], name=name, simulation=simulation)
+            road.shuffle = params["shuffle"]
+            roads.append(road)
+
+        built = dict(zip(ids, roads))
+        for i, road in built.items():
+            outputs, inputs = slice(self.out_ptr[i], self.out_ptr[i + 1]), slice(self.in_ptr[i], self.in_ptr[i + 1])
+            road._outputs = [self._link(built, t, k) for t, k in zip(self.out_road[outputs], self.out_input[outputs])]
+            road._inputs = [self._link(built, t, k) for t, k in zip(self.in_road[inputs], self.in_index[inputs])]
+        return roads
+
+    @staticmethod
+    def _link(roads: Dict[int, BaseRoad], road_id: int, k: int):
+        road_id = int(road_id)
+        return (roads[road_id], int(k)) if road_id in roads else None
+
+    def save(self, path: str):
+        np.savez(path, kind=self.kind, out_ptr=self.out_ptr, out_road=self.out_road, out_input=self.out_input,
+                 in_ptr=self.in_ptr, in_road=self.in_road, in_index=self.in_index,
+                 params=np.array(json.dumps(self.params)))
+
+    @staticmethod
+    def load(path: str) -> "Topology":
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            return Topology([p["name"] for p in params], data["kind"], params, data["out_ptr"], data["out_road"],
+                            data["out_input"], data["in_ptr"], data["in_road"], data["in_index"])
@@ -0,0 +1,645 @@
+from typing import List, Tuple
+import numpy as np
+
+from .road_and_cars import BaseRoad, Simulation, LightScheduler, speeds, MAX_WAITING_TIME
+from .topology import Topology, road_kind, VOID, LINE, LIGHT, CROSS
+
+SPEED_VECTORS = np.array(speeds, dtype="int64")
+
+
+class VectorizedEngine:
+    """
+    Steps a whole road network at once.
+
+    The roads are compiled into one flat occupancy array (plus the "next state" array) and every
+    frame is evaluated with batched NumPy operations:
+        - all cars on Line/LineWLight move in one pass, red lights (a copy of the lights' plans
+          in a LightScheduler) block LineWLight.light_position;
+        - crossroads are processed rank by rank (k-th car of every crossroad at once), which keeps
+          the order in which cars fight for a cell;
+        - hand-offs between roads are resolved in the order of the road list.
+
+    Every stream of the simulation's RandomSource is consumed in the same order as by
+    the object model, so for the same seed `get_stats` gives the same tuples as Simulation.run.
+    The engine works on its own copy of the state, road and car objects are not modified.
+    It can't reproduce every state of the object model (e.g. several cars on one cell of a dense
+    initial file); callers check a state with VectorizedEngine.unsupported before picking the engine.
+    """
+
+    def __init__(self, roads: List[BaseRoad] = None, simulation: Simulation = None):
+        """
+
+        :param roads: roads in the order they are evaluated, all roads of the simulation by default
+        :param simulation: owner of the cars and the random generator, Simulation.current() by default
+        """
+        self.simulation = simulation if simulation is not None else Simulation.current()
+        self.roads = list(roads) if roads is not None else list(self.simulation.roads)
+        reason = self.unsupported(self.roads, self.simulation)
+        if reason:
+            raise ValueError(reason)
+        self._index = {id(road): i for i, road in enumerate(self.roads)}
+        n_roads = len(self.roads)
+        self.topology = Topology.freeze(self.roads)
+
+        self._kind = self.topology.kind
+        self._start = np.zeros(n_roads, dtype="int64")
+        self._stop = np.zeros(n_roads, dtype="int64")
+        self._n_cells = np.zeros(n_roads, dtype="int64")
+
+        size = 0
+        for i, road in enumerate(self.roads):
+            if self._kind[i] != VOID:
+                self._start[i] = size
+                size += road._road.size
+                self._n_cells[i] = road._road.size - (4 if self._kind[i] == CROSS else 0)
+            self._stop[i] = size
+
+        self._road = np.zeros(size, dtype="int32")
+        self._next = np.zeros(size, dtype="int32")
+        self._listed = np.zeros(n_roads, dtype="int64")
+        self._arrived = np.zeros(n_roads, dtype="int64")
+
+        self._init_cars()
+        self._init_lines()
+        self._init_crossroads()
+        self._init_voids()
+        self._init_transfers()
+
+        self._shuffled = np.array([i for i in range(n_roads) if self._kind[i] != VOID], dtype="int64")
+        self._shuffled_x = np.array([self._cross_of.get(int(i), -1) for i in self._shuffled], dtype="int64")
+        self._stats = np.zeros((16, n_roads, 3))  # stats of every frame, first _n_stats rows are used
+        self._n_stats = 0
+
+    @staticmethod
+    def unsupported(roads: List[BaseRoad] = None, simulation: Simulation = None) -> str:
+        """
+        Why the engine can't reproduce the state of the roads, without building anything
+        :param roads: roads of the engine, all roads of the simulation by default
+        :return: the reason, "" if the engine supports the state
+        """
+        simulation = simulation if simulation is not None else Simulation.current()
+        roads = list(roads) if roads is not None else list(simulation.roads)
+        seen = set()
+        for road in roads:
+            kind = road_kind(road)
+            if kind not in (VOID, CROSS) and road.length < 2:
+                return "Road {} is too short".format(road)
+            next_grid = road._next_state.ravel() if kind != VOID else None
+            for car in road.get_cars() + road._new_cars:
+                if car.id in seen:
+                    return "Car {} is placed twice".format(car.id)
+                seen.add(car.id)
+                if kind == VOID:
+                    continue
+                if next_grid[int(car.coords[0]) * road._road.shape[1] + int(car.coords[1])] != car.id:
+                    return "Car {} doesn't own its cell on {}".format(car.id, road)
+                if kind != CROSS and car.speed_code == 2:
+                    return "Car {} drives backwards on {}".format(car.id, road)
+        return ""
+
+    def _init_cars(self):
+        n = len(self.simulation.all_cars)
+        store = self.simulation.store
+        store.reserve(n)
+        self._n_ids = n
+        self.car_cell = np.full(n, -1, dtype="int64")
+        self.car_speed = store.speed_code[:n].astype("int64")
+        self.car_counter = store.counter[:n].astype("int64")
+        self.car_moves = store.moves[:n].copy()
+        self.car_rotate = store.rotate[:n].copy()
+        self.routes = store.routes.copy()
+
+        # lines whose grid isn't settled yet (cars were put right on _next_state), order of cars matters there
+        self._line_order = {}
+        for i, road in enumerate(self.roads):
+            grid = road._road.ravel()
+            next_grid = road._next_state.ravel()
+            if self._kind[i] != VOID:
+                self._road[self._start[i]:self._stop[i]] = grid
+                self._next[self._start[i]:self._stop[i]] = next_grid
+
+            if self._kind[i] != VOID:
+                for car in road.get_cars() + road._new_cars:
+                    cell = int(car.coords[0]) * road._road.shape[1] + int(car.coords[1])
+                    self.car_cell[car.id] = self._start[i] + cell
+
+            listed = road.get_cars()
+            self._listed[i] = len(listed)
+            self._arrived[i] = len(road._new_cars)
+            if self._kind[i] in (LINE, LIGHT) and any(grid[self.car_cell[car.id] - self._start[i]] != car.id
+                                                      for car in listed):
+                self._line_order[i] = [car.id for car in listed]
+
+    def _new_car(self, rotate: bool) -> int:
+        car_id = self._n_ids
+        self._n_ids += 1
+        if car_id >= len(self.car_cell):
+            grow = max(16, len(self.car_cell))
+            self.car_cell = np.concatenate((self.car_cell, np.full(grow, -1, dtype="int64")))
+            self.car_speed = np.concatenate((self.car_speed, np.zeros(grow, dtype="int64")))
+            self.car_counter = np.concatenate((self.car_counter, np.zeros(grow, dtype="int64")))
+            self.car_moves = np.concatenate((self.car_moves, np.zeros(grow, dtype="int64")))
+            self.car_rotate = np.concatenate((self.car_rotate, np.zeros(grow, dtype="bool")))
+        self.car_rotate[car_id] = rotate
+        self.routes.set(car_id, ())
+        return car_id
+
+    def _next_destination(self, cars: np.ndarray) -> np.ndarray:
+        return self.routes.peek_many(cars)
+
+    def _init_lines(self):
+        lines = np.nonzero((self._kind == LINE) | (self._kind == LIGHT))[0]
+        cells = [np.arange(self._start[i], self._stop[i] - 1) for i in lines]
+        self._line_src = np.concatenate(cells) if len(cells) else np.zeros(0, dtype="int64")
+        # cells of line i are _line_src[_line_lo[i]:_line_lo[i] + length - 1]
+        self._line_lo = np.zeros(len(self.roads), dtype="int64")
+        self._line_lo[lines] = np.cumsum([0] + [len(c) for c in cells])[:-1]
+        self._line_dst = self._line_src + 1
+
+        lights = np.nonzero(self._kind == LIGHT)[0]
+        self._light_cell = np.array([self._start[i] + self.roads[i].light_position[1] for i in lights],
+                                    dtype="int64")
+        self.signals = LightScheduler()
+        for i in lights:
+            self.signals.add(self.roads[i].plan)
+        self.lights = np.array([self.roads[i].light for i in lights], dtype="int8")
+
+    def _init_crossroads(self):
+        crossroads = np.nonzero(self._kind == CROSS)[0]
+        self._cross_road = crossroads
+        self._cross_of = {int(road): x for x, road in enumerate(crossroads)}
+        self._cross_x = np.full(len(self.roads), -1, dtype="int64")
+        self._cross_x[crossroads] = np.arange(len(crossroads))
+        self._cross_off = self._start[crossroads]
+        shapes = np.array([self.roads[i]._road.shape for i in crossroads], dtype="int64").reshape((-1, 2))
+        self._cross_h = shapes[:, 0]
+        self._cross_w = shapes[:, 1]
+        self._cross_rotary = np.array([self.roads[i]._rotary for i in crossroads], dtype="bool")
+
+        self._cap = int(max(1, (self._cross_h * self._cross_w).max())) if len(crossroads) else 1
+        self._order = np.zeros((len(crossroads), self._cap), dtype="int64")
+        self._count = np.zeros(len(crossroads), dtype="int64")
+        self._new = np.zeros((len(crossroads), self._cap), dtype="int64")
+        self._new_count = np.zeros(len(crossroads), dtype="int64")
+        for x, i in enumerate(crossroads):
+            listed = [car.id for car in self.roads[i].get_cars()]
+            arrived = [car.id for car in self.roads[i]._new_cars]
+            self._order[x, :len(listed)] = listed
+            self._count[x] = len(listed)
+            self._new[x, :len(arrived)] = arrived
+            self._new_count[x] = len(arrived)
+
+        # turn tables of all crossroads indexed by flat cell of the network, see Crossroad._build_turn_tables
+        size, codes = len(self._road), np.arange(len(speeds), dtype="int8")
+        n_dest = max([self.roads[i].turn_table.shape[2] for i in crossroads] + [1])
+        self._exit_table = np.zeros((size, len(speeds)), dtype="bool")
+        self._turn_table = np.repeat(np.tile(codes, (size, 1))[:, :, None], n_dest, axis=2)
+        self._rotary_table = np.tile(codes, (size, 1))
+        self._stuck_table = np.zeros((size, len(speeds), 2), dtype="int8")
+        for i in crossroads:
+            road, cells = self.roads[i], slice(self._start[i], self._stop[i])
+            self._exit_table[cells] = road.exit_table
+            self._turn_table[cells, :, :road.turn_table.shape[2]] = road.turn_table
+            self._rotary_table[cells] = road.rotary_table
+            self._stuck_table[cells] = road.stuck_table
+
+    def _init_voids(self):
+        voids = np.nonzero(self._kind == VOID)[0]
+        self._void_road = voids
+        self._void_pool = [[car.id for car in self.roads[i]._cars] for i in voids]
+        self.path_length = [list(self.roads[i].path_length) for i in voids]
+
+    def _entrance(self, target: int, direction: int) -> Tuple[int, int]:
+        """
+        Cell and speed code of a car that enters the road (mirrors add_car)
+        :return: (flat cell, speed code), cell is -1 for a VoidGenerator
+        """
+        road = self.roads[target]
+        if self._kind[target] == VOID:
+            return -1, 0
+        if self._kind[target] != CROSS:
+            return int(self._start[target]), 4
+
+        edge = road._road.shape
+        n = road.n_left + road.n_right + road.n_bottom + road.n_top
+        if direction < 0 or direction >= n:
+            raise ValueError("Wrong direction {} for {}".format(direction, road))
+        if direction < road.n_left:
+            coords, speed = (direction + 1, edge[1] - 1), 2
+        elif direction < road.n_left + road.n_right:
+            coords, speed = (direction + 1, 0), 4
+        elif direction < road.n_left + road.n_right + road.n_bottom:
+            coords, speed = (0, direction - road.n_left - road.n_right + 1), 3
+        else:
+            coords, speed = (edge[0] - 1, direction - road.n_left - road.n_right + 1), 1
+        return int(self._start[target] + coords[0] * edge[1] + coords[1]), speed
+
+    def _target(self, i: int, direction: int) -> Tuple[int, int, int]:
+        """
+        Where a car leaving road i through `direction` goes to
+        :return: (target road index, flat cell, speed code)
+        """
+        target, _ = self.topology.output(i, direction)
+        if target < 0:
+            raise ValueError("Output of {} isn't in the road list".format(self.roads[i]))
+        # the objects always pass the input direction of the first output
+        first, entrance = self.topology.output(i, 0)
+        if first == -1:
+            raise ValueError("{} has no output 0".format(self.roads[i]))
+        cell, speed = self._entrance(target, entrance)
+        return target, cell, speed
+
+    def _init_transfers(self):
+        source, src_cell, target, tgt_cell, tgt_speed = [], [], [], [], []
+        self._void_targets = []
+        self._segments = []
+        lo = 0
+        for i, road in enumerate(self.roads):
+            if self._kind[i] == VOID:
+                self._segments.append((lo, len(source), len(self._void_targets)))
+                lo = len(source)
+                self._void_targets.append([self._target(i, d) if self.topology.output(i, d)[0] != -1 else None
+                                           for d in range(self.topology.n_outputs(i))])
+                continue
+
+            if self._kind[i] == CROSS:
+                n = road.n_left + road.n_right + road.n_bottom + road.n_top
+                edge = road._road.shape
+                for direction in range(n):
+                    if self.topology.output(i, direction)[0] == -1:
+                        continue
+                    if direction < road.n_left:
+                        coords = (direction + 1, 0)
+                    elif direction < road.n_left + road.n_right:
+                        coords = (direction + 1, edge[1] - 1)
+                    elif direction < road.n_left + road.n_right + road.n_bottom:
+                        coords = (edge[0] - 1, direction - road.n_left - road.n_right + 1)
+                    else:
+                        coords = (0, direction - road.n_left - road.n_right + 1)
+                    t, cell, speed = self._target(i, direction)
+                    source.append(i)
+                    src_cell.append(self._start[i] + coords[0] * edge[1] + coords[1])
+                    target.append(t)
+                    tgt_cell.append(cell)
+                    tgt_speed.append(speed)
+            elif self.topology.output(i, 0)[0] != -1:
+                t, cell, speed = self._target(i, 0)
+                source.append(i)
+                src_cell.append(self._stop[i] - 1)
+                target.append(t)
+                tgt_cell.append(cell)
+                tgt_speed.append(speed)
+        self._segments.append((lo, len(source), None))
+
+        self._tr_source = np.array(source, dtype="int64")
+        self._tr_src_cell = np.array(src_cell, dtype="int64")
+        self._tr_target = np.array(target, dtype="int64")
+        self._tr_tgt_cell = np.array(tgt_cell, dtype="int64")
+        self._tr_tgt_speed = np.array(tgt_speed, dtype="int64")
+
+    def _road_sums(self, mask: np.ndarray) -> np.ndarray:
+        cumulative = np.concatenate(([0], np.cumsum(mask, dtype="int64")))
+        return cumulative[self._stop] - cumulative[self._start]
+
+    def move_cars(self, time_step=0):
+        self._move_lines(time_step)
+        self._move_crossroads()
+
+    def _move_lines(self, time_step):
+        src = self._line_src
+        cars = self._road[src]
+        movable = cars != 0
+        blocked = np.zeros(len(self._road), dtype="bool")
+        if len(self._light_cell):
+            self.signals.advance(time_step)
+            red = self.signals.red
+            blocked[self._light_cell[red]] = True
+            self.lights = red.astype("int8")
+            movable &= ~blocked[src]
+
+        if self._line_order:
+            for i, order in self._line_order.items():
+                movable[self._line_lo[i]:self._line_lo[i] + self._stop[i] - self._start[i] - 1] = False
+                self._move_line_in_order(i, order, blocked)
+            self._line_order = {}
+
+        src = src[movable]
+        dst = self._line_dst[movable]
+        cars = cars[movable]
+        moved = (self.car_speed[cars] == 4) & (self._road[dst] == 0) & (self._next[dst] == 0)
+
+        self._next[src[moved]] = 0
+        self._next[dst[moved]] = cars[moved]
+        self.car_cell[cars[moved]] = dst[moved]
+        self.car_counter[cars[moved]] = 0
+        self.car_moves[cars[moved]] += 1
+        self.car_counter[cars[~moved]] += 1
+
+    def _move_line_in_order(self, i: int, order: List[int], blocked: np.ndarray):
+        end = self._stop[i] - 1
+        for car in order:
+            cell = self.car_cell[car]
+            if cell == end or blocked[cell]:
+                continue
+            if self.car_speed[car] == 4 and self._road[cell + 1] == 0 and self._next[cell + 1] == 0:
+                self._next[cell] = 0
+                self._next[cell + 1] = car
+                self.car_cell[car] = cell + 1
+                self.car_counter[car] = 0
+                self.car_moves[car] += 1
+            else:
+                self.car_counter[car] += 1
+
+    def _probe(self, xs, r, c):
+        """
+        Crossroad.is_empty for many cells
+        :return: (inside and not a corner, free in both states)
+        """
+        h = self._cross_h[xs]
+        w = self._cross_w[xs]
+        corner = ((r == 0) | (r == h - 1)) & ((c == 0) | (c == w - 1))
+        valid = (r >= 0) & (r < h) & (c >= 0) & (c < w) & ~corner
+        cell = np.where(valid, self._cross_off[xs] + r * w + c, 0)
+        free = valid & (self._road[cell] == 0) & (self._next[cell] == 0)
+        return valid, free
+
+    def _move_crossroads(self):
+        if len(self._count) == 0:
+            return
+
+        draw_keys, draw_cars = [], []
+        for k in range(int(self._count.max())):
+            xs = np.nonzero(self._count > k)[0]
+            cars = self._order[xs, k]
+            sc = self.car_speed[cars]
+            keep = ~self._exit_table[self.car_cell[cars], sc]
+            xs, cars, sc = xs[keep], cars[keep], sc[keep]
+            w = self._cross_w[xs]
+            local = self.car_cell[cars] - self._cross_off[xs]
+            r, c = local // w, local % w
+
+            dr, dc = SPEED_VECTORS[sc, 0], SPEED_VECTORS[sc, 1]
+            valid, free = self._probe(xs, r + dr, c + dc)
+            moved = valid & free
+            off = self._cross_off[xs]
+            src = off + r * w + c
+            dst = off + (r + dr) * w + c + dc
+            self._next[src[moved]] = 0
+            self._next[dst[moved]] = cars[moved]
+            self.car_cell[cars[moved]] = dst[moved]
+            self.car_counter[cars[moved]] = 0
+            self.car_moves[cars[moved]] += 1
+            self.car_counter[cars[~moved]] += 1
+            r = np.where(moved, r + dr, r)
+            c = np.where(moved, c + dc, c)
+            cell = self.car_cell[cars]
+
+            turning = (r != 0) & (c != 0)
+            rotary = turning & self._cross_rotary[xs]
+            if rotary.any():
+                draw_keys.append(xs[rotary] * self._cap + k)
+                draw_cars.append(cars[rotary])
+            turning &= ~self._cross_rotary[xs]
+
+            dest = self._next_destination(cars)
+            new_sc = sc.copy()
+
+            rotate = turning & self.car_rotate[cars] & (self.car_counter[cars] > MAX_WAITING_TIME)
+            if rotate.any():
+                first, second = self._stuck_table[cell, sc, 0], self._stuck_table[cell, sc, 1]
+                to_first = rotate & (first > 0) & \
+                    self._free_or_wall(xs, r + SPEED_VECTORS[first, 0], c + SPEED_VECTORS[first, 1])
+                to_second = rotate & ~to_first & (second > 0) & \
+                    self._free_or_wall(xs, r + SPEED_VECTORS[second, 0], c + SPEED_VECTORS[second, 1])
+                new_sc[to_first] = first[to_first]
+                new_sc[to_second] = second[to_second]
+                self.car_counter[cars[rotate]] = 0
+            turning &= ~rotate
+
+            turn = turning & (0 <= dest) & (dest < self._turn_table.shape[2])
+            new_sc[turn] = self._turn_table[cell[turn], sc[turn], dest[turn]]
+
+            self.car_speed[cars] = new_sc
+
+        if draw_keys:
+            keys = np.concatenate(draw_keys)
+            cars = np.concatenate(draw_cars)[np.argsort(keys)]
+            cars = cars[self.simulation.random.coins(len(cars))]
+            self.car_speed[cars] = self._rotary_table[self.car_cell[cars], self.car_speed[cars]]
+
+    def _shuffle(self):
+        """
+        Shuffle cars of all roads with one block of random numbers, the same permutations as
+        BaseRoad._update_cars gives road by road. Order of cars on lines doesn't matter here,
+        their numbers are only skipped.
+        """
+        sizes = np.where(self._shuffled_x >= 0, np.append(self._count, 0)[self._shuffled_x],
+                         self._listed[self._shuffled])
+        sizes[sizes < 2] = 0
+        u = self.simulation.random.uniform("shuffle", int(sizes.sum()))
+
+        cross = (self._shuffled_x >= 0) & (sizes > 0)
+        if not cross.any():
+            return
+        start = np.cumsum(sizes) - sizes
+        seg = np.repeat(np.nonzero(cross)[0], sizes[cross])
+        cols = np.arange(len(seg)) - np.repeat(np.cumsum(sizes[cross]) - sizes[cross], sizes[cross])
+        rows = self._shuffled_x[seg]
+        self._order[rows, cols] = self._order[rows, cols][np.lexsort((u[start[seg] + cols], seg))]
+
+    def _free_or_wall(self, xs, r, c):
+        """ Truth value of Crossroad.is_empty (-1 counts as true) """
+        valid, free = self._probe(xs, r, c)
+        return ~valid | free
+
+    def step(self, time_step=0) -> np.ndarray:
+        """
+        Complete evaluation and calculate statistics
+        :param time_step:
+        :return:
+            array (n_roads, 3) with n_cells, n_cars, n_moved_cars for every road
+        """
+        self._shuffle()
+
+        self._listed += self._arrived
+        self._arrived[:] = 0
+        if len(self._count):
+            rows, cols = np.nonzero(np.arange(self._cap) < self._new_count[:, None])
+            self._order[rows, self._count[rows] + cols] = self._new[rows, cols]
+            self._count += self._new_count
+            self._new_count[:] = 0
+
+        changed = self._road_sums(self._road != self._next)
+        self._road[:] = self._next
+
+        self._reserve_stats(1)
+        stats = self._stats[self._n_stats]
+        self._n_stats += 1
+        stats[:, 0] = self._n_cells
+        stats[:, 1] = self._road_sums(self._road != 0)
+        stats[:, 2] = np.where(self._kind == LIGHT, changed / 2, changed // 2)
+        stats[self._kind == VOID] = 0
+        return stats
+
+    def _reserve_stats(self, n: int):
+        if self._n_stats + n > len(self._stats):
+            grow = max(len(self._stats), self._n_stats + n - len(self._stats))
+            self._stats = np.concatenate((self._stats, np.zeros((grow,) + self._stats.shape[1:])))
+
+    def process_outputs(self):
+        for lo, hi, void in self._segments:
+            if hi > lo:
+                self._transfer(lo, hi)
+            if void is not None:
+                self._process_void(void)
+
+    def _transfer(self, lo: int, hi: int):
+        src_cell = self._tr_src_cell[lo:hi]
+        cars = self._next[src_cell]
+        present = np.nonzero(cars != 0)[0]
+        if len(present) == 0:
+            return
+
+        idx = present + lo
+        cars = cars[present]
+        tgt_cell = self._tr_tgt_cell[idx]
+        to_void = tgt_cell < 0
+        accepted = to_void.copy()
+        candidates = np.nonzero(~to_void & (self._next[np.where(to_void, 0, tgt_cell)] == 0))[0]
+        _, first = np.unique(tgt_cell[candidates], return_index=True)
+        accepted[candidates[first]] = True
+
+        idx, cars, tgt_cell, to_void = idx[accepted], cars[accepted], tgt_cell[accepted], to_void[accepted]
+        source, target = self._tr_source[idx], self._tr_target[idx]
+        self._next[self._tr_src_cell[idx]] = 0
+
+        from_cross = self._kind[source] == CROSS
+        out = cars[from_cross]
+        self.routes.advance_many(out)
+        if from_cross.any():
+            self._drop_from_crossroads(out, np.unique(self._cross_x[source[from_cross]]))
+        np.subtract.at(self._listed, source[~from_cross], 1)
+
+        for car, t in zip(cars[to_void].tolist(), target[to_void].tolist()):
+            v = int(np.searchsorted(self._void_road, t))
+            self._void_pool[v].append(car)
+            self.path_length[v].append(int(self.car_moves[car]) + 1)
+            self.car_moves[car] = 0
+            self.car_cell[car] = -1
+
+        on_grid = ~to_void
+        cars, tgt_cell, target = cars[on_grid], tgt_cell[on_grid], target[on_grid]
+        self._next[tgt_cell] = cars
+        self.car_cell[cars] = tgt_cell
+        self.car_speed[cars] = self._tr_tgt_speed[idx[on_grid]]
+        self.car_moves[cars] += 1
+
+        to_cross = self._kind[target] == CROSS
+        np.add.at(self._arrived, target[~to_cross], 1)
+        for car, t in zip(cars[to_cross].tolist(), target[to_cross].tolist()):
+            x = self._cross_of[t]
+            self._new[x, self._new_count[x]] = car
+            self._new_count[x] += 1
+
+    def _drop_from_crossroads(self, cars: np.ndarray, xs: np.ndarray):
+        """
+        Remove cars from the lists of crossroads xs
+        """
+        filled = np.arange(self._cap) < self._count[xs, None]
+        gone = filled & np.isin(self._order[xs], cars)
+        keep = filled & ~gone
+        order = np.argsort(~keep, axis=1, kind="stable")
+        self._order[xs] = np.take_along_axis(self._order[xs], order, axis=1)
+        self._count[xs] -= gone.sum(axis=1)
+
+    def _accept(self, car: int, target: int, cell: int, speed: int) -> int:
+        """ add_car of the target road for one car """
+        if cell < 0:
+            v = int(np.searchsorted(self._void_road, target))
+            self._void_pool[v].append(car)
+            self.path_length[v].append(int(self.car_moves[car]) + 1)
+            self.car_moves[car] = 0
+            self.car_cell[car] = -1
+            return 1
+
+        if self._next[cell] != 0:
+            return 0
+
+        self._next[cell] = car
+        self.car_cell[car] = cell
+        self.car_speed[car] = speed
+        self.car_moves[car] += 1
+        if self._kind[target] == CROSS:
+            x = self._cross_of[target]
+            self._new[x, self._new_count[x]] = car
+            self._new_count[x] += 1
+        else:
+            self._arrived[target] += 1
+        return 1
+
+    def _process_void(self, v: int):
+        void = self.roads[self._void_road[v]]
+        pool = self._void_pool[v]
+        random = self.simulation.random
+        for direction, output in enumerate(self._void_targets[v]):
+            if output is None:
+                continue
+
+            if not random.spawn(void.p_new):
+                continue
+
+            if len(pool) == 0:
+                pool.append(self._new_car(void.rotate))
+
+            car = pool.pop()
+            if void.random_walk:
+                self.routes.set(car, random.route(void.p_rot))
+
+            if not self._accept(car, *output):
+                pool.append(car)
+
+    def step_frame(self, frame: int) -> np.ndarray:
+        """
+        :return: stats of every road on the frame, see step
+        """
+        self.move_cars(frame)
+        stats = self.step(frame)
+        self.process_outputs()
+        return stats
+
+    def run(self, epochs: int, first_frame: int = 0):
+        self._reserve_stats(epochs)
+        for frame in range(first_frame, first_frame + epochs):
+            self.step_frame(frame)
+
+    def render(self, road: BaseRoad) -> np.ndarray:
+        i = self._index[id(road)]
+        if self._kind[i] == VOID:
+            return np.zeros((1, 1), dtype="int32")
+        return self._road[self._start[i]:self._stop[i]].reshape(road._road.shape).copy()
+
+    def get_stats(self, road: BaseRoad) -> np.ndarray:
+        """
+        Same array as road.get_stats() would give
+        """
+        return self._stats[:self._n_stats, self._index[id(road)]]
+
+    def last_stats(self) -> np.ndarray:
+        """
+        :return: array (n_roads, 3) with the stats of every road on the last frame
+        """
+        if self._n_stats == 0:
+            return np.zeros((len(self.roads), 3))
+        return self._stats[self._n_stats - 1]
+
+    def get_all_stats(self) -> np.ndarray:
+        """
+        :return: array (n_frames, n_roads, 3) with the stats of every road in the order of self.roads
+        """
+        return self._stats[:self._n_stats]
+
+    def get_total_stats(self) -> np.ndarray:
+        """
+        :return: array (n_frames, 3) with n_cells, n_cars, n_moved_cars summed over all roads
+        """
+        return self._stats[:self._n_stats].sum(axis=1)
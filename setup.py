@@ -0,0 +1,25 @@
+"""
+Installs road_network with the compiled car loops (road_network/_kernels.pyx) when Cython is available,
+without them otherwise, see road_network/kernels.py
+
+    pip install .
+    python setup.py build_ext --inplace
+"""
+from setuptools import setup, Extension
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    ext_modules = []
+else:
+    ext_modules = cythonize([Extension("road_network._kernels", ["road_network/_kernels.pyx"])],
+                            compiler_directives={"language_level": "3"})
+
+setup(
+    name="road_network",
+    version="0.1.0",
+    description="Cellular automaton model of traffic flow on a road network",
+    packages=["road_network"],
+    install_requires=["numpy"],
+    ext_modules=ext_modules,
+)
@@ -0,0 +1,53 @@
+"""
+Car loops of the backends against a recorded run of the original road_and_cars.py
+
+data/kernels_baseline.npz has the stats of every road of the map of "Traffic flow modelling"
+(CrossroadAndLines4x4x4 with red 20 and green 10) over the first frames from every initials/ state,
+with and without rotate_in_case, recorded before the backends were added. Roads don't shuffle their cars
+and rotary_2 is off, so the runs draw no random numbers and every backend must give the same stats.
+stats2 holds twice the stats (a LineWLight counts half moves) as int16.
+"""
+import os
+import numpy as np
+import pytest
+
+from road_network import kernels
+from road_network.road_and_cars import Simulation
+from road_network.prebuild_set import CrossroadAndLines4x4x4
+from road_network.initials import load_cars
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = np.load(os.path.join(ROOT, "tests", "data", "kernels_baseline.npz"))
+
+try:
+    from road_network import _kernels
+except ImportError:
+    _kernels = None
+
+
+@pytest.fixture(params=["python", pytest.param("compiled", marks=pytest.mark.skipif(
+    _kernels is None, reason="the extension isn't built"))])
+def backend(request):
+    previous = kernels.BACKEND
+    kernels.set_backend(request.param)
+    yield request.param
+    kernels.set_backend(previous)
+
+
+@pytest.mark.parametrize("state", range(len(BASELINE["densities"])),
+                         ids=["%s%s" % (density, "-rotate" if rotate else "")
+                              for density, rotate in zip(BASELINE["densities"], BASELINE["rotate"])])
+def test_backend_matches_baseline(backend, state):
+    density, rotate = str(BASELINE["densities"][state]), bool(BASELINE["rotate"][state])
+    expected = BASELINE["stats2"][state] / 2
+
+    with Simulation(0) as simulation:
+        CrossroadAndLines4x4x4(10, 20, 10)
+        for road in simulation.roads:
+            road.shuffle = False
+        load_cars(os.path.join(ROOT, "initials", "cars_init_%s.json" % density), rotate_in_case=rotate)
+    simulation.run(expected.shape[1])
+
+    assert [str(road) for road in simulation.roads] == list(BASELINE["names"])
+    for road, stats in zip(simulation.roads, expected):
+        np.testing.assert_array_equal(road.get_stats(), stats, err_msg=str(road))
@@ -0,0 +1,33 @@
+"""
+Trajectories recorded by the frame loop of a Simulation and replayed by TrajectoryReader
+"""
+import numpy as np
+import pytest
+
+from road_network.road_and_cars import Simulation, VoidGenerator
+from road_network.prebuild_set import GridCity
+from road_network.initials import generate_cars
+from road_network.recorder import TrajectoryRecorder, TrajectoryReader
+
+FRAMES = 60
+
+
+@pytest.mark.parametrize("keyframe_every", [0, 7])
+def test_replay_matches_history(tmp_path, keyframe_every):
+    with Simulation(0) as simulation:
+        GridCity(3, 3, 6, 4, 4, p_new=.3)
+        generate_cars(0.3, seed=0)
+    path = str(tmp_path / "run.trj")
+    simulation.recorder = TrajectoryRecorder(path, simulation.roads, keyframe_every)
+    simulation.run(FRAMES)
+    simulation.recorder.close()
+    simulation.recorder = None
+
+    reader = TrajectoryReader(path)
+    roads = [road for road in simulation.roads if not isinstance(road, VoidGenerator)]
+    assert len(reader) == FRAMES
+    assert reader.names == [str(road) for road in roads]
+    for moment in list(range(FRAMES)) + [FRAMES // 2, 3, FRAMES - 1]:  # forward, then seeking back
+        for road in roads:
+            np.testing.assert_array_equal(reader.render(str(road), moment), road._history[moment],
+                                          err_msg="%s at %d" % (road, moment))
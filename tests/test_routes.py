@@ -0,0 +1,27 @@
+"""
+Routes of cars a crossroad can't hand over: the car stays with the point it hasn't passed
+"""
+import numpy as np
+import pytest
+
+from road_network.road_and_cars import Simulation, Car, Crossroad, Line
+
+
+@pytest.mark.parametrize("route, passed, expected", [([0, 3], 1, 3), ([0], 1, -1)],
+                         ids=["on-route", "route-used-up"])
+def test_refused_car_keeps_route(route, passed, expected):
+    with Simulation(0) as simulation:
+        crossroad = Crossroad(1, 1, 1, 1)
+        line = Line(5)
+        crossroad.add_output(line, 0)
+        line.add_car(Car())  # takes the first cell of the line
+        car = Car(route=route)
+        for _ in range(passed):
+            car.next_point_on_route()
+        car.set_position(np.array((1, 0)))  # waits at output 0
+        car.set_speed(2)
+        crossroad.add_car_at_position_w_speed([car])
+
+    assert car.get_next_destination() == expected
+    assert crossroad.process_output(0) == 0
+    assert car.get_next_destination() == expected
@@ -0,0 +1,44 @@
+"""
+ShardedSimulation against one process on the map of "Traffic flow modelling"
+"""
+import os
+import numpy as np
+import pytest
+
+from road_network.road_and_cars import Simulation
+from road_network.initials import load_cars, generate_cars
+from road_network.sharding import ShardedSimulation, regions_by_prefix
+from road_network.sweep import city_topology
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRAMES = 100
+
+
+@pytest.fixture(scope="module")
+def topology():
+    topology = city_topology()
+    for params in topology.params:
+        params["shuffle"] = False  # roads draw no random numbers, regions and one process give the same run
+    return topology
+
+
+def single(topology, cars, seed: int) -> np.ndarray:
+    simulation = Simulation(seed)
+    for road in topology.build(simulation):
+        road.set_history(0)
+    if isinstance(cars, str):
+        load_cars(cars, simulation=simulation)
+    else:
+        generate_cars(cars, seed=seed, simulation=simulation)
+    simulation.run(FRAMES)
+    return simulation.get_stats()
+
+
+@pytest.mark.parametrize("cars", [os.path.join(ROOT, "initials", "cars_init_0.4.json"), 0.3], ids=["file", "density"])
+@pytest.mark.parametrize("depth", [1, 2])
+def test_sharded_matches_single_process(topology, cars, depth):
+    sharded = ShardedSimulation(topology, regions_by_prefix(topology, depth), seed=3)
+    stats = sharded.run(FRAMES, cars)
+
+    assert sharded.n_regions > 1 and len(sharded.links) > 0
+    np.testing.assert_array_equal(stats, single(topology, cars, 3))
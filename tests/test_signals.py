@@ -0,0 +1,29 @@
+"""
+Traffic lights of maps built in the default simulation (RoadManager and CarManager)
+"""
+from road_network.road_and_cars import RoadManager, CarManager, default_simulation
+from road_network.prebuild_set import CrossroadAndLines4x4
+
+
+def delete_map():
+    """
+    Teardown of the notebook
+    """
+    RoadManager.dict_road = {}
+    RoadManager.roads = []
+    CarManager.all_cars = [None]
+
+
+def test_deleted_maps_drop_their_lights():
+    RoadManager.reset()
+    try:
+        n_lights = []
+        for _ in range(3):
+            CrossroadAndLines4x4(10, 20, 10, name="BC0")
+            default_simulation.run(5)
+            n_lights.append(len(default_simulation.signals))
+            delete_map()
+        assert n_lights[0] == n_lights[-1] > 0
+    finally:
+        RoadManager.reset()
+        CarManager.reset()
@@ -0,0 +1,26 @@
+"""
+Runs of the sweep stopped by steady.SteadyState
+"""
+import numpy as np
+import pytest
+
+from road_network.steady import SteadyState
+from road_network.sweep import city_topology, run_point
+
+
+@pytest.fixture(scope="module")
+def topology():
+    return city_topology()
+
+
+@pytest.mark.parametrize("epochs", [20, 60], ids=["before-first-test", "not-converged"])
+def test_unconverged_run_keeps_means_over_all_frames(topology, epochs):
+    steady = SteadyState(min_frames=20, check_every=20, rel_precision=0, abs_precision=0)
+    row = run_point(0.3, "case1", epochs, topology=topology, steady=steady)
+    expected = run_point(0.3, "case1", epochs, topology=topology)
+
+    assert not steady.converged
+    np.testing.assert_array_equal(row[:3], expected)
+    assert row[1] > 0
+    assert np.isinf(row[3:6]).all()
+    assert tuple(row[6:]) == (0, epochs)
@@ -0,0 +1,43 @@
+"""
+VectorizedEngine against the object model: the same stats of every road and the same routes frame by frame
+"""
+import numpy as np
+import pytest
+
+from road_network.road_and_cars import Simulation
+from road_network.prebuild_set import GridCity
+from road_network.initials import generate_cars
+from road_network.vectorized import VectorizedEngine
+
+FRAMES = 300
+
+
+def small_city(seed: int, short_routes: bool) -> Simulation:
+    with Simulation(seed) as simulation:
+        GridCity(3, 3, 6, 4, 4, torus=True)
+        generate_cars(0.5, random_walk=True, rotate_in_case=True, seed=seed)
+    if short_routes:
+        # every other car gets to the end of its route at the first crossroad
+        for car in simulation.all_cars[1::2]:
+            simulation.store.routes.set(car.id, car.route[:1])
+    return simulation
+
+
+@pytest.mark.parametrize("short_routes", [False, True], ids=["random-walk", "routes-used-up"])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_engine_matches_object_model(seed, short_routes):
+    objects = small_city(seed, short_routes)
+    simulation = small_city(seed, short_routes)
+    engine = VectorizedEngine(simulation=simulation)
+
+    ids = np.arange(1, len(objects.all_cars))
+    for frame in range(FRAMES):
+        objects.step_frame()
+        engine.step_frame(frame)
+        # a car refused at an exit keeps the point of its route it hasn't passed
+        np.testing.assert_array_equal(engine.routes.peek_many(ids), objects.store.routes.peek_many(ids),
+                                      err_msg="frame %d" % frame)
+
+    assert engine.get_total_stats()[:, 2].sum() > 0
+    for road, twin in zip(objects.roads, simulation.roads):
+        np.testing.assert_array_equal(engine.get_stats(twin), road.get_stats(), err_msg=str(road))